@@ -0,0 +1,74 @@
+"""
+Decode throughput per compression format: the stdlib file objects
+(gzip.open, bz2.open, lzma.open) against utils.open_compressed, both read
+as text in the 1 MB chunks the parsers ask for.
+
+    python benchmarks/bench_decompress.py --atoms 200000
+"""
+
+import argparse
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import time
+
+from pdbecif.utils import open_compressed
+
+from synthetic import write_entry
+
+CODECS = (
+    ("gzip", gzip.compress, gzip.open),
+    ("bz2", bz2.compress, bz2.open),
+    ("xz", lzma.compress, lzma.open),
+)
+
+
+def read_all(f, chunk_size=1 << 20):
+    n = 0
+    chunk = f.read(chunk_size)
+    while chunk:
+        n += len(chunk)
+        chunk = f.read(chunk_size)
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--atoms", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    path = write_entry(os.path.join(tmp, "entry.cif"), args.atoms)
+    with open(path, "rb") as f:
+        data = f.read()
+    size = len(data) / 1e6
+    print("%i atoms: %.1f MB" % (args.atoms, size))
+
+    for name, compress, stdlib_open in CODECS:
+        with open(path + "." + name, "wb") as f:
+            f.write(compress(data))
+        for label, opener in (
+            ("stdlib", stdlib_open),
+            ("open_compressed", open_compressed),
+        ):
+            best = None
+            for _ in range(args.repeat):
+                start = time.time()
+                with opener(path + "." + name, "rt") as f:
+                    read_all(f)
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(
+                "%-5s %-16s %.3fs  %6.1f MB/s" % (name, label, best, size / best)
+            )
+        os.unlink(path + "." + name)
+
+    os.unlink(path)
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare the two StarTokeniser engines: the GPhL StarTools regular expression
+("regex") and the hand-written scanner ("scanner").
+
+    python benchmarks/bench_engines.py --atoms 200000 --blocks 5000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from pdbecif.globalphasing.startools import StarTokeniser
+from pdbecif.mmcif_io import CifFileReader
+
+from synthetic import write_blocks, write_entry
+
+
+def best_of(repeat, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def count_tokens(path, engine, bytes_mode):
+    tokeniser = StarTokeniser(bytes_mode=bytes_mode, engine=engine)
+    tokeniser.start_matching(path)
+    return sum(1 for _ in tokeniser.tokens())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--atoms", type=int, default=100000)
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    files = [
+        ("atom_site entry", write_entry(os.path.join(tmp, "entry.cif"), args.atoms)),
+        ("multi-block", write_blocks(os.path.join(tmp, "blocks.cif"), args.blocks)),
+    ]
+
+    for label, path in files:
+        print("%s: %.1f MB" % (label, os.path.getsize(path) / 1e6))
+        for bytes_mode in (False, True):
+            for engine in StarTokeniser.ENGINES:
+                elapsed = best_of(args.repeat, count_tokens, path, engine, bytes_mode)
+                print(
+                    "  tokens    %-8s %-5s %.3fs"
+                    % (engine, "bytes" if bytes_mode else "text", elapsed)
+                )
+        for engine in StarTokeniser.ENGINES:
+            reader = CifFileReader(input="dictionary", engine=engine)
+            elapsed = best_of(args.repeat, reader.read, path)
+            print("  CifFileReader(input='dictionary') %-8s %.3fs" % (engine, elapsed))
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Compare the integer dispatch token loop of CifFileReader (input="dictionary")
+with the previous loop, which compared StarToken.type_string values for every
+token.
+
+    python benchmarks/bench_token_dispatch.py --atoms 200000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from pdbecif.globalphasing.startools import StarTokeniser
+from pdbecif.mmcif import CifFile
+from pdbecif.mmcif_io import CifFileReader
+
+from synthetic import write_entry
+
+
+def legacy_read(file_path):
+    """The token loop as it was before integer dispatch"""
+    tokeniser = StarTokeniser(bytes_mode=True)
+    tokeniser.start_matching(file_path)
+    cf = CifFile(file_path)
+    db = cc = ci = None
+    loopItems = []
+    loopValues = []
+    loop_state = False
+    loop_value_state = False
+    DATA_TOKENS = ["MULTILINE", "SQUOTE_STRING", "DQUOTE_STRING", "NULL", "UNKNOWN", "STRING"]
+
+    def process_loop():
+        items = [cc.getItem(i) for i in loopItems]
+        for i in range(len(loopValues)):
+            items[i % len(items)].setValue(loopValues[i][0], loopValues[i][1])
+
+    for tok in tokeniser:
+        if tok.type_string == "BAD_TOKEN":
+            raise ValueError(tok.value)
+        if tok.type_string == "DATA_BLOCK":
+            db = cf.setDataBlock(tok.value[tok.value.find("_") + 1 :])
+            loop_state = False
+        elif tok.type_string == "LOOP":
+            loop_value_state = False
+            loop_state = True
+            if loopValues != []:
+                process_loop()
+                loopItems = []
+                loopValues = []
+        elif tok.type_string == "DATA_NAME":
+            [category_name, item_name] = tok.value.split(".")
+            if loop_value_state:
+                loop_state = False
+                loop_value_state = False
+                if loopValues != []:
+                    process_loop()
+                    loopItems = []
+                    loopValues = []
+            cc = db.setCategory(category_name)
+            if loop_state:
+                loopItems.append(item_name)
+            ci = cc.setItem(item_name)
+        elif tok.type_string in DATA_TOKENS:
+            if loop_state:
+                loopValues.append((tok.value, tok.type_string))
+                loop_value_state = True
+            else:
+                ci.setValue(tok.value, tok.type_string)
+    if loopValues != []:
+        process_loop()
+    return cf
+
+
+def token_iteration(file_path):
+    """Time consuming the token stream alone, both ways"""
+    tokeniser = StarTokeniser(bytes_mode=True)
+    tokeniser.start_matching(file_path)
+    start = time.time()
+    n = sum(1 for tok in tokeniser if tok.type_string in ("STRING", "NULL"))
+    objects = time.time() - start
+
+    tokeniser.start_matching(file_path)
+    start = time.time()
+    n_raw = sum(1 for t, v in tokeniser.tokens() if t in (13, 16))
+    tuples = time.time() - start
+    assert n == n_raw
+    return objects, tuples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--atoms", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.cif")
+    write_entry(path, args.atoms)
+    print("%i atoms, %.1f MB" % (args.atoms, os.path.getsize(path) / 1e6))
+
+    objects, tuples = token_iteration(path)
+    print("StarToken.type_string iteration: %.3fs" % objects)
+    print("tokens() tuple iteration:        %.3fs" % tuples)
+
+    for name, read in (
+        ("legacy string loop", legacy_read),
+        ("integer dispatch", CifFileReader(input="dictionary").read),
+    ):
+        best = None
+        for _ in range(args.repeat):
+            start = time.time()
+            read(path)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print("%-20s %.3fs" % (name, best))
+
+    os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
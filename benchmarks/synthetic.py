@@ -0,0 +1,103 @@
+"""
+Synthetic mmCIF data for the benchmarks in this directory.
+
+The generated entries are shaped like wwPDB model files: a few header
+categories followed by a large _atom_site loop.
+"""
+
+import random
+
+ATOM_SITE_ITEMS = [
+    "group_PDB",
+    "id",
+    "type_symbol",
+    "label_atom_id",
+    "label_alt_id",
+    "label_comp_id",
+    "label_asym_id",
+    "label_entity_id",
+    "label_seq_id",
+    "pdbx_PDB_ins_code",
+    "Cartn_x",
+    "Cartn_y",
+    "Cartn_z",
+    "occupancy",
+    "B_iso_or_equiv",
+    "pdbx_formal_charge",
+    "auth_seq_id",
+    "auth_comp_id",
+    "auth_asym_id",
+    "auth_atom_id",
+    "pdbx_PDB_model_num",
+]
+
+_ATOMS = [("N", "N"), ("C", "CA"), ("C", "C"), ("O", "O"), ("C", "CB")]
+_RESIDUES = ["ALA", "GLY", "SER", "LEU", "LYS", "GLU", "ASP", "VAL"]
+
+
+def atom_site_rows(n_atoms, n_models=1, seed=0):
+    """Yield atom_site rows as lists of strings"""
+    rng = random.Random(seed)
+    per_model = max(n_atoms // n_models, 1)
+    for i in range(n_atoms):
+        symbol, atom = _ATOMS[i % len(_ATOMS)]
+        seq = i // len(_ATOMS) + 1
+        comp = _RESIDUES[seq % len(_RESIDUES)]
+        chain = chr(ord("A") + (seq // 300) % 26)
+        yield [
+            "ATOM",
+            str(i + 1),
+            symbol,
+            atom,
+            ".",
+            comp,
+            chain,
+            "1",
+            str(seq),
+            "?",
+            "%.3f" % rng.uniform(-100, 100),
+            "%.3f" % rng.uniform(-100, 100),
+            "%.3f" % rng.uniform(-100, 100),
+            "1.00",
+            "%.2f" % rng.uniform(5, 80),
+            "?",
+            str(seq),
+            comp,
+            chain,
+            atom,
+            str(i // per_model + 1),
+        ]
+
+
+def write_entry(path, n_atoms, n_models=1, entry_id="BENCH"):
+    """Write a single data block model file with n_atoms atom_site rows"""
+    with open(path, "w") as f:
+        f.write("data_%s\n#\n" % entry_id)
+        f.write("_entry.id %s\n#\n" % entry_id)
+        f.write("_struct.title 'Synthetic benchmark entry'\n")
+        f.write("_struct.pdbx_descriptor ?\n#\n")
+        f.write("_exptl.method 'X-RAY DIFFRACTION'\n#\n")
+        f.write("loop_\n")
+        for item in ATOM_SITE_ITEMS:
+            f.write("_atom_site.%s\n" % item)
+        for row in atom_site_rows(n_atoms, n_models):
+            f.write(" ".join(row) + "\n")
+        f.write("#\n")
+    return path
+
+
+def write_blocks(path, n_blocks, atoms_per_block=20):
+    """Write a components.cif-like file with many small data blocks"""
+    with open(path, "w") as f:
+        for b in range(n_blocks):
+            block_id = "C%05d" % b
+            f.write("data_%s\n#\n" % block_id)
+            f.write("_chem_comp.id %s\n" % block_id)
+            f.write("_chem_comp.name 'component %i'\n" % b)
+            f.write("_chem_comp.pdbx_description\n;Multi-line\ndescription\n;\n#\n")
+            f.write("loop_\n_chem_comp_atom.comp_id\n_chem_comp_atom.atom_id\n")
+            f.write("_chem_comp_atom.type_symbol\n_chem_comp_atom.charge\n")
+            for a in range(atoms_per_block):
+                f.write("%s C%i C 0\n" % (block_id, a))
+            f.write("#\n")
+    return path
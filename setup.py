@@ -72,6 +72,7 @@ setup(
     keywords="STAR CIF mmCIF PDB PDBe parsing parser API",
     extras_require={
         "tests": ["pytest", "pytest-cov", "tox"],
+        "numpy": ["numpy"],
         "docs": [
             "sphinx",
             "sphinx_rtd_theme",
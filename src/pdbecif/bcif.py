@@ -0,0 +1,744 @@
+"""
+Reading and writing BinaryCIF.
+
+BinaryCIF holds the same data blocks, categories and items as mmCIF, but as
+a MessagePack document in which each item is a column, encoded with the
+steps given in the file: ByteArray (little-endian typed arrays),
+FixedPoint, IntervalQuantization, RunLength, Delta, IntegerPacking and
+StringArray. A mask column marks values that are "." (1) or "?" (2).
+
+loads() turns a BinaryCIF document into the mmCIF-like dictionary that
+MMCIF2Dict.parse() returns, with every value as a string, and dumps() does
+the reverse. Integer columns and decimal columns whose values all have the
+same number of decimals are stored as numbers, written so that they are
+read back as the same strings; other columns are stored as strings.
+Categories with a single row are read as single values, the rest as lists.
+
+The msgpack package is used when it is installed; otherwise the small
+MessagePack codec in this module, which covers what BinaryCIF uses.
+On Python 2, where msgpack would write str as binary, this module's codec
+always does the writing, and strings are read as UTF-8 encoded str, as
+MMCIF2Dict gives them.
+"""
+
+from __future__ import division
+
+import array
+import io
+import struct
+import sys
+from itertools import chain, compress, groupby, repeat
+from functools import partial
+from operator import add, gt, lt, methodcaller, ne, not_, sub
+
+from pdbecif.mmcif_columns import PooledColumn
+from pdbecif.mmcif_tools import _ordered_dict
+from pdbecif.utils import is_cif_path, open_compressed, open_source
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    from itertools import accumulate
+except ImportError:
+    # Python 2
+    def accumulate(iterable):
+        total = None
+        for value in iterable:
+            total = value if total is None else add(total, value)
+            yield total
+
+PY3 = sys.version_info[0] == 3
+
+# Type of text strings: str, or unicode on Python 2 where str is bytes
+_text = type(u"")
+# Types of ints: int, and long on Python 2
+_INTEGERS = (int, type(1 << 64))
+
+VERSION = "0.3.0"
+ENCODER = "pdbecif"
+
+INT8 = 1
+INT16 = 2
+INT32 = 3
+UINT8 = 4
+UINT16 = 5
+UINT32 = 6
+FLOAT32 = 32
+FLOAT64 = 33
+
+# array typecodes of the BinaryCIF data types, all little-endian on disk
+_TYPECODES = {
+    INT8: "b",
+    INT16: "h",
+    INT32: "i",
+    UINT8: "B",
+    UINT16: "H",
+    UINT32: "I",
+    FLOAT32: "f",
+    FLOAT64: "d",
+}
+
+_PRESENT = 0
+_NOT_SPECIFIED = 1
+_UNKNOWN = 2
+
+# MessagePack
+
+
+def _packInto(obj, out):
+    if obj is None:
+        out.append(0xC0)
+    elif obj is True:
+        out.append(0xC3)
+    elif obj is False:
+        out.append(0xC2)
+    elif isinstance(obj, _INTEGERS):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xFF)
+        elif 0 <= obj <= 0xFFFFFFFF:
+            for fmt, code in (("B", 0xCC), ("H", 0xCD), ("I", 0xCE)):
+                if obj < 1 << (8 * struct.calcsize(fmt)):
+                    out.append(code)
+                    out += struct.pack(">" + fmt, obj)
+                    break
+        elif 0 <= obj <= 0xFFFFFFFFFFFFFFFF:
+            out.append(0xCF)
+            out += struct.pack(">Q", obj)
+        elif -(1 << 31) <= obj < 0:
+            for fmt, code in (("b", 0xD0), ("h", 0xD1), ("i", 0xD2)):
+                if obj >= -(1 << (8 * struct.calcsize(fmt) - 1)):
+                    out.append(code)
+                    out += struct.pack(">" + fmt, obj)
+                    break
+        else:
+            out.append(0xD3)
+            out += struct.pack(">q", obj)
+    elif isinstance(obj, float):
+        out.append(0xCB)
+        out += struct.pack(">d", obj)
+    elif isinstance(obj, (str, _text)):
+        # Python 2 str is taken to be UTF-8 encoded text; binary data is
+        # given as bytearray there
+        data = obj.encode("utf-8") if isinstance(obj, _text) else obj
+        n = len(data)
+        if n < 32:
+            out.append(0xA0 | n)
+        elif n < 0x100:
+            out += struct.pack(">BB", 0xD9, n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xDA, n)
+        else:
+            out += struct.pack(">BI", 0xDB, n)
+        out += data
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        n = len(obj)
+        if n < 0x100:
+            out += struct.pack(">BB", 0xC4, n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xC5, n)
+        else:
+            out += struct.pack(">BI", 0xC6, n)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xDC, n)
+        else:
+            out += struct.pack(">BI", 0xDD, n)
+        for member in obj:
+            _packInto(member, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xDE, n)
+        else:
+            out += struct.pack(">BI", 0xDF, n)
+        for key, value in obj.items():
+            _packInto(key, out)
+            _packInto(value, out)
+    else:
+        raise TypeError("Cannot pack %r" % (obj,))
+
+
+def packb(obj):
+    """obj as MessagePack bytes"""
+    if msgpack is not None and PY3:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = bytearray()
+    _packInto(obj, out)
+    return bytes(out)
+
+
+class _Unpacker(object):
+
+    """Reads one MessagePack object from bytes"""
+
+    # Formats of the fixed size values, by their leading byte
+    _FIXED = {
+        0xCA: ">f",
+        0xCB: ">d",
+        0xCC: ">B",
+        0xCD: ">H",
+        0xCE: ">I",
+        0xCF: ">Q",
+        0xD0: ">b",
+        0xD1: ">h",
+        0xD2: ">i",
+        0xD3: ">q",
+    }
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def _take(self, n):
+        start = self.pos
+        self.pos += n
+        if self.pos > len(self.data):
+            raise ValueError("MessagePack data ends unexpectedly")
+        return self.data[start : self.pos]
+
+    def _length(self, fmt):
+        return struct.unpack(fmt, self._take(struct.calcsize(fmt)))[0]
+
+    def unpack(self):
+        code = self._take(1)[0]
+        if code < 0x80:
+            return code
+        if code >= 0xE0:
+            return code - 0x100
+        if code < 0x90:
+            return self._map(code & 0x0F)
+        if code < 0xA0:
+            return self._array(code & 0x0F)
+        if code < 0xC0:
+            return self._str(code & 0x1F)
+        if code == 0xC0:
+            return None
+        if code == 0xC2:
+            return False
+        if code == 0xC3:
+            return True
+        if code in self._FIXED:
+            return self._length(self._FIXED[code])
+        if code in (0xC4, 0xC5, 0xC6):
+            n = self._length((">B", ">H", ">I")[code - 0xC4])
+            return bytes(self._take(n))
+        if code in (0xD9, 0xDA, 0xDB):
+            return self._str(self._length((">B", ">H", ">I")[code - 0xD9]))
+        if code in (0xDC, 0xDD):
+            return self._array(self._length((">H", ">I")[code - 0xDC]))
+        if code in (0xDE, 0xDF):
+            return self._map(self._length((">H", ">I")[code - 0xDE]))
+        raise ValueError("Unsupported MessagePack type 0x%02x" % code)
+
+    def _str(self, n):
+        return bytes(self._take(n)).decode("utf-8")
+
+    def _array(self, n):
+        return [self.unpack() for _ in range(n)]
+
+    def _map(self, n):
+        result = {}
+        for _ in range(n):
+            key = self.unpack()
+            result[key] = self.unpack()
+        return result
+
+
+def unpackb(data):
+    """The object encoded by the MessagePack bytes data"""
+    if msgpack is not None:
+        return msgpack.unpackb(data, raw=False)
+    # Items of a memoryview are str on Python 2
+    return _Unpacker(memoryview(data) if PY3 else bytearray(data)).unpack()
+
+
+# Decoding
+
+
+def _fromBytes(data, data_type):
+    values = array.array(_TYPECODES[data_type])
+    if PY3:
+        values.frombytes(data)
+    else:
+        values.fromstring(bytes(data))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _decodeIntegerPacking(data, encoding):
+    upper, lower = _packingLimits(encoding["byteCount"], encoding["isUnsigned"])
+    if lower == 0:
+        # Unsigned: 0 is a value, not a limit
+        lower = None
+    if upper not in data and lower not in data:
+        # Every value fitted in one slot
+        return list(data)
+    output = []
+    value = 0
+    for t in data:
+        value += t
+        if t != upper and t != lower:
+            output.append(value)
+            value = 0
+    return output
+
+
+def _decodeRunLength(data, encoding):
+    return list(chain.from_iterable(map(repeat, data[::2], data[1::2])))
+
+
+def _decodeDelta(data, encoding):
+    origin = encoding["origin"]
+    if origin:
+        return list(map(origin.__add__, accumulate(data)))
+    return list(accumulate(data))
+
+
+def _decodeStringArray(data, encoding):
+    offsets = _decode(encoding["offsets"], encoding["offsetEncoding"])
+    string_data = encoding["stringData"]
+    # Python 2 map() pads the shorter of its iterables with None
+    spans = map(slice, offsets[:-1], offsets[1:])
+    strings = list(map(string_data.__getitem__, spans))
+    # An index of -1 (no string) picks the None at the end
+    strings.append(None)
+    indices = _decode(data, encoding["dataEncoding"])
+    return list(map(strings.__getitem__, indices))
+
+
+def _decode(data, encodings):
+    """Apply the decoding of each of encodings, last first, to data"""
+    for encoding in reversed(encodings):
+        kind = encoding["kind"]
+        if kind == "ByteArray":
+            data = _fromBytes(data, encoding["type"])
+        elif kind == "FixedPoint":
+            factor = encoding["factor"]
+            data = [v / factor for v in data]
+        elif kind == "IntervalQuantization":
+            low = encoding["min"]
+            step = (encoding["max"] - low) / (encoding["numSteps"] - 1)
+            data = [low + step * v for v in data]
+        elif kind == "RunLength":
+            data = _decodeRunLength(data, encoding)
+        elif kind == "Delta":
+            data = _decodeDelta(data, encoding)
+        elif kind == "IntegerPacking":
+            data = _decodeIntegerPacking(data, encoding)
+        elif kind == "StringArray":
+            data = _decodeStringArray(data, encoding)
+        else:
+            raise ValueError("Unknown BinaryCIF encoding %r" % kind)
+    return data
+
+
+def _formatFloat32(value):
+    """The shortest text that reads back as the same single precision value"""
+    packed = struct.pack("<f", value)
+    for digits in range(1, 10):
+        text = "%.*g" % (digits, value)
+        if struct.pack("<f", float(text)) == packed:
+            return text
+    return repr(value)
+
+
+def _columnStrings(column):
+    """The values of an encoded column as strings"""
+    data = column["data"]
+    encodings = data["encoding"]
+    first = encodings[0]
+    base = encodings[-1]
+    if first["kind"] == "FixedPoint":
+        factor = first["factor"]
+        decimals = len(str(int(factor))) - 1
+        if factor == 10 ** decimals:
+            # Written with the decimals of the factor, e.g. 3 for 1000
+            ints = _decode(data["data"], encodings[1:])
+            template = "%%.%if" % decimals
+            values = [template % (v / factor) for v in ints]
+        else:
+            values = list(map(repr, _decode(data["data"], encodings)))
+    else:
+        values = _decode(data["data"], encodings)
+        if base["kind"] == "StringArray":
+            if None in values:
+                values = ["" if v is None else v for v in values]
+            if not PY3:
+                values = [v.encode("utf-8") for v in values]
+        elif base["kind"] == "ByteArray" and base["type"] == FLOAT32:
+            values = list(map(_formatFloat32, values))
+        elif base["kind"] == "ByteArray" and base["type"] == FLOAT64:
+            values = list(map(repr, values))
+        elif first["kind"] == "IntervalQuantization":
+            values = list(map(repr, values))
+        else:
+            values = list(map(str, values))
+
+    mask = column.get("mask")
+    if mask:
+        flags = _decode(mask["data"], mask["encoding"])
+        for i in compress(range(len(flags)), flags):
+            values[i] = "." if flags[i] == _NOT_SPECIFIED else "?"
+    return values
+
+
+def loads(data, preserve_token_order=False):
+    """The mmCIF-like dictionary of the BinaryCIF document in the bytes
+    data, as MMCIF2Dict.parse() would return for the same file in mmCIF"""
+    document = unpackb(data)
+    _dict = _ordered_dict if preserve_token_order else dict
+    mmcif_like_file = _dict()
+    for block in document["dataBlocks"]:
+        data_block = _dict()
+        for category in block["categories"]:
+            values = _dict()
+            single = category["rowCount"] == 1
+            for column in category["columns"]:
+                strings = _columnStrings(column)
+                values[column["name"]] = strings[0] if single else strings
+            data_block[category["name"]] = values
+        mmcif_like_file[block["header"]] = data_block
+    return mmcif_like_file
+
+
+def load(source, preserve_token_order=False):
+    """The mmCIF-like dictionary of a BinaryCIF file, given by its path or
+    as bytes or an open binary file object, compressed or not"""
+    if is_cif_path(source):
+        with open_compressed(source, "rb") as f:
+            return loads(f.read(), preserve_token_order)
+    with open_source(source, "rb") as f:
+        return loads(f.read(), preserve_token_order)
+
+
+# First bytes of a MessagePack map: BinaryCIF starts with one, text CIF never
+# does as they are not ASCII (nor the start of a UTF-8 character)
+_MAP_LEADS = frozenset(list(range(0x80, 0x90)) + [0xDE, 0xDF])
+
+
+def is_binary_cif(source):
+    """True if the file given by its path, the bytes or the binary file
+    object, compressed or not, are BinaryCIF rather than text. File objects
+    are looked at without being consumed, so those that can neither peek
+    nor seek, and text file objects, are taken to be text."""
+    if is_cif_path(source):
+        try:
+            with open_compressed(source, "rb") as f:
+                head = f.read(1)
+        except (IOError, OSError, EOFError):
+            # Left for the text readers to report
+            return False
+        return _isBinaryHead(head)
+    if not isinstance(source, (bytes, bytearray, memoryview)):
+        source = _peek(source)
+        if source is None:
+            return False
+    try:
+        with open_source(bytes(source[:_HEAD_SIZE]), "rb") as f:
+            head = f.read(1)
+    except EOFError:
+        # Too little compressed data to inflate the first byte
+        return False
+    return _isBinaryHead(head)
+
+
+# Leading bytes looked at by is_binary_cif(), enough to inflate the first
+_HEAD_SIZE = 1 << 16
+
+
+def _isBinaryHead(head):
+    return bool(head) and bytearray(head)[0] in _MAP_LEADS
+
+
+def _peek(f):
+    """The leading bytes of what is left of a binary file object, without
+    consuming them, or None if that cannot be done"""
+    if isinstance(f, io.TextIOBase):
+        return None
+    if hasattr(f, "peek"):
+        return f.peek(_HEAD_SIZE)
+    seekable = getattr(f, "seekable", None)
+    if seekable is not None and not seekable():
+        return None
+    try:
+        start = f.tell()
+        head = f.read(_HEAD_SIZE)
+        f.seek(start)
+    except (AttributeError, IOError, OSError):
+        return None
+    return head
+
+
+# Encoding
+
+
+def _byteArray(values, data_type):
+    packed = array.array(_TYPECODES[data_type], values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    data = packed.tobytes() if PY3 else bytearray(packed.tostring())
+    return data, {"kind": "ByteArray", "type": data_type}
+
+
+def _packingLimits(byte_count, unsigned):
+    bits = 8 * byte_count
+    if unsigned:
+        return (1 << bits) - 1, 0
+    return (1 << (bits - 1)) - 1, -(1 << (bits - 1))
+
+
+def _packedSize(values, byte_count, unsigned, low, high):
+    """Bytes taken by IntegerPacking of values, whose least and greatest
+    are low and high: each value takes one slot, and one more for each
+    whole limit it holds"""
+    upper, lower = _packingLimits(byte_count, unsigned)
+    slots = len(values)
+    if high >= upper:
+        slots += sum(map(upper.__rfloordiv__, filter(partial(lt, upper - 1), values)))
+    if not unsigned and low <= lower:
+        slots += sum(map(lower.__rfloordiv__, filter(partial(gt, lower + 1), values)))
+    return slots * byte_count
+
+
+def _integerPacking(values):
+    """IntegerPacking of ints into one or two byte values, or None if that
+    is not smaller than four bytes each"""
+    if not values:
+        return None
+    low = min(values)
+    high = max(values)
+    unsigned = low >= 0
+    size, byte_count = min(
+        (_packedSize(values, byte_count, unsigned, low, high), byte_count)
+        for byte_count in (1, 2)
+    )
+    if size >= 4 * len(values):
+        return None
+    upper, lower = _packingLimits(byte_count, unsigned)
+    if size == byte_count * len(values):
+        packed = values
+    else:
+        packed = []
+        for v in values:
+            if v >= upper:
+                k = v // upper
+                packed.extend([upper] * k)
+                v -= k * upper
+            elif v < 0 and v <= lower:
+                k = v // lower
+                packed.extend([lower] * k)
+                v -= k * lower
+            packed.append(v)
+    data_type = {
+        (1, True): UINT8,
+        (1, False): INT8,
+        (2, True): UINT16,
+        (2, False): INT16,
+    }[byte_count, unsigned]
+    encoding = {
+        "kind": "IntegerPacking",
+        "byteCount": byte_count,
+        "isUnsigned": unsigned,
+        "srcSize": len(values),
+    }
+    return packed, encoding, data_type
+
+
+def _delta(values):
+    origin = values[0] if values else 0
+    encoded = [0]
+    encoded.extend(map(sub, values[1:], values[:-1]))
+    return encoded[: len(values)], {"kind": "Delta", "origin": origin, "srcType": INT32}
+
+
+def _runs(values):
+    """Number of runs of equal values"""
+    if not values:
+        return 0
+    return 1 + sum(map(ne, values[1:], values[:-1]))
+
+
+def _runLength(values):
+    encoded = []
+    for value, run in groupby(values):
+        encoded.append(value)
+        encoded.append(len(list(run)))
+    return encoded, {"kind": "RunLength", "srcType": INT32, "srcSize": len(values)}
+
+
+def _finishInts(values, encodings):
+    """values packed into bytes, with encodings followed by the packing, or
+    None if they do not fit"""
+    packing = _integerPacking(values)
+    if packing is None:
+        try:
+            data, encoding = _byteArray(values, INT32)
+        except OverflowError:
+            # Differences of 32 bit ints can take 33 bits
+            return None
+        return data, encodings + [encoding]
+    packed, packing_encoding, data_type = packing
+    data, encoding = _byteArray(packed, data_type)
+    return data, encodings + [packing_encoding, encoding]
+
+
+def _encodeInts(values):
+    """The smallest encoding of a list of 32 bit ints as (bytes,
+    encodings), among Delta and RunLength followed by IntegerPacking"""
+    candidates = [_finishInts(values, [])]
+    delta, delta_encoding = _delta(values)
+    candidates.append(_finishInts(delta, [delta_encoding]))
+    for source, encodings in ((values, []), (delta, [delta_encoding])):
+        # Only worth it if there are fewer runs than half the values
+        if 2 * _runs(source) < len(values):
+            encoded, encoding = _runLength(source)
+            candidates.append(_finishInts(encoded, encodings + [encoding]))
+    candidates = [candidate for candidate in candidates if candidate is not None]
+    return min(candidates, key=lambda candidate: len(candidate[0]))
+
+
+def _encodeStrings(values):
+    unique = list(_ordered_dict.fromkeys(values))
+    strings = dict(zip(unique, range(len(unique))))
+    indices = list(map(strings.__getitem__, values))
+    offsets = [0]
+    offsets.extend(accumulate(map(len, unique)))
+    data, data_encoding = _encodeInts(indices)
+    offset_data, offset_encoding = _encodeInts(offsets)
+    encoding = {
+        "kind": "StringArray",
+        "dataEncoding": data_encoding,
+        "stringData": "".join(unique),
+        "offsetEncoding": offset_encoding,
+        "offsets": offset_data,
+    }
+    return data, [encoding]
+
+
+_INT32_RANGE = (-(1 << 31), (1 << 31) - 1)
+# Most decimals of a column stored as fixed point numbers
+_MAX_DECIMALS = 6
+# Mask flags of values that are not present; "" is a value like any other
+_MASK_FLAGS = {None: _NOT_SPECIFIED, ".": _NOT_SPECIFIED}
+_MASK_FLAGS["?"] = _UNKNOWN
+
+
+def _inInt32(ints):
+    low, high = _INT32_RANGE
+    return not ints or low <= min(ints) and max(ints) <= high
+
+
+def _asInts(values):
+    """values as ints if every one is an integer written the way str() would
+    write it, within 32 bits, else None"""
+    try:
+        ints = list(map(int, values))
+    except ValueError:
+        return None
+    # int() also takes "+1", " 1", "01" and "1_0"
+    if list(map(str, ints)) != values or not _inInt32(ints):
+        return None
+    return ints
+
+
+def _asFixedPoint(values):
+    """(ints, factor) if every value is a decimal with the same number of
+    decimals that reads back as the same text, else None"""
+    point = values[0].rfind(".") if values else -1
+    if point < 0:
+        return None
+    decimals = len(values[0]) - point - 1
+    if not 0 < decimals <= _MAX_DECIMALS:
+        return None
+    # With the point removed, each value is the number times 10 ** decimals
+    try:
+        ints = list(map(int, map(methodcaller("replace", ".", "", 1), values)))
+    except ValueError:
+        return None
+    factor = 10 ** decimals
+    template = "%%.%if" % decimals
+    if not _inInt32(ints) or [template % (i / factor) for i in ints] != values:
+        return None
+    return ints, factor
+
+
+def _asText(value):
+    if value is None or isinstance(value, _text):
+        return value
+    if isinstance(value, bytes):
+        # Python 2 str
+        return value.decode("utf-8")
+    return _text(value)
+
+
+def _encodeColumn(name, values):
+    if not set(map(type, values)) <= set([_text, type(None)]):
+        values = list(map(_asText, values))
+    mask = list(map(_MASK_FLAGS.get, values, repeat(_PRESENT, len(values))))
+    present = values
+    if any(mask):
+        present = list(compress(values, map(not_, mask)))
+
+    ints = _asInts(present) if present else None
+    fixed = None if ints is not None else _asFixedPoint(present)
+    if ints is not None:
+        data, encodings = _encodeInts(_unmasked(ints, mask, 0))
+    elif fixed is not None:
+        ints, factor = fixed
+        data, encodings = _encodeInts(_unmasked(ints, mask, 0))
+        encodings = [
+            {"kind": "FixedPoint", "factor": factor, "srcType": FLOAT64}
+        ] + encodings
+    else:
+        data, encodings = _encodeStrings(_unmasked(present, mask, ""))
+
+    column = {"name": name, "data": {"data": data, "encoding": encodings}}
+    if any(mask):
+        mask_data, mask_encodings = _encodeInts(mask)
+        column["mask"] = {"data": mask_data, "encoding": mask_encodings}
+    else:
+        column["mask"] = None
+    return column
+
+
+def _unmasked(present, mask, placeholder):
+    """The values of present spread over the rows where mask is 0, with
+    placeholder in the other rows"""
+    if len(present) == len(mask):
+        return present
+    values = iter(present)
+    return [placeholder if m else next(values) for m in mask]
+
+
+def dumps(mmcif_like_file, encoder=ENCODER):
+    """The mmCIF-like dictionary mmcif_like_file, as returned by
+    MMCIF2Dict.parse(), as BinaryCIF bytes"""
+    data_blocks = []
+    for data_heading, data_block in mmcif_like_file.items():
+        categories = []
+        for category, items in data_block.items():
+            columns = []
+            row_count = 1
+            for item, value in items.items():
+                values = (
+                    list(value) if isinstance(value, (list, PooledColumn)) else [value]
+                )
+                row_count = len(values)
+                columns.append(_encodeColumn(item, values))
+            categories.append(
+                {"name": category, "columns": columns, "rowCount": row_count}
+            )
+        data_blocks.append({"header": data_heading, "categories": categories})
+    return packb({"version": VERSION, "encoder": encoder, "dataBlocks": data_blocks})
@@ -36,50 +36,145 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED
 # OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import io
 import mmap
 import re
 import sys
 from . import star_regex
+from . import star_scanner
 from . import star_token_types
+from .star_token_types import TOKEN_BAD_TOKEN
+from pdbecif.utils import (
+    decompressed,
+    is_cif_path,
+    open_compressed,
+    sniff_compression,
+)
 
 PY3 = sys.version_info[0] == 3
 
-if PY3:
-    import io
-
 _star_pattern = re.compile(star_regex.REGEX, flags=re.UNICODE)
 
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# The same expression compiled for matching directly against the raw bytes of
+# a memory mapped file. Whitespace classes are ASCII only in this mode, which
+# is all that STAR/CIF permits as token separators.
+_star_pattern_bytes = (
+    re.compile(star_regex.REGEX.encode("ascii")) if PY3 else _star_pattern
+)
+
 
 class StarTokeniser(object):
     """
     Simple wrapper around re.RegexObject.finditer() that emits StarToken instances
+
+    In bytes mode (``bytes_mode=True``) the regular expression is run straight
+    over the memory mapped file, so the file is never copied or decoded as a
+    whole. Token values are only decoded from UTF-8 when they are requested.
+
+    Inputs that cannot be memory mapped (gzip streams, pipes, sockets,
+    in-memory buffers) are read and matched in windows of ``chunk_size``
+    characters or bytes, so memory use does not depend on the size of the
+    input.
+
+    With ``positions=True`` every token also carries the offset of its first
+    and one past its last character (bytes in bytes mode) and the 1-based
+    line number it starts on. These are taken from the matches themselves and
+    the newlines between consecutive tokens, so the data is not scanned twice.
+
+    Without positions, locate() still gives the offset and line of the
+    current token, counting lines only when it is called.
+
+    ``engine="scanner"`` replaces the regular expression with the hand-written
+    scanner in star_scanner, which produces an identical token stream.
     """
 
-    def __init__(self):
+    ENGINES = ("regex", "scanner")
+
+    def __init__(
+        self,
+        bytes_mode=False,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        positions=False,
+        engine="regex",
+    ):
+        if engine not in self.ENGINES:
+            raise ValueError("Unknown tokeniser engine: %r" % (engine,))
+        self.bytes_mode = bytes_mode
+        self.chunk_size = chunk_size
+        self.positions = positions
+        self.engine = engine
         self.__map = None
         self.__iterator = None
+        self.__cursor = None
 
     def start_matching(self, cif):
         """
         Clear any existing state of this object, and prepare to start matching
         against the contents of a file.
         The parameter cif may be a string containing the pathname to a file
-        (in which case it is opened in read only mode) or a file object
+        (in which case it is opened in read only mode) or a file object.
+        File objects that are not backed by a regular file (e.g. the result
+        of gzip.open() or a pipe) are consumed incrementally.
+        The contents of a file may also be passed directly, as bytes or as a
+        string that does not name a file (see pdbecif.utils.is_cif_path); bytes
+        are matched in place without being copied.
+        Files and bytes holding gzip, bz2 or xz compressed data (recognised by
+        their leading bytes) are decompressed as they are consumed.
         """
-        if PY3 and isinstance(cif, io.TextIOBase) or not PY3 and isinstance(cif, file):
+        window = _regex_window if self.engine == "regex" else star_scanner.scan_window
+        self.__cursor = _Cursor()
+
+        data = _in_memory(cif, self.bytes_mode)
+        if data is not None:
+            self.__map = None
+            self.__start_window(window, data)
+            return
+
+        mode = "rb" if self.bytes_mode else "r"
+        if isinstance(cif, (bytes, bytearray, memoryview)) and (
+            PY3 or sniff_compression(cif[:6]) is not None
+        ):
+            f = decompressed(io.BytesIO(cif), sniff_compression(cif[:6]), mode)
+        elif isinstance(cif, io.IOBase) or not PY3 and isinstance(cif, file):
             f = cif
         else:
-            f = open(cif, "r")
+            f = open_compressed(cif, mode)
 
-        self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if not _is_mappable(f):
+            self.__map = None
+            self.__iterator = _iter_stream_tokens(
+                f, self.chunk_size, window, self.positions, self.__cursor
+            )
+            return
 
-        if PY3:
-            self.__iterator = _star_pattern.finditer(self.__map.read().decode("utf-8"))
+        try:
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped and contain no tokens
+            self.__map = b""
+        finally:
+            if f is not cif:
+                # The map holds its own reference to the underlying file
+                f.close()
+
+        if self.bytes_mode or not PY3:
+            data = self.__map
         else:
-            self.__iterator = _star_pattern.finditer(self.__map)
+            data = self.__map[:].decode("utf-8")
+        self.__start_window(window, data)
+
+    def __start_window(self, window, data):
+        self.__cursor.move(data, 0, 1)
+        self.__iterator = window(
+            data, len(data), None, self.positions, self.__cursor.mark
+        )
+        if self.positions:
+            self.__iterator = _locate(self.__iterator, data)
 
     def __iter__(self):
-        assert self.__map is not None
+        assert self.__iterator is not None
         return self
 
     def next(self):
@@ -90,9 +185,228 @@ class StarTokeniser(object):
         Returns a StarToken instance representing the next token in the matched data.
         Raises StopIteration if there are no further tokens in the data.
         """
-        assert self.__map is not None
-        m = next(self.__iterator)
-        return StarToken(m.lastindex, m.group(m.lastindex))
+        assert self.__iterator is not None
+        return StarToken(*next(self.__iterator))
+
+    def tokens(self):
+        """
+        Iterator of (type, value) tuples for the remaining tokens in the
+        matched data. This is the cheapest way to consume the token stream as
+        no StarToken is allocated. The type is one of the TOKEN_* constants in
+        star_token_types. Values are returned exactly as matched, i.e. as
+        undecoded bytes when matching in bytes mode.
+
+        With positions enabled the tuples are (type, value, start, end, line).
+        """
+        assert self.__iterator is not None
+        return self.__iterator
+
+    def locate(self, value=None):
+        """
+        The (offset, line) of the token last returned, as positions=True
+        would give them, or (None, None) before the first token. Lines are
+        only counted up to the token, from where the previous call left off,
+        so this is cheap enough to call on errors or for a few tokens as they
+        are read. The scanner engine only keeps the start of the line of the
+        token; given the token's value, the offset is moved on to the value.
+        """
+        assert self.__cursor is not None
+        return self.__cursor.locate(value)
+
+
+def _in_memory(cif, bytes_mode):
+    """
+    The data to match if cif holds the contents of a file rather than naming
+    or being a file, or None. Bytes and str are converted to the mode of the
+    tokeniser.
+    """
+    if isinstance(cif, (bytearray, memoryview)):
+        cif = bytes(cif)
+    if isinstance(cif, bytes) and (PY3 or not is_cif_path(cif)):
+        # On Python 2, where str is bytes, strings are taken as data rather
+        # than a path as they are by the readers
+        if sniff_compression(cif[:6]) is not None:
+            return None
+        return cif if bytes_mode else cif.decode("utf-8")
+    if isinstance(cif, type(u"")) and not is_cif_path(cif):
+        return cif.encode("utf-8") if bytes_mode else cif
+    return None
+
+
+def _is_mappable(f):
+    """
+    True if f is (or wraps) a seekable regular file whose descriptor can be
+    handed to mmap. Compressed streams expose the descriptor of the underlying
+    compressed file, so they must not be mapped.
+    """
+    if not PY3:
+        return isinstance(f, file)
+    raw = getattr(f, "buffer", f)
+    raw = getattr(raw, "raw", raw)
+    if not isinstance(raw, io.FileIO):
+        return False
+    try:
+        return raw.seekable()
+    except (OSError, ValueError):
+        return False
+
+
+def _newline(data):
+    return "\n" if isinstance(data, str) else b"\n"
+
+
+def _regex_window(data, endpos, stop, positions, mark):
+    """
+    Generator of token tuples matched by the STAR regular expression in
+    data[:endpos]. Tuples are (type, value), or (type, value, start, end)
+    with positions. The match of each token is stored in mark[0] (see
+    _Cursor).
+
+    A window of a stream (stop is not None) may end inside a semi-colon text
+    field. The expression then matches the opening semi-colon as a bad token;
+    in that case its offset is stored in stop[0] and matching ends there.
+    """
+    pattern = _star_pattern if isinstance(data, str) else _star_pattern_bytes
+    for m in pattern.finditer(data, 0, endpos):
+        mark[0] = m
+        token_type = m.lastindex
+        if stop is not None and token_type == TOKEN_BAD_TOKEN:
+            start = m.start()
+            newline = _newline(data)
+            semicolon = ";" if isinstance(data, str) else b";"
+            if data[start : start + 1] == semicolon and (
+                start == 0 or data[start - 1 : start] == newline
+            ):
+                stop[0] = start
+                return
+        if positions:
+            yield token_type, m.group(token_type), m.start(), m.end()
+        else:
+            yield token_type, m.group(token_type)
+
+
+def _locate(tokens, data, offset=0, line=1, last=0):
+    """
+    Generator adding absolute offsets and line numbers to the
+    (type, value, start, end) tuples of a window over data. Only the text
+    between consecutive token starts is inspected.
+    """
+    newline = _newline(data)
+    for token_type, value, start, end in tokens:
+        line += data[last:start].count(newline)
+        last = start
+        yield token_type, value, offset + start, offset + end, line
+
+
+class _Cursor(object):
+    """
+    Where a tokeniser is in its input: the data being matched (all of it,
+    or the current window of a stream), the offset and line number of its
+    start, and in mark[0] what the window function stored for the current
+    token, which is its match, or an offset at the start of its line.
+    """
+
+    def __init__(self):
+        self.mark = [None]
+        self.move(None, 0, 1)
+
+    def move(self, data, offset, line):
+        self.data = data
+        self.offset = offset
+        self.line = line
+        self.mark[0] = None
+        # Offset in data up to which lines have been counted, and the line
+        self.counted = (0, line)
+
+    def locate(self, value=None):
+        start = self.mark[0]
+        if start is None:
+            return None, None
+        data = self.data
+        newline = _newline(data)
+        if isinstance(start, int):
+            if value is not None:
+                found = data.find(value, start)
+                eol = data.find(newline, start)
+                if found >= 0 and (eol < 0 or found <= eol):
+                    start = found
+        else:
+            start = start.start()
+        counted, line = self.counted
+        if start < counted:
+            counted, line = 0, self.line
+        line += _count(data, newline, counted, start)
+        self.counted = (start, line)
+        return self.offset + start, line
+
+
+def _count(data, sub, start, end):
+    """data.count(sub, start, end), also for a memory map, which has no count()
+    and is counted a chunk at a time"""
+    if not isinstance(data, mmap.mmap):
+        return data.count(sub, start, end)
+    n = 0
+    while start < end:
+        stop = min(start + DEFAULT_CHUNK_SIZE, end)
+        n += data[start:stop].count(sub)
+        start = stop
+    return n
+
+
+def _iter_stream_tokens(f, chunk_size, window, positions, cursor):
+    """
+    Generator of token tuples over a readable stream.
+
+    Only complete lines are passed to the window function, and a window is
+    cut short at the start of a semi-colon delimited text field whose
+    terminator has not been read yet. Every token except a multi-line text
+    field lies on a single line, so the tokens are identical to those of the
+    whole text.
+    """
+    chunk = f.read(chunk_size)
+    if PY3 and isinstance(chunk, bytes):
+        newline, text_end = b"\n", b"\n;"
+    else:
+        newline, text_end = "\n", "\n;"
+    buf = chunk[:0]
+    # Index in buf from which to look for the end of a pending text field
+    pending = -1
+    # Offset and line number of the start of buf
+    offset, line = 0, 1
+
+    while chunk:
+        buf += chunk
+        chunk = f.read(chunk_size)
+        if pending >= 0:
+            if buf.find(text_end, pending) < 0:
+                pending = len(buf) - 1
+                continue
+            pending = -1
+
+        cut = buf.rfind(newline) + 1
+        if cut == 0:
+            continue
+        stop = [cut]
+        cursor.move(buf, offset, line)
+        tokens = window(buf, cut, stop, positions, cursor.mark)
+        if positions:
+            tokens = _locate(tokens, buf, offset, line)
+        for token in tokens:
+            yield token
+        if stop[0] < cut:
+            # Text field without its closing semi-colon in this window
+            pending = max(cut - 1 - stop[0], 0)
+            cut = stop[0]
+        offset += cut
+        line += buf.count(newline, 0, cut)
+        buf = buf[cut:]
+
+    cursor.move(buf, offset, line)
+    tokens = window(buf, len(buf), None, positions, cursor.mark)
+    if positions:
+        tokens = _locate(tokens, buf, offset, line)
+    for token in tokens:
+        yield token
 
 
 class StarToken(object):
@@ -100,9 +414,15 @@ class StarToken(object):
     Class representing a token from STAR data.
     """
 
-    def __init__(self, token_type, token_value):
+    __slots__ = ("__token_type", "__token_value", "start", "end", "line")
+
+    def __init__(self, token_type, token_value, start=None, end=None, line=None):
         self.__token_type = token_type
         self.__token_value = token_value
+        # Offsets and 1-based line number, when matched with positions=True
+        self.start = start
+        self.end = end
+        self.line = line
 
     @property
     def type(self):
@@ -120,6 +440,8 @@ class StarToken(object):
         case of semi-colon delimited text). The type of quoting will be indicated by
         the token type.
         """
+        if PY3 and isinstance(self.__token_value, bytes):
+            return self.__token_value.decode("utf-8")
         return self.__token_value
 
     @property
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+"""
+A hand-written, table-driven scanner for STAR data.
+
+It produces exactly the token stream of the GPhL StarTools regular expression
+in star_regex, and is used by StarTokeniser(engine="scanner"). Rather than
+trying every alternative of the expression at each token, the data is taken
+line by line: lines without quotes or comments are split with split() and each
+word is classified by its first character, while quoted strings and semi-colon
+delimited text fields are delimited with find().
+"""
+
+import re
+import sys
+
+from .star_token_types import (
+    TOKEN_BAD_CONSTRUCT,
+    TOKEN_BAD_TOKEN,
+    TOKEN_COMMENT,
+    TOKEN_DATA_BLOCK,
+    TOKEN_DATA_NAME,
+    TOKEN_DQUOTE_STRING,
+    TOKEN_GLOBAL,
+    TOKEN_LOOP,
+    TOKEN_LOOP_STOP,
+    TOKEN_MULTILINE,
+    TOKEN_NULL,
+    TOKEN_SAVE_FRAME,
+    TOKEN_SAVE_FRAME_REF,
+    TOKEN_SQUARE_BRACKET,
+    TOKEN_SQUOTE_STRING,
+    TOKEN_STRING,
+    TOKEN_UNKNOWN,
+)
+
+PY3 = sys.version_info[0] == 3
+
+
+class _Syntax(object):
+    """
+    The delimiters and first character table for scanning either text or
+    bytes. Words are classified by the function registered for their first
+    character; words without one are plain strings.
+    """
+
+    def __init__(self, encode, fold=None):
+        self.newline = encode("\n")
+        self.cr = encode("\r")
+        self.semicolon = encode(";")
+        self.text_end = encode("\n;")
+        self.squote = encode("'")
+        self.dquote = encode('"')
+        self.hash = encode("#")
+        # Python 2 needs re.UNICODE for the whitespace the regex engine knows
+        self.word = re.compile(encode(r"\S+"), 0 if PY3 else re.UNICODE)
+
+        data, loop, save, stop, glob = [
+            encode(w) for w in ("data_", "loop_", "save_", "stop_", "global_")
+        ]
+
+        def reserved(word):
+            # STAR reserved words are case insensitive
+            head = word[:7].lower()
+            if fold is not None:
+                head = fold(head)
+            n = len(word)
+            prefix = head[:5]
+            if prefix == data:
+                return (TOKEN_DATA_BLOCK if n > 5 else TOKEN_BAD_CONSTRUCT), word
+            if prefix == loop:
+                return (TOKEN_LOOP if n == 5 else TOKEN_BAD_CONSTRUCT), word
+            if prefix == save:
+                return TOKEN_SAVE_FRAME, word
+            if prefix == stop:
+                return (TOKEN_LOOP_STOP if n == 5 else TOKEN_BAD_CONSTRUCT), word
+            if head == glob:
+                return (TOKEN_GLOBAL if n == 7 else TOKEN_BAD_CONSTRUCT), word
+            return TOKEN_STRING, word
+
+        def data_name(word):
+            return (TOKEN_DATA_NAME if len(word) > 1 else TOKEN_BAD_TOKEN), word
+
+        def save_frame_ref(word):
+            return (TOKEN_SAVE_FRAME_REF if len(word) > 1 else TOKEN_BAD_TOKEN), word
+
+        def square_bracket(word):
+            return TOKEN_SQUARE_BRACKET, word
+
+        def null(word):
+            return (TOKEN_NULL if len(word) == 1 else TOKEN_STRING), word
+
+        def unknown(word):
+            return (TOKEN_UNKNOWN if len(word) == 1 else TOKEN_STRING), word
+
+        self.first = {
+            encode("_"): data_name,
+            encode("$"): save_frame_ref,
+            encode("["): square_bracket,
+            encode("]"): square_bracket,
+            encode("."): null,
+            encode("?"): unknown,
+        }
+        for c in "dDlLsSgG":
+            self.first[encode(c)] = reserved
+        if fold is not None:
+            # The regular expression matches LATIN SMALL LETTER LONG S as 's'
+            self.first[u"ſ"] = reserved
+
+
+if PY3:
+    _TEXT = _Syntax(lambda s: s, fold=lambda s: s.replace(u"ſ", "s"))
+    _BYTES = _Syntax(lambda s: s.encode("ascii"))
+else:
+    _TEXT = _BYTES = _Syntax(lambda s: s)
+
+
+def scan_window(data, endpos, stop, positions, mark):
+    """
+    Generator of token tuples in data[:endpos], with the same interface as
+    the regular expression window of StarTokeniser: tuples are (type, value),
+    or (type, value, start, end) with positions, and when scanning a window of
+    a stream (stop is not None) a semi-colon text field that is not terminated
+    within the window ends the scan with its offset stored in stop[0].
+    The offset of the start of the line of each token is stored in mark[0].
+    """
+    syntax = _TEXT if isinstance(data, str) else _BYTES
+    newline = syntax.newline
+    semicolon = syntax.semicolon
+    squote = syntax.squote
+    dquote = syntax.dquote
+    comment = syntax.hash
+    first_get = syntax.first.get
+
+    pos = 0
+    while pos < endpos:
+        eol = data.find(newline, pos, endpos)
+        if eol < 0:
+            eol = endpos
+        line_start = True
+        mark[0] = pos
+
+        if data[pos : pos + 1] == semicolon:
+            end = data.find(syntax.text_end, pos, endpos)
+            while end >= 0 and end + 2 < endpos and not data[end + 2 : end + 3].isspace():
+                end = data.find(syntax.text_end, end + 1, endpos)
+            if end >= 0:
+                value = data[pos + 1 : end]
+                if end - 1 > pos and data[end - 1 : end] == syntax.cr:
+                    value = value[:-1]
+                if positions:
+                    yield TOKEN_MULTILINE, value, pos, end + 2
+                else:
+                    yield TOKEN_MULTILINE, value
+                # Carry on with whatever follows the closing semi-colon
+                pos = end + 2
+                mark[0] = pos
+                eol = data.find(newline, pos, endpos)
+                if eol < 0:
+                    eol = endpos
+                line_start = False
+            elif stop is not None:
+                stop[0] = pos
+                return
+
+        seg = data[pos:eol]
+        if (
+            positions
+            or comment in seg
+            or squote in seg
+            or dquote in seg
+            or (line_start and seg[:1] == semicolon)
+        ):
+            for token in _scan_segment(seg, pos, line_start, syntax, positions):
+                yield token
+        else:
+            for word in seg.split():
+                classify = first_get(word[:1])
+                if classify is None:
+                    yield TOKEN_STRING, word
+                else:
+                    yield classify(word)
+        pos = eol + 1
+
+
+def _scan_segment(seg, offset, line_start, syntax, positions):
+    """Token tuples of a single line that needs more than split()"""
+    n = len(seg)
+    search = syntax.word.search
+    first_get = syntax.first.get
+    squote = syntax.squote
+    dquote = syntax.dquote
+
+    i = 0
+    while True:
+        m = search(seg, i)
+        if m is None:
+            return
+        start, end = m.span()
+        c = seg[start : start + 1]
+
+        if c == syntax.hash:
+            # A comment runs to the end of the line, less any carriage return
+            value = seg[start:]
+            if value[-1:] == syntax.cr:
+                value = value[:-1]
+            if positions:
+                yield TOKEN_COMMENT, value, offset + start, offset + n
+            else:
+                yield TOKEN_COMMENT, value
+            return
+
+        if c == squote or c == dquote:
+            # The closing quote must be followed by whitespace or end the line
+            close = seg.find(c, start + 1)
+            while close >= 0 and close + 1 < n and not seg[close + 1 : close + 2].isspace():
+                close = seg.find(c, close + 1)
+            if close >= 0:
+                token_type = TOKEN_SQUOTE_STRING if c == squote else TOKEN_DQUOTE_STRING
+                if positions:
+                    yield token_type, seg[start + 1 : close], offset + start, offset + close + 1
+                else:
+                    yield token_type, seg[start + 1 : close]
+                i = close + 1
+                continue
+            token = (TOKEN_BAD_TOKEN, m.group())
+        elif line_start and start == 0 and c == syntax.semicolon:
+            # An unterminated text field
+            token = (TOKEN_BAD_TOKEN, m.group())
+        else:
+            word = m.group()
+            classify = first_get(c)
+            token = (TOKEN_STRING, word) if classify is None else classify(word)
+
+        if positions:
+            yield token + (offset + start, offset + end)
+        else:
+            yield token
+        i = end
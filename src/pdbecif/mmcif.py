@@ -13,6 +13,9 @@ except ImportError:
         # backport not installed: use local OrderedDict
         from pdbecif.mmcif.ordereddict import OrderedDict
 
+from pdbecif.mmcif_arrays import column_array, is_array
+from pdbecif.mmcif_columns import PooledColumn
+
 __author__ = "Glen van Ginkel (Protein Data Bank in Europe; http://pdbe.org)"
 __date__ = "$28-Jun-2018 18:23:30$"
 
@@ -49,6 +52,8 @@ class CIFWrapperTable(object):
     _preserve_order = False
 
     def __init__(self, d, preserve_token_order=False):
+        # Arrays made by as_array(), by (item, dtype, masked)
+        self.__dict__["_arrays"] = {}
         self._DATA = d
         if preserve_token_order:
             self._preserve_order = preserve_token_order
@@ -59,6 +64,7 @@ class CIFWrapperTable(object):
     def __setattr__(self, itemName, itemValue):
         if itemName == "_DATA":
             self.__dict__["_DATA"] = copy.deepcopy(itemValue)
+            self.__dict__["_arrays"] = {}
         elif itemName == "_preserve_order":
             self.__dict__["_preserve_order"] = copy.deepcopy(itemValue)
         else:
@@ -85,7 +91,8 @@ class CIFWrapperTable(object):
         return self._DATA.get(itemNameIn)
 
     def __setitem__(self, itemName, itemValue):
-        if not isinstance(itemValue, list):
+        self._dropArrays(itemName)
+        if not _isColumn(itemValue):
             itemValue = [
                 itemValue,
             ]
@@ -95,9 +102,42 @@ class CIFWrapperTable(object):
             self._DATA[itemName] = copy.deepcopy(itemValue)
 
     def __delitem__(self, itemName):
+        self._dropArrays(itemName)
         if itemName in self._DATA:
             del self._DATA[itemName]
 
+    def as_array(self, item, dtype=float, masked=None):
+        """Values of an item as a NumPy array (see
+        pdbecif.mmcif_arrays.column_array).
+
+        The array is kept by the table and returned again by later calls,
+        until the item is set or deleted through the table or the table's
+        _DATA is replaced; changes made to the values list itself are not
+        seen.
+
+        Args:
+            item (str): Name of the data item.
+            dtype (optional): NumPy dtype of the array. Defaults to float.
+            masked (bool, optional): Whether "." and "?" values are masked
+                rather than NaN. Defaults to None, which masks them only in
+                arrays that are not floating point.
+
+        Returns:
+            numpy.ndarray: The values of the item, or None if the table has
+            no such item.
+        """
+        if item not in self._DATA:
+            return None
+        key = (item, dtype, masked)
+        if key not in self._arrays:
+            self._arrays[key] = column_array(self._DATA[item], dtype, masked)
+        return self._arrays[key]
+
+    def _dropArrays(self, itemName):
+        """Forget the arrays of an item made by as_array()"""
+        for key in [key for key in self._arrays if key[0] == itemName]:
+            del self._arrays[key]
+
     def search(self, item, value):
         """Search for values of items in tables.
 
@@ -213,7 +253,7 @@ class CIFWrapper(object):
         for k in list(self._DATA.keys()):
             j = OrderedDict() if self._preserve_order else {}
             for k2, v2 in list(self._DATA[k].items()):
-                if isinstance(v2, list):
+                if _isColumn(v2):
                     j[k2] = v2
                 else:
                     j[k2] = [
@@ -284,6 +324,8 @@ class Item(object):
 
     def setValue(self, item_value, item_type="DEFAULTSTRING"):
         """"""
+        if isinstance(item_value, PooledColumn):
+            item_value = list(item_value)
         if self.value is None and self.isColumn is False:
             if isinstance(item_value, list) and len(item_value) == 1:
                 self.value = item_value[0]
@@ -749,3 +791,9 @@ def _formatVal(val):
         val = "\n;" + val[1:-1] + "\n;\n"
 
     return val
+
+
+def _isColumn(value):
+    """True if value holds the values of an item as a column rather than a
+    single value: a list, a PooledColumn or a NumPy array"""
+    return isinstance(value, (list, PooledColumn)) or is_array(value)
@@ -0,0 +1,111 @@
+"""
+Typed NumPy arrays of the values of mmCIF items.
+
+Values are read as strings; column_array() converts a column (a list, a
+PooledColumn or a single value) to a NumPy array in one vectorised pass
+rather than calling float() on each value. The CIF null values "." and
+"?" become NaN in floating point arrays, and are masked (numpy.ma) in
+arrays of other types:
+
+    x = column_array(mmcif_dict["1abc"]["_atom_site"]["Cartn_x"])
+    seq = column_array(atom_site["label_seq_id"], dtype=int)
+
+CIFWrapperTable.as_array() does the same for the items of a table and
+keeps the array, and CifFileReader.read(typed_items=...) converts chosen
+items as the file is read.
+
+NumPy is optional: without it column_array() raises ImportError.
+"""
+
+from pdbecif.mmcif_columns import PooledColumn
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Values that stand for a missing (".") or unknown ("?") value
+NULLS = (".", "?")
+
+
+def available():
+    """True if NumPy is installed, so typed arrays can be made"""
+    return numpy is not None
+
+
+def is_array(values):
+    """True if values is a NumPy array, such as the typed items read with
+    CifFileReader.read(typed_items=...)"""
+    return numpy is not None and isinstance(values, numpy.ndarray)
+
+
+def column_array(values, dtype=float, masked=None):
+    """The values of an item as a NumPy array of dtype.
+
+    Args:
+        values (list): The values of the item, as strings. A PooledColumn
+            or a single value may be given as well.
+        dtype (optional): NumPy dtype of the array. Defaults to float.
+        masked (bool, optional): Whether null values are masked, giving a
+            numpy.ma.MaskedArray. With None, they are NaN in floating
+            point arrays and masked in others (only when there are any);
+            with False, they are NaN, and ValueError is raised for other
+            dtypes. Defaults to None.
+
+    Returns:
+        numpy.ndarray: The converted values.
+    """
+    if numpy is None:
+        raise ImportError("numpy is needed for typed arrays of mmCIF values")
+    dtype = numpy.dtype(dtype)
+    if isinstance(values, numpy.ndarray):
+        # Already converted, e.g. with read(typed_items=...)
+        return values if values.dtype == dtype else values.astype(dtype)
+    if isinstance(values, PooledColumn):
+        # Convert each distinct value once
+        codes = numpy.frombuffer(values.codes, dtype="u%i" % values.codes.itemsize)
+        used, inverse = numpy.unique(codes, return_inverse=True)
+        pool = values.pool.values
+        array, missing = _convert([pool[code] for code in used], dtype)
+        array = array[inverse]
+        if missing is not None:
+            missing = missing[inverse]
+    else:
+        if isinstance(values, (str, bytes)) or not hasattr(values, "__len__"):
+            values = [values]
+        array, missing = _convert(values, dtype)
+    if missing is not None and not missing.any():
+        missing = None
+
+    floating = numpy.issubdtype(dtype, numpy.floating)
+    if masked or (masked is None and not floating and missing is not None):
+        if missing is None:
+            missing = numpy.zeros(len(array), dtype=bool)
+        return numpy.ma.masked_array(array, mask=missing)
+    if missing is not None:
+        if not floating:
+            raise ValueError(
+                "%i null values cannot be stored in an array of %s"
+                % (missing.sum(), dtype)
+            )
+        array[missing] = numpy.nan
+    return array
+
+
+def _convert(values, dtype):
+    """(array, mask of the null values or None) for a list of strings"""
+    # NumPy parses the strings as it fills the array, as float() or int()
+    # would, without a list of Python numbers in between. Null values do
+    # not parse as numbers, so columns without any need no search for them.
+    if dtype.kind in "iufc":
+        try:
+            return numpy.array(values, dtype=dtype), None
+        except ValueError:
+            pass
+    missing = None
+    if any(null in values for null in NULLS):
+        missing = numpy.fromiter(
+            (value in NULLS for value in values), dtype=bool, count=len(values)
+        )
+        values = ["0" if value in NULLS else value for value in values]
+    return numpy.array(values, dtype=dtype), missing
@@ -0,0 +1,197 @@
+"""
+An on-disk cache of parsed mmCIF files, for jobs that read the same files
+again and again.
+
+ParseCache keeps the result of MMCIF2Dict.parse() for each file in a cache
+directory, serialised with marshal, and hands it back without tokenising
+the file as long as the file's size and modification time are unchanged.
+Each category is stored separately in the cache file, so reads of a few
+categories only load those. Files are evicted, least recently used first,
+when the directory grows past its size limit.
+
+    cache = ParseCache("/scratch/cif-cache", max_bytes=2 << 30)
+    mmcif_dict = MMCIF2Dict().parse(path, cache=cache)
+    cif_file = CifFileReader(cache=cache).read(path, output="cif_file")
+
+marshal output is specific to the Python version that wrote it, so a cache
+file written by another version is treated as a miss and replaced.
+"""
+
+import hashlib
+import marshal
+import os
+import struct
+import sys
+import tempfile
+
+from pdbecif.mmcif_tools import _ordered_dict
+from pdbecif.utils import mtime_ns
+
+MAGIC = b"PDBECIF-CACHE\x01"
+SUFFIX = ".cache"
+_LENGTH = struct.Struct("<I")
+# Python 2 has no os.replace(); os.rename() replaces files on POSIX there
+_replace = getattr(os, "replace", os.rename)
+
+
+class ParseCache(object):
+
+    """
+    A directory of parsed mmCIF files, one cache file per source path.
+
+    Cache files are written to a temporary name and renamed into place, so
+    several processes can share a cache directory.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, file_path):
+        """Path of the cache file of a source file"""
+        key = os.path.abspath(file_path).encode("utf-8", "surrogateescape")
+        name = hashlib.sha1(key).hexdigest() + SUFFIX
+        return os.path.join(self.directory, name)
+
+    def get(
+        self,
+        file_path,
+        onlyCategories=None,
+        ignoreCategories=None,
+        preserve_token_order=False,
+    ):
+        """The result of MMCIF2Dict.parse() for the file with these
+        arguments, or None if the cache has no current copy of it"""
+        cache_path = self.path(file_path)
+        try:
+            stat = os.stat(file_path)
+            f = open(cache_path, "rb")
+        except (IOError, OSError):
+            return None
+        with f:
+            header = self._readHeader(f)
+            if header is None:
+                return None
+            size, mtime, blocks, offsets = header
+            if (size, mtime) != (stat.st_size, mtime_ns(stat)):
+                return None
+            start = f.tell()
+            wanted = set(
+                category
+                for category in offsets
+                if (not onlyCategories or category in onlyCategories)
+                and category not in (ignoreCategories or ())
+            )
+            columns = {}
+            for category in wanted:
+                offset, length = offsets[category]
+                f.seek(start + offset)
+                columns[category] = iter(marshal.loads(f.read(length)))
+        try:
+            # The modification time of a cache file is its last use
+            os.utime(cache_path, None)
+        except OSError:
+            pass
+
+        _dict = _ordered_dict if preserve_token_order else dict
+        mmcif_dict = _dict()
+        for data_heading, categories in blocks:
+            data_block = _dict()
+            for category in categories:
+                if category in wanted:
+                    data_block[category] = _dict(next(columns[category]))
+            if data_block:
+                mmcif_dict[data_heading] = data_block
+        return mmcif_dict
+
+    def put(self, file_path, mmcif_dict, stat=None):
+        """Store the result of parsing the whole file. stat is the os.stat()
+        of the file taken before it was parsed, so that a file changed while
+        it was being parsed is not cached as current."""
+        if stat is None:
+            stat = os.stat(file_path)
+        blocks = []
+        columns = _ordered_dict()
+        for data_heading, block in mmcif_dict.items():
+            blocks.append((data_heading, list(block)))
+            for category, values in block.items():
+                # Items as pairs, in order, since dicts of Python 2 are not
+                columns.setdefault(category, []).append(list(values.items()))
+        offsets = {}
+        payload = []
+        offset = 0
+        for category, values in columns.items():
+            try:
+                data = marshal.dumps(values)
+            except ValueError:
+                # Values marshal cannot write: leave the file uncached
+                return
+            offsets[category] = (offset, len(data))
+            payload.append(data)
+            offset += len(data)
+        header = marshal.dumps(
+            (sys.version_info[:2], stat.st_size, mtime_ns(stat), blocks, offsets)
+        )
+
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                f.write(_LENGTH.pack(len(header)))
+                f.write(header)
+                for data in payload:
+                    f.write(data)
+            _replace(temp_path, self.path(file_path))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def _readHeader(self, f):
+        """(size, mtime, blocks, offsets) from the start of a cache file, or
+        None if it is not one this Python can read"""
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        try:
+            (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+            header = marshal.loads(f.read(length))
+        except (struct.error, EOFError, ValueError, TypeError):
+            return None
+        if header[0] != sys.version_info[:2]:
+            return None
+        return header[1:]
+
+    def evict(self):
+        """Remove the least recently used cache files until the directory
+        is within max_bytes"""
+        entries = []
+        total = 0
+        for path in self._cacheFiles():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((mtime_ns(stat), stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Remove every cache file"""
+        for path in self._cacheFiles():
+            os.unlink(path)
+
+    def _cacheFiles(self):
+        """Paths of the cache files in the directory"""
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                yield os.path.join(self.directory, name)
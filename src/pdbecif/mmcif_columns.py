@@ -0,0 +1,155 @@
+"""
+Compact storage for the columns of loops with few distinct values.
+
+Each value parsed from a loop is a str of its own, so a column such as
+_atom_site.type_symbol of a large structure holds a million copies of a
+handful of strings. A StringPool keeps one copy of each distinct value and
+stores such a column as a PooledColumn: an array('I') of codes into the
+pool, 4 bytes per row. PooledColumn behaves like the list it replaces
+(indexing, slicing, iteration, len, comparison with lists, and changes
+such as append), so CIFWrapperTable and other code written for lists keeps
+working.
+
+    pool = StringPool()
+    mmcif_dict = MMCIF2Dict().parse(path, string_pool=pool)
+    cif_wrapper = CifFileReader().read(path, output="cif_wrapper", string_pool=pool)
+
+A pool may be shared by the results of several files; it only grows.
+"""
+
+from array import array
+
+try:
+    from collections.abc import MutableSequence
+except ImportError:
+    from collections import MutableSequence
+
+
+class StringPool(object):
+
+    """
+    The distinct values of the pooled columns, numbered in the order they
+    were first seen.
+
+    Columns in which at most max_distinct of the values are distinct are
+    pooled; the others are left as lists.
+    """
+
+    def __init__(self, max_distinct=0.5):
+        self.max_distinct = max_distinct
+        self.values = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        """The code of value, which is added to the pool if it is new"""
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def column(self, values):
+        """values as a PooledColumn if they have few enough distinct values,
+        else unchanged"""
+        distinct = set(values)
+        if len(distinct) > len(values) * self.max_distinct:
+            return values
+        for value in distinct:
+            self.code(value)
+        return PooledColumn(self, array("I", map(self._codes.__getitem__, values)))
+
+    def compact(self, mmcif_like_file):
+        """Pool the columns of an mmCIF-like dictionary, as returned by
+        MMCIF2Dict.parse(), in place, and return it"""
+        for data_block in mmcif_like_file.values():
+            for category in data_block.values():
+                for item, values in category.items():
+                    if isinstance(values, list):
+                        category[item] = self.column(values)
+        return mmcif_like_file
+
+
+class PooledColumn(MutableSequence):
+
+    """
+    A column of values stored as codes into a StringPool.
+    """
+
+    __slots__ = ("pool", "codes")
+
+    def __init__(self, pool, codes=None):
+        self.pool = pool
+        self.codes = array("I") if codes is None else codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PooledColumn(self.pool, self.codes[index])
+        return self.pool.values[self.codes[index]]
+
+    def __iter__(self):
+        # iter() as map() gives a list on Python 2
+        return iter(map(self.pool.values.__getitem__, self.codes))
+
+    def __contains__(self, value):
+        code = self.pool._codes.get(value)
+        return code is not None and code in self.codes
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            self.codes[index] = array("I", map(self.pool.code, value))
+        else:
+            self.codes[index] = self.pool.code(value)
+
+    def __delitem__(self, index):
+        del self.codes[index]
+
+    def insert(self, index, value):
+        self.codes.insert(index, self.pool.code(value))
+
+    def append(self, value):
+        self.codes.append(self.pool.code(value))
+
+    def count(self, value):
+        code = self.pool._codes.get(value)
+        return 0 if code is None else self.codes.count(code)
+
+    def index(self, value, *args):
+        code = self.pool._codes.get(value)
+        if code is None:
+            raise ValueError("%r is not in column" % (value,))
+        try:
+            return self.codes.index(code, *args)
+        except ValueError:
+            raise ValueError("%r is not in column" % (value,))
+
+    def __eq__(self, other):
+        if isinstance(other, PooledColumn) and other.pool is self.pool:
+            return self.codes == other.codes
+        if isinstance(other, (list, PooledColumn)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __copy__(self):
+        return PooledColumn(self.pool, array("I", self.codes))
+
+    def __deepcopy__(self, memo):
+        # The pool only grows and holds immutable values, so copies share it
+        return self.__copy__()
+
+    def __reduce__(self):
+        return (PooledColumn, (self.pool, self.codes))
+
+    def __repr__(self):
+        return repr(list(self))
@@ -0,0 +1,584 @@
+"""
+Sidecar indexes that let the readers go straight to the categories of an
+mmCIF file instead of reading it from the start.
+
+For uncompressed files the index (CategoryIndex) records, for each category
+of each data block, its byte spans in the file, whether it is a loop, its
+item names and its number of rows. The readers map the file and tokenise
+only the spans of the categories asked for.
+
+For gzip compressed files the index holds zran-style checkpoints: deflate
+block boundaries, given as offsets in the compressed and the uncompressed
+data, each with the 32 KB of uncompressed data before it. Inflation can be
+restarted at any checkpoint, so a category is read by inflating from the
+nearest checkpoint before it, at most SPAN bytes plus the category itself.
+Restarting mid-stream needs inflatePrime(), which the zlib module does not
+expose, so zlib itself is loaded with ctypes; where it cannot be, no index
+is built and the readers decompress the whole file as before.
+
+Either index is written next to the file (see index_path()) and rebuilt
+when the size or modification time of the file changes.
+"""
+
+import bisect
+import ctypes
+import ctypes.util
+import json
+import mmap
+import os
+import zlib
+
+from pdbecif.mmcif_tools import (
+    _CategorySpanScanner,
+    _categorySpans,
+    _ordered_dict,
+    _parseSpans,
+)
+from pdbecif.utils import mtime_ns
+
+WINDOW_SIZE = 32768
+CHUNK_SIZE = 1 << 16
+# Least number of uncompressed bytes between two checkpoints
+SPAN = 1 << 20
+INDEX_SUFFIX = ".pdbecif.idx"
+
+_Z_OK = 0
+_Z_STREAM_END = 1
+_Z_NEED_DICT = 2
+_Z_BUF_ERROR = -5
+_Z_NO_FLUSH = 0
+_Z_BLOCK = 5
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ("next_in", ctypes.c_void_p),
+        ("avail_in", ctypes.c_uint),
+        ("total_in", ctypes.c_ulong),
+        ("next_out", ctypes.c_void_p),
+        ("avail_out", ctypes.c_uint),
+        ("total_out", ctypes.c_ulong),
+        ("msg", ctypes.c_char_p),
+        ("state", ctypes.c_void_p),
+        ("zalloc", ctypes.c_void_p),
+        ("zfree", ctypes.c_void_p),
+        ("opaque", ctypes.c_void_p),
+        ("data_type", ctypes.c_int),
+        ("adler", ctypes.c_ulong),
+        ("reserved", ctypes.c_ulong),
+    ]
+
+
+def _loadZlib():
+    """The zlib shared library, or None if it cannot be loaded"""
+    for name in ("z", "zlib1", "zlib"):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            lib = ctypes.CDLL(path)
+        except OSError:
+            continue
+        stream = ctypes.POINTER(_ZStream)
+        lib.zlibVersion.restype = ctypes.c_char_p
+        lib.inflateInit2_.argtypes = [
+            stream,
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_int,
+        ]
+        lib.inflate.argtypes = [stream, ctypes.c_int]
+        lib.inflatePrime.argtypes = [stream, ctypes.c_int, ctypes.c_int]
+        lib.inflateSetDictionary.argtypes = [stream, ctypes.c_char_p, ctypes.c_uint]
+        lib.inflateEnd.argtypes = [stream]
+        return lib
+    return None
+
+
+_libz = _loadZlib()
+
+
+def available():
+    """True if gzip indexes can be built and used"""
+    return _libz is not None
+
+
+class _Inflater(object):
+
+    """A zlib inflate stream, with its input and output buffers"""
+
+    def __init__(self, wbits):
+        self.strm = _ZStream()
+        ret = _libz.inflateInit2_(
+            ctypes.byref(self.strm),
+            wbits,
+            _libz.zlibVersion(),
+            ctypes.sizeof(_ZStream),
+        )
+        if ret != _Z_OK:
+            raise zlib.error("inflateInit2 failed (%i)" % ret)
+        self._input = ctypes.create_string_buffer(CHUNK_SIZE)
+
+    def feed(self, data):
+        """Make data the next input; it must be at most CHUNK_SIZE bytes"""
+        ctypes.memmove(self._input, data, len(data))
+        self.strm.next_in = ctypes.addressof(self._input)
+        self.strm.avail_in = len(data)
+
+    def inflate(self, flush):
+        ret = _libz.inflate(ctypes.byref(self.strm), flush)
+        if ret == _Z_NEED_DICT or ret < 0 and ret != _Z_BUF_ERROR:
+            raise zlib.error("Invalid compressed data (%i)" % ret)
+        return ret
+
+    def __del__(self):
+        if _libz is not None:
+            _libz.inflateEnd(ctypes.byref(self.strm))
+
+
+def _buildCheckpoints(f, span, consume):
+    """Inflate a gzip file, passing each piece of the uncompressed data to
+    consume() as it is inflated rather than keeping it. Returns the length
+    of the uncompressed data and a list of (out, in, bits, window)
+    checkpoints, or None for files of more than one gzip member, which are
+    not supported."""
+    inflater = _Inflater(16 + zlib.MAX_WBITS)
+    strm = inflater.strm
+    window = ctypes.create_string_buffer(WINDOW_SIZE)
+    address = ctypes.addressof(window)
+    points = []
+    total_in = total_out = last = 0
+    ret = _Z_OK
+    while ret != _Z_STREAM_END:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            raise EOFError(
+                "Compressed file ended before the end-of-stream marker was reached"
+            )
+        inflater.feed(chunk)
+        while strm.avail_in:
+            if strm.avail_out == 0:
+                # The output cycles through the window buffer
+                strm.next_out = address
+                strm.avail_out = WINDOW_SIZE
+            start = WINDOW_SIZE - strm.avail_out
+            total_in += strm.avail_in
+            total_out += strm.avail_out
+            ret = inflater.inflate(_Z_BLOCK)
+            total_in -= strm.avail_in
+            total_out -= strm.avail_out
+            end = WINDOW_SIZE - strm.avail_out
+            if end > start:
+                consume(ctypes.string_at(address + start, end - start))
+            if ret == _Z_STREAM_END:
+                break
+            # Bit 7: at a block boundary; bit 6: after the last block
+            at_boundary = strm.data_type & 128 and not strm.data_type & 64
+            if at_boundary and (total_out == 0 or total_out - last > span):
+                left = strm.avail_out
+                points.append(
+                    (
+                        total_out,
+                        total_in,
+                        strm.data_type & 7,
+                        ctypes.string_at(address + end, left)
+                        + ctypes.string_at(address, end),
+                    )
+                )
+                last = total_out
+    rest = ctypes.string_at(strm.next_in, strm.avail_in) + f.read()
+    if rest.strip(b"\x00"):
+        return None
+    return total_out, points
+
+
+def _inflateRange(f, point, start, end):
+    """Bytes start to end of the uncompressed data, inflated from a
+    checkpoint at or before start"""
+    out, pos, bits, window = point
+    inflater = _Inflater(-zlib.MAX_WBITS)
+    strm = inflater.strm
+    f.seek(pos - (1 if bits else 0))
+    if bits:
+        byte = bytearray(f.read(1))[0]
+        _libz.inflatePrime(ctypes.byref(strm), bits, byte >> (8 - bits))
+    _libz.inflateSetDictionary(ctypes.byref(strm), window, len(window))
+
+    output = ctypes.create_string_buffer(4 * CHUNK_SIZE)
+    address = ctypes.addressof(output)
+    pieces = []
+    needed = end - out
+    produced = 0
+    while produced < needed:
+        if strm.avail_in == 0:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            inflater.feed(chunk)
+        strm.next_out = address
+        strm.avail_out = len(output)
+        ret = inflater.inflate(_Z_NO_FLUSH)
+        n = len(output) - strm.avail_out
+        pieces.append(ctypes.string_at(address, n))
+        produced += n
+        if ret == _Z_STREAM_END:
+            break
+    return b"".join(pieces)[start - out : needed]
+
+
+def index_path(file_path):
+    """Path of the sidecar index of a file"""
+    return file_path + INDEX_SUFFIX
+
+
+class _FileIndex(object):
+
+    """Base of the sidecar indexes: the size and modification time of the
+    indexed file, and reading and writing the sidecar"""
+
+    VERSION = 1
+    KIND = None
+
+    def __init__(self, size, mtime):
+        self.size = size
+        self.mtime = mtime
+
+    def is_current(self, file_path):
+        """True if the file has not changed since it was indexed"""
+        stat = os.stat(file_path)
+        return self.size == stat.st_size and self.mtime == mtime_ns(stat)
+
+    def _header(self):
+        return {
+            "version": self.VERSION,
+            "kind": self.KIND,
+            "size": self.size,
+            "mtime": self.mtime,
+        }
+
+    @classmethod
+    def _readHeader(cls, f):
+        """The JSON header line of a sidecar, or None if it is not one of
+        this kind and version"""
+        try:
+            header = json.loads(f.readline().decode("utf-8"))
+        except ValueError:
+            return None
+        if (
+            not isinstance(header, dict)
+            or header.get("version") != cls.VERSION
+            or header.get("kind") != cls.KIND
+        ):
+            return None
+        return header
+
+
+class GzipIndex(_FileIndex):
+
+    """
+    Checkpoints of a gzip compressed mmCIF file, with the spans of the
+    categories of its data blocks in the uncompressed data (as found by
+    MMCIF2Dict.parse_lazy()).
+    """
+
+    KIND = "gzip"
+
+    def __init__(self, size, mtime, length, points, blocks):
+        super(GzipIndex, self).__init__(size, mtime)
+        # Length of the uncompressed data
+        self.length = length
+        # (out, in, bits, window) tuples, in order of out
+        self.points = points
+        self._outs = [point[0] for point in points]
+        # (data_heading, ordered dict of category names to spans) pairs
+        self.blocks = blocks
+
+    @classmethod
+    def build(cls, file_path, span=SPAN):
+        """Index a gzip file, or return None if it cannot be indexed"""
+        if _libz is None:
+            return None
+        stat = os.stat(file_path)
+        # The category spans are found as the file is inflated
+        scanner = _CategorySpanScanner()
+        with open(file_path, "rb") as f:
+            built = _buildCheckpoints(f, span, scanner.feed)
+        if built is None:
+            return None
+        length, points = built
+        blocks = scanner.finish()
+        return cls(stat.st_size, mtime_ns(stat), length, points, blocks)
+
+    def read(self, f, start, end):
+        """Bytes start to end of the uncompressed data of the open file f"""
+        end = min(end, self.length)
+        if start >= end:
+            return b""
+        point = self.points[bisect.bisect_right(self._outs, start) - 1]
+        return _inflateRange(f, point, start, end)
+
+    def save(self, path):
+        """Write the index to path: a line of JSON followed by the windows of
+        the checkpoints, each compressed with zlib"""
+        windows = [zlib.compress(point[3]) for point in self.points]
+        header = self._header()
+        header["length"] = self.length
+        header["points"] = [
+            list(point[:3]) + [len(window)]
+            for point, window in zip(self.points, windows)
+        ]
+        header["blocks"] = [
+            [heading, [[category, spans] for category, spans in categories.items()]]
+            for heading, categories in self.blocks
+        ]
+        with open(path, "wb") as f:
+            f.write(json.dumps(header, separators=(",", ":")).encode("utf-8"))
+            f.write(b"\n")
+            for window in windows:
+                f.write(window)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save(), or return None if it is not one
+        this version can use"""
+        with open(path, "rb") as f:
+            header = cls._readHeader(f)
+            if header is None:
+                return None
+            points = []
+            for out, pos, bits, length in header["points"]:
+                points.append((out, pos, bits, zlib.decompress(f.read(length))))
+        blocks = [
+            (
+                heading,
+                _ordered_dict(
+                    (category, [tuple(span) for span in spans])
+                    for category, spans in categories
+                ),
+            )
+            for heading, categories in header["blocks"]
+        ]
+        return cls(header["size"], header["mtime"], header["length"], points, blocks)
+
+
+class IndexedCategory(object):
+
+    """Where one category of a data block lies in an uncompressed file, and
+    its shape"""
+
+    def __init__(self, spans, loop, items, rows):
+        # (start, end) byte spans, more than one if the category is split
+        self.spans = spans
+        self.loop = loop
+        self.items = items
+        self.rows = rows
+
+    @property
+    def offset(self):
+        return self.spans[0][0]
+
+    @property
+    def length(self):
+        return sum(end - start for start, end in self.spans)
+
+    def __repr__(self):
+        return "IndexedCategory(offset=%i, length=%i, loop=%r, rows=%i)" % (
+            self.offset,
+            self.length,
+            self.loop,
+            self.rows,
+        )
+
+
+class CategoryIndex(_FileIndex):
+
+    """
+    The categories of each data block of an uncompressed mmCIF file, as
+    IndexedCategory objects.
+
+    Building the index parses every category once; afterwards a category is
+    read by tokenising only its own spans of the memory mapped file.
+    """
+
+    KIND = "categories"
+
+    def __init__(self, size, mtime, blocks):
+        super(CategoryIndex, self).__init__(size, mtime)
+        # (data_heading, ordered dict of category names to IndexedCategory)
+        # pairs, in file order
+        self.blocks = blocks
+        self._headings = None
+
+    @classmethod
+    def build(cls, file_path):
+        """Index an uncompressed mmCIF file"""
+        stat = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                data = b""
+        try:
+            blocks = []
+            for heading, spans in _categorySpans(data):
+                categories = _ordered_dict()
+                for category, category_spans in spans.items():
+                    values = _parseSpans(data, category_spans, category, True)
+                    rows = 0
+                    loop = any(isinstance(v, list) for v in values.values())
+                    if values:
+                        first = next(iter(values.values()))
+                        rows = len(first) if loop else 1
+                    categories[category] = IndexedCategory(
+                        category_spans, loop, list(values), rows
+                    )
+                blocks.append((heading, categories))
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+        return cls(stat.st_size, mtime_ns(stat), blocks)
+
+    def spans(self):
+        """(data_heading, ordered dict of category names to spans) pairs, as
+        returned by _categorySpans()"""
+        return [
+            (
+                heading,
+                _ordered_dict(
+                    (category, entry.spans) for category, entry in categories.items()
+                ),
+            )
+            for heading, categories in self.blocks
+        ]
+
+    def category(self, data_heading, category):
+        """The IndexedCategory of a category, or None if the data block has
+        no such category"""
+        if self._headings is None:
+            # Like parse(), the last data block of a heading wins
+            self._headings = dict(
+                (heading, categories)
+                for heading, categories in self.blocks
+                if categories
+            )
+        categories = self._headings.get(data_heading)
+        if categories is None:
+            return None
+        return categories.get(category)
+
+    def save(self, path):
+        """Write the index to path as a single line of JSON. Each distinct
+        list of item names is written once and referred to by its position,
+        as most categories recur with the same items in every data block."""
+        item_lists = []
+        positions = {}
+        blocks = []
+        for heading, categories in self.blocks:
+            entries = []
+            for category, entry in categories.items():
+                key = tuple(entry.items)
+                if key not in positions:
+                    positions[key] = len(item_lists)
+                    item_lists.append(entry.items)
+                entries.append(
+                    [category, entry.spans, entry.loop, positions[key], entry.rows]
+                )
+            blocks.append([heading, entries])
+        header = self._header()
+        header["items"] = item_lists
+        header["blocks"] = blocks
+        with open(path, "wb") as f:
+            f.write(json.dumps(header, separators=(",", ":")).encode("utf-8"))
+            f.write(b"\n")
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save(), or return None if it is not one
+        this version can use"""
+        with open(path, "rb") as f:
+            header = cls._readHeader(f)
+        if header is None:
+            return None
+        item_lists = header["items"]
+        blocks = []
+        for heading, entries in header["blocks"]:
+            categories = _ordered_dict()
+            for category, spans, loop, items, rows in entries:
+                categories[category] = IndexedCategory(
+                    [tuple(span) for span in spans], loop, item_lists[items], rows
+                )
+            blocks.append((heading, categories))
+        return cls(header["size"], header["mtime"], blocks)
+
+    def read(self, data, data_heading, category, preserve_token_order=False):
+        """Parse a category of a data block from data, the contents of the
+        indexed file (e.g. the file mapped with mmap), as MMCIF2Dict.parse()
+        would. Raises KeyError if the data block has no such category.
+
+        Keeping the index and the mapped file open between lookups makes
+        each read cost only the size of the category."""
+        entry = self.category(data_heading, category)
+        if entry is None:
+            raise KeyError("%s has no category %s" % (data_heading, category))
+        return _parseSpans(data, entry.spans, category, preserve_token_order)
+
+
+def _sidecarIndex(cls, file_path, persist, *build_args):
+    """The index of type cls of a file: read from its sidecar if that is
+    current, else built and, if persist, written as the sidecar (where the
+    directory allows)"""
+    sidecar = index_path(file_path)
+    if os.path.exists(sidecar):
+        try:
+            index = cls.load(sidecar)
+        except (OSError, KeyError, TypeError, ValueError, zlib.error):
+            index = None
+        if index is not None and index.is_current(file_path):
+            return index
+    index = cls.build(file_path, *build_args)
+    if index is not None and persist:
+        try:
+            index.save(sidecar)
+        except OSError:
+            pass
+    return index
+
+
+def gzip_index(file_path, span=SPAN, persist=True):
+    """The GzipIndex of a gzip file, from its sidecar if that is current.
+    Returns None if the file cannot be indexed."""
+    if _libz is None:
+        return None
+    return _sidecarIndex(GzipIndex, file_path, persist, span)
+
+
+def category_index(file_path, persist=True):
+    """The CategoryIndex of an uncompressed mmCIF file, from its sidecar if
+    that is current"""
+    return _sidecarIndex(CategoryIndex, file_path, persist)
+
+
+class IndexedGzipReader(object):
+
+    """
+    The uncompressed data of a gzip file as a sequence of bytes that can be
+    sliced, each slice being inflated from the nearest checkpoint of the
+    GzipIndex of the file.
+    """
+
+    def __init__(self, file_path, index):
+        self._f = open(file_path, "rb")
+        self.index = index
+
+    def __len__(self):
+        return self.index.length
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("IndexedGzipReader only supports slices")
+        start, end, _ = key.indices(self.index.length)
+        return self.index.read(self._f, start, end)
+
+    def close(self):
+        self._f.close()
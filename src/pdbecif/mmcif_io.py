@@ -2,15 +2,60 @@ __author__ = "Glen van Ginkel (Protein Data Bank in Europe; http://pdbe.org)"
 __date__ = "$30-Jun-2012 18:23:30$"
 
 import gzip
+import io
 import os.path
+import re
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
 
-from pdbecif.globalphasing.startools import StarTokeniser
+from pdbecif.globalphasing.startools import StarTokeniser, StarToken
+from pdbecif.globalphasing.startools.star_token_types import (
+    TOKEN_BAD_TOKEN,
+    TOKEN_DATA_BLOCK,
+    TOKEN_DATA_NAME,
+    TOKEN_DQUOTE_STRING,
+    TOKEN_LOOP,
+    TOKEN_MULTILINE,
+    TOKEN_NULL,
+    TOKEN_SAVE_FRAME,
+    TOKEN_SQUOTE_STRING,
+    TOKEN_STRING,
+    TOKEN_UNKNOWN,
+    _token_type_as_string,
+)
+from pdbecif.bcif import dumps as dumps_bcif
+from pdbecif.bcif import is_binary_cif
+from pdbecif.bcif import load as load_bcif
 from pdbecif.mmcif import CifFile, CIFWrapper
-from pdbecif.mmcif_tools import MMCIF2Dict
-from pdbecif.utils import openGzip, pretty_print
+from pdbecif.mmcif_arrays import column_array
+from pdbecif.mmcif_columns import PooledColumn, StringPool
+from pdbecif.mmcif_tools import (
+    MMCIF2Dict,
+    _filterParsed,
+    _iterRowBatches,
+    _selectCategories,
+)
+from pdbecif.utils import (
+    ProcessPoolExecutor,
+    block_ranges,
+    compression,
+    cpu_count,
+    is_cif_path,
+    mtime_ns,
+    open_source,
+    sniff_compression,
+    openGzip,
+    pretty_print,
+)
 
 # constants
 
+# Ending of the names of BinaryCIF files, which read() takes to be BinaryCIF
+_bcif_name = re.compile(r"\.bcif(?:\.(?:gz|bz2|xz))?$")
+
 # exception classes
 
 
@@ -18,13 +63,15 @@ class LoopValueMultiplesError(Exception):
 
     """"""
 
-    def __init__(self, lineno):
-        self.lineno = int(lineno)
+    def __init__(self, lineno=None, offset=None):
+        self.lineno = int(lineno) if lineno is not None else None
+        # Offset of the loop_ in the file, when known
+        self.offset = offset
         self.msg = "Number of values is not a multiple of items \
                 (loop_ start: line %s)"
 
     def __str__(self):
-        return repr(self.msg % str(self.lineno))
+        return repr(self.msg % (str(self.lineno) if self.lineno else "?"))
 
 
 class BadStarTokenError(Exception):
@@ -35,7 +82,10 @@ class BadStarTokenError(Exception):
         self.token = token
 
     def __str__(self):
-        return "Tokenizer detected bad token: [" + repr(self.token.value) + "]"
+        msg = "Tokenizer detected bad token: [" + repr(self.token.value) + "]"
+        if getattr(self.token, "line", None) is not None:
+            msg += " (line %i)" % self.token.line
+        return msg
 
 
 # classes
@@ -46,6 +96,10 @@ class CifFileWriter(object):
     """
     CifFileWriter writes mmCIF formatted files and accepts mmCIF-like dictionary
     files, CIFWrapper objects, and CifFile objects.
+
+    With binary=True, or by default for paths ending in .bcif or .bcif.gz,
+    the file is written as BinaryCIF (see pdbecif.bcif) and save frames are
+    left out.
     """
 
     DATABLOCK = "data_%s\n#\n"
@@ -60,7 +114,14 @@ class CifFileWriter(object):
 
     _handle = None
 
-    def __init__(self, file_path=None, compress=False, mode="wt", preserve_order=False):
+    def __init__(
+        self,
+        file_path=None,
+        compress=False,
+        mode="wt",
+        preserve_order=False,
+        binary=None,
+    ):
         #        """"""
         #        #orig
         #        self._handle = openGzip(
@@ -69,6 +130,15 @@ class CifFileWriter(object):
         # new
         self.compress = compress
         self.preserve_token_order = preserve_order
+        # Write BinaryCIF instead of text; by default when file_path ends in
+        # .bcif (or .bcif.gz)
+        if binary is None:
+            binary = isinstance(file_path, str) and file_path.endswith(
+                (".bcif", ".bcif.gz")
+            )
+        self.binary = binary
+        if binary:
+            mode = _binaryMode(mode)
 
         if (file_path and isinstance(file_path, str)) or file_path is None:
             file_path = (
@@ -171,6 +241,8 @@ class CifFileWriter(object):
 
     def _writeCifObj(self, cifObjIn, compress=False, mode="wt"):
         """"""
+        if self.binary:
+            mode = _binaryMode(mode)
         if self._handle is None:
             try:
                 if compress:
@@ -182,6 +254,11 @@ class CifFileWriter(object):
                 print("Could not write mmCIF file (No output path/filename specified)")
                 return
 
+        if self.binary:
+            self._handle.write(dumps_bcif(_cifFileDict(cifObjIn)))
+            self._handle.flush()
+            return
+
         for datablock in cifObjIn.getDataBlocks():
             self._handle.write(self.DATABLOCK % datablock.getId())
             for category in datablock.getCategories():
@@ -233,6 +310,88 @@ class CifFileWriter(object):
         # self._handle = None
 
 
+class EntryCache(object):
+
+    """
+    A thread-safe, in-process cache of the results of CifFileReader.read()
+    for files given by their path, evicting the least recently used results
+    once their estimated size passes max_bytes.
+
+    A cached result is only returned while the size and modification time
+    of its file are unchanged. Results are shared between callers, so they
+    should be treated as read-only.
+
+    hits, misses and evictions count lookups since the cache was created
+    (or reset_stats() was last called); stats() returns them with the
+    number of entries and their estimated total size.
+    """
+
+    def __init__(self, max_bytes=256 << 20):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def get(self, key, stat):
+        """The result stored under key if it was read from the file in the
+        state given by stat (from os.stat()), or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == (stat.st_size, mtime_ns(stat)):
+                # Most recently used last (OrderedDict.move_to_end() is
+                # missing on Python 2)
+                self._entries[key] = self._entries.pop(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry is not None:
+                # The file has changed since it was read
+                del self._entries[key]
+                self.current_bytes -= entry[2]
+            return None
+
+    def put(self, key, stat, result):
+        """Store result, read from the file in the state given by stat, under
+        key. Results larger than max_bytes are not stored."""
+        size = _estimateSize(result)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = ((stat.st_size, mtime_ns(stat)), result, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
 class CifFileReader(object):
 
     """
@@ -240,12 +399,29 @@ class CifFileReader(object):
     CIF and once read will return mmCIF file representation
     """
 
-    def __init__(self, input="data", verbose=False, preserve_order=False):
+    def __init__(
+        self,
+        input="data",
+        verbose=False,
+        preserve_order=False,
+        engine="regex",
+        threaded=False,
+        cache=None,
+        entry_cache=None,
+    ):
         """"""
         self.input = input
         self.file_path = None
         self.verbose = verbose  # TODO: Not implemented
         self.preserve_token_order = preserve_order
+        # StarTokeniser engine used when input is not "data"
+        self.engine = engine
+        # Decompress compressed input in a background thread
+        self.threaded = threaded
+        # ParseCache that read() keeps parsed input="data" files in
+        self.cache = cache
+        # EntryCache that read() keeps its results for files in memory in
+        self.entry_cache = entry_cache
 
     def read(
         self,
@@ -254,11 +430,30 @@ class CifFileReader(object):
         ignore=[],
         preserve_order=False,
         only=None,
+        processes=1,
+        stop_early=False,
+        only_items=None,
+        row_filter=None,
+        use_index=False,
+        string_pool=None,
+        typed_items=None,
     ):
         """Read in mmCIF file
 
+        When the reader has an entry_cache (an EntryCache), the results for
+        files given by their path are kept in it and shared between calls
+        with the same arguments; reads with only_items, row_filter,
+        typed_items or a string_pool are not cached.
+
+        Files whose names end in .bcif (or .bcif.gz, .bcif.bz2, .bcif.xz),
+        any file with input="bcif", and bytes and binary file objects whose
+        content is BinaryCIF are read with pdbecif.bcif; processes,
+        stop_early and use_index do not apply to them.
+
         Args:
-            file_path (str): Path to the mmCIF file
+            file_path (str): Path to the mmCIF file, or the file itself as
+                bytes, str (that is not the name of a file) or an open
+                file object such as the result of gzip.open().
             output (str, optional): Data type of an object the cif file
                 should be written to. should be one of: `cif_dictionary`
                 (plain python dictionary); `cif_wrapper` (CIFWrapper);
@@ -269,6 +464,38 @@ class CifFileReader(object):
                 categories should be kept. Defaults to False.
             only (list, optional): List of category names to be retrieved.
                 Others are discarded. Defaults to None.
+            processes (int, optional): Number of worker processes used to
+                parse the data blocks of an uncompressed file in parallel,
+                or None for one per CPU. Defaults to 1.
+            stop_early (bool, optional): Stop reading the file once every
+                category in `only` has been read, for single data block
+                files read with input="data". Defaults to False.
+            only_items (dict, optional): Category names mapped to the list
+                of items to read for them; the other items of those
+                categories are discarded while parsing. Only applies to
+                input="data". Defaults to None.
+            row_filter (dict, optional): Category names mapped to a
+                condition on their rows, applied while loops are read so
+                that rejected rows are never stored. See MMCIF2Dict.parse
+                for the conditions. Only applies to input="data". Defaults
+                to None.
+            use_index (bool, optional): Read `only` through the sidecar
+                index of the file, tokenising (and for gzip, inflating) only
+                the data around those categories. See MMCIF2Dict.parse. Only
+                applies to input="data". Defaults to False.
+            string_pool (StringPool, optional): Store loop columns with few
+                distinct values as codes into this pool (or a new one for
+                True), which reads like lists in less memory. See
+                pdbecif.mmcif_columns. Only applies to input="data" and to
+                BinaryCIF. Defaults to None.
+            typed_items (dict, optional): Category names mapped to
+                dictionaries of item names to NumPy dtypes, e.g.
+                {"_atom_site": {"Cartn_x": float, "label_seq_id": int}}.
+                The values of these items are converted to arrays as the
+                file is read (see pdbecif.mmcif_arrays): in place of the
+                lists of strings for `cif_dictionary`, and as the arrays
+                returned by CIFWrapperTable.as_array() for `cif_wrapper`.
+                Not used for `cif_file`. Needs NumPy. Defaults to None.
 
         Returns:
             object: In memory representation of the mmCIF file based on
@@ -278,151 +505,861 @@ class CifFileReader(object):
         token_ordering = (
             self.preserve_token_order or preserve_order
         )  # preserve ordering of either flag is True
+        args = (
+            file_path,
+            output,
+            ignore,
+            token_ordering,
+            only,
+            processes,
+            stop_early,
+            only_items,
+            row_filter,
+            use_index,
+            string_pool,
+            typed_items,
+        )
+        if (
+            self.entry_cache is None
+            or only_items
+            or row_filter
+            or typed_items
+            or string_pool is not None
+            or not is_cif_path(file_path)
+            or not os.path.isfile(file_path)
+        ):
+            return self._read(*args)
+        stat = os.stat(file_path)
+        key = (
+            os.path.abspath(file_path),
+            self.input,
+            output,
+            token_ordering,
+            tuple(only or ()),
+            tuple(ignore or ()),
+            stop_early,
+        )
+        result = self.entry_cache.get(key, stat)
+        if result is None:
+            result = self._read(*args)
+            if result is not None:
+                self.entry_cache.put(key, stat, result)
+        return result
+
+    def _read(self, file_path, *args):
+        """read() of file_path, as BinaryCIF or CIF text, with the rest of
+        the arguments of _readText()"""
+        if self.input == "bcif" or _isBinaryCifName(file_path):
+            return self._readBinaryCif(file_path, file_path, *args)
+        if isinstance(file_path, (bytes, bytearray, memoryview)):
+            if is_binary_cif(file_path):
+                return self._readBinaryCif(file_path, file_path, *args)
+        elif hasattr(file_path, "read") and not isinstance(file_path, io.TextIOBase):
+            # Looked at after any decompression, in the stream that the text
+            # readers are then given
+            with open_source(file_path, "rb", self.threaded) as f:
+                if is_binary_cif(f):
+                    return self._readBinaryCif(f, file_path, *args)
+                return self._readText(f, file_path, *args)
+        return self._readText(file_path, file_path, *args)
+
+    def _readBinaryCif(
+        self,
+        source,
+        file_path,
+        output,
+        ignore,
+        token_ordering,
+        only,
+        processes,
+        stop_early,
+        only_items,
+        row_filter,
+        use_index,
+        string_pool,
+        typed_items,
+    ):
+        """read() of BinaryCIF from source, which was given as file_path"""
+        mmcif_dict = _loadBinaryCif(
+            source, ignore, token_ordering, only, only_items, row_filter, string_pool
+        )
+        return self._fromDict(
+            mmcif_dict, output, file_path, token_ordering, typed_items
+        )
+
+    def _readText(
+        self,
+        source,
+        file_path,
+        output,
+        ignore,
+        token_ordering,
+        only,
+        processes,
+        stop_early,
+        only_items,
+        row_filter,
+        use_index,
+        string_pool,
+        typed_items,
+    ):
+        """read() of CIF text from source, which was given as file_path"""
         if self.input == "data":
             # (datablock_id, mmcif_dict) = MMCIF2Dict().parse(file_path, ignoreCategories=ignore)
             mmcif_dict = MMCIF2Dict().parse(
-                file_path,
+                source,
                 ignoreCategories=ignore,
                 preserve_token_order=token_ordering,
                 onlyCategories=only,
+                processes=processes,
+                stop_early=stop_early,
+                only_items=only_items,
+                row_filter=row_filter,
+                threaded=self.threaded,
+                use_index=use_index,
+                cache=self.cache,
+                string_pool=string_pool,
+            )
+            return self._fromDict(
+                mmcif_dict, output, file_path, token_ordering, typed_items
             )
-            if output == "cif_dictionary":
-                return mmcif_dict
-            if output == "cif_wrapper":
-                return dict(
+        else:
+            return self._exportCifFile(source, token_ordering, processes)
+
+    def _fromDict(
+        self, mmcif_dict, output, file_path, token_ordering, typed_items=None
+    ):
+        """The result of read() for the mmCIF-like dictionary of a file"""
+        if output == "cif_dictionary":
+            if typed_items and mmcif_dict:
+                for block_data in mmcif_dict.values():
+                    for category, item, dtype in _typedItems(block_data, typed_items):
+                        values = block_data[category]
+                        values[item] = column_array(values[item], dtype)
+            return mmcif_dict
+        if output == "cif_wrapper":
+            wrappers = dict(
+                (
                     (
-                        (
-                            block_id,
-                            CIFWrapper(
-                                block_data,
-                                data_id=block_id,
-                                preserve_token_order=token_ordering,
-                            ),
-                        )
-                        for block_id, block_data in list(mmcif_dict.items())
+                        block_id,
+                        CIFWrapper(
+                            block_data,
+                            data_id=block_id,
+                            preserve_token_order=token_ordering,
+                        ),
                     )
+                    for block_id, block_data in list(mmcif_dict.items())
                 )
-                # return CIFWrapper(mmcif_dict, data_id=datablock_id)
-            if output == "cif_file":
-                return CifFile(
+            )
+            if typed_items:
+                for wrapper in wrappers.values():
+                    for category, item, dtype in _typedItems(wrapper, typed_items):
+                        wrapper[category].as_array(item, dtype)
+            return wrappers
+            # return CIFWrapper(mmcif_dict, data_id=datablock_id)
+        if output == "cif_file":
+            return CifFile(
+                _sourceName(file_path),
+                mmcif_data_map=mmcif_dict,
+                preserve_token_order=token_ordering,
+            )
+
+        return
+
+    def iterparse(
+        self,
+        file_path,
+        output="cif_dictionary",
+        ignore=[],
+        preserve_order=False,
+        only=None,
+        only_items=None,
+        row_filter=None,
+        string_pool=None,
+    ):
+        """Read in mmCIF file one data block at a time
+
+        Unlike read(), only the data block being read is held in memory,
+        which suits files with very many blocks such as the chemical
+        component dictionary.
+
+        Args:
+            file_path (str): Path to the mmCIF file, or its contents or an
+                open file object as for read().
+            output (str, optional): Data type each data block should be
+                returned as: `cif_dictionary` (plain python dictionary),
+                `cif_wrapper` (CIFWrapper) or `cif_file` (DataBlock).
+                Input "dictionary" always gives DataBlocks. BinaryCIF
+                (input "bcif") is read whole before its blocks are given.
+                Defaults to "cif_dictionary".
+            ignore, preserve_order, only, only_items, row_filter,
+                string_pool: As for read().
+
+        Yields:
+            tuple: (block_id, block) for each data block in the file.
+        """
+        token_ordering = self.preserve_token_order or preserve_order
+        if self.input in ("data", "bcif"):
+            if self.input == "bcif":
+                blocks = _loadBinaryCif(
                     file_path,
-                    mmcif_data_map=mmcif_dict,
+                    ignore,
+                    token_ordering,
+                    only,
+                    only_items,
+                    row_filter,
+                    string_pool,
+                ).items()
+            else:
+                blocks = MMCIF2Dict().iterparse(
+                    file_path,
+                    ignoreCategories=ignore,
                     preserve_token_order=token_ordering,
+                    onlyCategories=only,
+                    only_items=only_items,
+                    row_filter=row_filter,
+                    threaded=self.threaded,
+                    string_pool=string_pool,
                 )
-
-            return
+            for block_id, block_data in blocks:
+                if output == "cif_dictionary":
+                    yield block_id, block_data
+                elif output == "cif_wrapper":
+                    yield block_id, CIFWrapper(
+                        block_data,
+                        data_id=block_id,
+                        preserve_token_order=token_ordering,
+                    )
+                elif output == "cif_file":
+                    cf = CifFile(
+                        _sourceName(file_path),
+                        mmcif_data_map={block_id: block_data},
+                        preserve_token_order=token_ordering,
+                    )
+                    yield block_id, cf.getDataBlock(block_id)
         else:
-            return self._exportCifFile(file_path, token_ordering)
+            with _openTokenSource(file_path, self.threaded) as cif_file:
+                for block in _iterCifBlocks(
+                    cif_file, _sourceName(file_path), token_ordering, self.engine
+                ):
+                    yield block.getId(), block
 
-    def _processLoop(self, category, loopItems, loopValues):
-        """Create the Items in a category given an array of items and item values"""
+    def parse_events(self, file_path, handler):
+        """Read an mmCIF file as a stream of events sent to a handler, without
+        building any representation of the file. The tokeniser is used
+        whatever the input of the reader.
 
-        valNum = len(loopValues)
-        itmNum = len(loopItems)
-        if valNum % itmNum != 0:
-            raise LoopValueMultiplesError()
-        loopItems = [category.getItem(i) for i in loopItems]
-        for i in range(valNum):
-            loopItems[i % itmNum].setValue(loopValues[i][0], loopValues[i][1])
+        Args:
+            file_path (str): Path to the mmCIF file, or its contents or an
+                open file object as for read().
+            handler (CifEventHandler): Receives the blocks, save frames,
+                loops, rows and items of the file as they are read.
+                CifFileHandler, CifDictHandler and CIFWrapperHandler build
+                the usual outputs.
+
+        Returns:
+            CifEventHandler: The handler, once the whole file has been read.
+        """
+        with _openTokenSource(file_path, self.threaded) as cif_file:
+            return _readEvents(cif_file, handler, self.engine)
 
-    def _exportCifFile(self, file_path, token_ordering):
+    def _exportCifFile(self, file_path, token_ordering, processes=1):
         """"""
         cf = None
         if file_path is not None:
-            cif_file = openGzip(file_path, "r")
-
-            tokeniser = StarTokeniser()
-            tokeniser.start_matching(cif_file)
-
-            if cif_file:
-                cf = CifFile(file_path, preserve_token_order=token_ordering)
-            db = None
-            sf = None
-            cc = None
-            ci = None
-            loopItems = []
-            loopValues = []
-            loop_state = False
-            save_state = False
-            loop_value_state = False
-
-            # Keller tokenizer provides the following tokens:
-            # "", "MULTILINE", "COMMENT", "GLOBAL", "SAVE_FRAME", "SAVE_FRAME_REF",
-            # "LOOP_STOP", "DATA_BLOCK", "LOOP", "BAD_CONSTRUCT", "DATA_NAME", "SQUOTE_STRING",
-            # "DQUOTE_STRING", "NULL", "UNKNOWN", "SQUARE_BRACKET", "STRING", "BAD_TOKEN"
-
-            DATA_TOKENS = [
-                "MULTILINE",
-                "SQUOTE_STRING",
-                "DQUOTE_STRING",
-                "NULL",
-                "UNKNOWN",
-                "STRING",
-            ]
-            # NB: Square bracket  types are not currently handled
-
-            for tok in tokeniser:
-                if tok.type_string == "BAD_TOKEN":
-                    raise BadStarTokenError(tok)
-
-                if tok.type_string == "DATA_BLOCK":
-                    db = cf.setDataBlock(tok.value[tok.value.find("_") + 1 :])
-                    loop_state = False
-                    save_state = False
-
-                elif tok.type_string == "LOOP":
-                    loop_value_state = False
-                    if not loop_state:
-                        loop_state = True
-                    if loopValues != []:
-                        self._processLoop(cc, loopItems, loopValues)
-                        loopItems = []
-                        loopValues = []
-
-                elif tok.type_string == "SAVE_FRAME":
-                    if save_state:
-                        save_state = False
-                    else:
-                        sf = db.setSaveFrame(tok.value[tok.value.find("_") + 1 :])
-                        save_state = True
-                    if loop_state:
-                        loop_state = False
-                        if loopValues != []:
-                            self._processLoop(cc, loopItems, loopValues)
-                            loopItems = []
-                            loopValues = []
-
-                elif tok.type_string == "DATA_NAME":
-                    [category_name, item_name] = tok.value.split(".")
-                    if loop_value_state:
-                        loop_state = False
-                        loop_value_state = False
-                        if loopValues != []:
-                            self._processLoop(cc, loopItems, loopValues)
-                            loopItems = []
-                            loopValues = []
-
-                    if not save_state:
-                        cc = db.setCategory(category_name)
-                    else:
-                        cc = sf.setCategory(category_name)
+            if (
+                processes != 1
+                and is_cif_path(file_path)
+                and compression(file_path) is None
+            ):
+                try:
+                    cf = self._tokeniseCifFileParallel(
+                        file_path, token_ordering, processes
+                    )
+                except (BadStarTokenError, LoopValueMultiplesError):
+                    # Positions within a range are not those in the file, so
+                    # fall through to a serial read that reports the line
+                    cf = None
+                if cf is not None:
+                    return cf
+            cf = self._tokeniseCifFile(file_path, token_ordering)
 
-                    if loop_state:
-                        loopItems.append(item_name)
+        return cf
 
-                    ci = cc.setItem(item_name)
+    def _tokeniseCifFile(self, file_path, token_ordering):
+        """Build a CifFile from the token stream of the file"""
+        with _openTokenSource(file_path, self.threaded) as cif_file:
+            return _buildCifFile(
+                cif_file, _sourceName(file_path), token_ordering, self.engine
+            )
 
-                elif tok.type_string in DATA_TOKENS:  # It's a data contatining token
-                    token_value = tok.value
-                    if loop_state:
-                        loopValues.append((token_value, tok.type_string))
-                        if not loop_value_state:
-                            loop_value_state = True
-                    else:
-                        ci.setValue(token_value, tok.type_string)
-            if loopValues != []:
-                self._processLoop(cc, loopItems, loopValues)
-                loopItems = []
-                loopValues = []
+    def _tokeniseCifFileParallel(self, file_path, token_ordering, processes):
+        """Build a CifFile from byte ranges of the file tokenised in worker
+        processes, each range starting at a data block. Returns None when the
+        file holds too few data blocks to split."""
+        workers = processes or cpu_count()
+        ranges = block_ranges(file_path, workers * 4)
+        if len(ranges) < 2 or ProcessPoolExecutor is None:
+            return None
 
+        tasks = [
+            (file_path, start, end, token_ordering, self.engine)
+            for start, end in ranges
+        ]
+        cf = CifFile(file_path, preserve_token_order=token_ordering)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for part in executor.map(_tokeniseRange, tasks):
+                for block in part.getDataBlocks():
+                    block.parent = cf
+                    cf.data_blocks[block.id] = block
         return cf
+
+
+def iter_rows(file_path, category, batch_size=10000, threaded=False):
+    """Read the rows of one category of an mmCIF file in batches, so that at
+    most batch_size rows of it are held at a time. The rows are read as
+    MMCIF2Dict reads them (CifFileReader input "data").
+
+    Args:
+        file_path (str): Path to the mmCIF file, or its contents or an open
+            file object as for CifFileReader.read().
+        category (str): Category name, with or without the leading
+            underscore, e.g. "atom_site".
+        batch_size (int, optional): Largest number of rows in a batch.
+            Defaults to 10000.
+        threaded (bool, optional): Decompress compressed input in a
+            background thread, as for CifFileReader. Defaults to False.
+
+    Yields:
+        dict: Item names mapped to lists of values, one entry per row of the
+        batch. Batches never span two loops; a category that is not looped
+        gives a batch of one row for each data block.
+    """
+    category = "_" + category.lstrip("_")
+    with open_source(file_path, "rt", threaded) as f1:
+        for batch in _iterRowBatches(f1, category, batch_size):
+            yield batch
+
+
+@contextmanager
+def _openTokenSource(source, threaded=False):
+    """Open a CIF source for StarTokeniser.start_matching(). CIF text and
+    bytes are passed on as they are, to be matched in place; paths and file
+    objects, and compressed bytes, give a binary file object."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        in_memory = sniff_compression(bytes(source[:6])) is None
+    else:
+        in_memory = not (is_cif_path(source) or hasattr(source, "read"))
+    if in_memory:
+        yield source
+    else:
+        with open_source(source, "rb", threaded) as cif_file:
+            yield cif_file
+
+
+def _typedItems(data_block, typed_items):
+    """(category, item, dtype) for the items of typed_items (see
+    CifFileReader.read) that are in a data block or CIFWrapper"""
+    for category, items in typed_items.items():
+        if category in data_block:
+            for item, dtype in items.items():
+                if item in data_block[category]:
+                    yield category, item, dtype
+
+
+def _loadBinaryCif(
+    source, ignore, token_ordering, only, only_items, row_filter, string_pool
+):
+    """The mmCIF-like dictionary of a BinaryCIF source, with the categories,
+    items and rows that CifFileReader.read() would keep"""
+    mmcif_dict = load_bcif(source, token_ordering)
+    if only or ignore:
+        mmcif_dict = _selectCategories(mmcif_dict, only, ignore, token_ordering)
+    mmcif_dict = _filterParsed(mmcif_dict, only_items, row_filter)
+    if string_pool is not None:
+        if string_pool is True:
+            string_pool = StringPool()
+        string_pool.compact(mmcif_dict)
+    return mmcif_dict
+
+
+def _isBinaryCifName(source):
+    """True if a CIF source is a path named as a BinaryCIF file, compressed
+    or not"""
+    if not is_cif_path(source):
+        return False
+    path = source.__fspath__() if hasattr(source, "__fspath__") else source
+    return _bcif_name.search(path) is not None
+
+
+def _binaryMode(mode):
+    """A file mode for writing bytes in place of text"""
+    return mode.replace("t", "") + ("b" if "b" not in mode else "")
+
+
+def _cifFileDict(cif_file):
+    """The mmCIF-like dictionary of the data blocks of a CifFile, without
+    their save frames, which BinaryCIF cannot hold"""
+    return dict(
+        (
+            block.getId(),
+            dict(
+                (
+                    "_" + category.getId(),
+                    dict((item.name, item.value) for item in category.getItems()),
+                )
+                for category in block.getCategories()
+            ),
+        )
+        for block in cif_file.getDataBlocks()
+    )
+
+
+# Number of members of a container that are measured by _estimateSize(); the
+# size of larger containers is extrapolated from them
+_SIZE_SAMPLE = 32
+
+
+def _estimateSize(obj, seen=None):
+    """An estimate of the memory used by obj and everything it refers to,
+    for EntryCache. Lists and dictionaries are sampled, as the values of a
+    loop are much alike; objects referred to more than once are counted
+    once, and classes not at all."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        members = obj.items()
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        members = obj
+    elif isinstance(obj, PooledColumn):
+        # The pool is shared, so only counted for the first of its columns
+        return size + sys.getsizeof(obj.codes) + _estimateSize(obj.pool, seen)
+    elif hasattr(obj, "__dict__"):
+        return size + _estimateSize(vars(obj), seen)
+    else:
+        return size
+    pairs = isinstance(obj, dict)
+    sampled = 0
+    total = 0
+    for member in members:
+        if sampled == _SIZE_SAMPLE:
+            return size + total * len(obj) // sampled
+        for part in member if pairs else (member,):
+            total += _estimateSize(part, seen)
+        sampled += 1
+    return size + total
+
+
+def _sourceName(source):
+    """The path of a CIF source for CifFile.file_path, or None when it is not
+    read from a named file"""
+    return source if is_cif_path(source) else None
+
+
+def _buildCifFile(cif_file, file_path, token_ordering, engine):
+    """Build a CifFile from the token stream of an open binary file object"""
+    cf = CifFile(file_path, preserve_token_order=token_ordering)
+    _readEvents(cif_file, CifFileHandler(cf), engine)
+    return cf
+
+
+def _readEvents(cif_file, handler, engine):
+    """Send the contents of an open binary file object to a CifEventHandler"""
+    tokeniser = StarTokeniser(bytes_mode=True, engine=engine)
+    tokeniser.start_matching(cif_file)
+
+    reader = _CifEventReader(handler, tokeniser.locate)
+    dispatch = reader.dispatch
+    for token_type, token_value in tokeniser.tokens():
+        token_handler = dispatch.get(token_type)
+        if token_handler is not None:
+            token_handler(token_value)
+    reader.finish()
+
+    return handler
+
+
+def _iterCifBlocks(cif_file, file_path, token_ordering, engine):
+    """Generator of the DataBlocks in the token stream of an open binary file
+    object. Each block is released by its CifFile once it has been read, so
+    only one is held at a time."""
+    tokeniser = StarTokeniser(bytes_mode=True, engine=engine)
+    tokeniser.start_matching(cif_file)
+
+    cf = CifFile(file_path, preserve_token_order=token_ordering)
+    builder = CifFileHandler(cf)
+    reader = _CifEventReader(builder, tokeniser.locate)
+    dispatch = reader.dispatch
+    for token_type, token_value in tokeniser.tokens():
+        if token_type == TOKEN_DATA_BLOCK:
+            block = builder.db
+            reader.data_block(token_value)
+            if block is not None and block is not builder.db:
+                yield cf.data_blocks.pop(block.id)
+        else:
+            token_handler = dispatch.get(token_type)
+            if token_handler is not None:
+                token_handler(token_value)
+    reader.finish()
+    if builder.db is not None:
+        yield cf.data_blocks.pop(builder.db.id)
+
+
+def _tokeniseRange(task):
+    """Worker for CifFileReader._tokeniseCifFileParallel: build a CifFile from
+    the data blocks in a byte range of a file"""
+    file_path, start, end, token_ordering, engine = task
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return _buildCifFile(io.BytesIO(data), file_path, token_ordering, engine)
+
+
+class CifEventHandler(object):
+
+    """
+    Receives the contents of a CIF file as a sequence of events, in file
+    order, from CifFileReader.parse_events(). Nothing is built by the reader
+    itself, so a handler that keeps only what it needs (counts, sums, one row
+    at a time) reads a file of any size in constant memory.
+
+    Every callback does nothing here; subclass and override the ones needed.
+    Category names are passed as written in the file, e.g. "_atom_site".
+    Values are strings, or (value, type_string) tuples when typed_values is
+    True, type_string being the token type such as "SQUOTE_STRING".
+
+    Example:
+        class ChainCounter(CifEventHandler):
+            def __init__(self):
+                self.counts = {}
+                self.column = None
+
+            def start_loop(self, category, items):
+                self.column = None
+                if category == "_atom_site":
+                    self.column = items.index("auth_asym_id")
+
+            def row(self, values):
+                if self.column is not None:
+                    chain = values[self.column]
+                    self.counts[chain] = self.counts.get(chain, 0) + 1
+    """
+
+    typed_values = False
+
+    def start_block(self, block_id):
+        """A data block starts; block_id is the name after data_"""
+        pass
+
+    def end_block(self):
+        """The current data block ends"""
+        pass
+
+    def start_saveframe(self, frame_id):
+        """A save frame starts; frame_id is the name after save_"""
+        pass
+
+    def end_saveframe(self):
+        """The current save frame ends"""
+        pass
+
+    def start_loop(self, category, items):
+        """A loop starts over the list of item names of category"""
+        pass
+
+    def row(self, values):
+        """One row of the current loop, values being in the order of the items
+        given to start_loop(). The list is not reused by the reader."""
+        pass
+
+    def end_loop(self):
+        """The current loop ends"""
+        pass
+
+    def item(self, category, item, value):
+        """A single (non-looped) item value"""
+        pass
+
+
+class CifFileHandler(CifEventHandler):
+
+    """
+    CifEventHandler that populates a CifFile, as CifFileReader does for input
+    other than "data".
+    """
+
+    typed_values = True
+
+    def __init__(self, cif_file):
+        self.cif_file = cif_file
+        self.db = None
+        # DataBlock or SaveFrame that categories are added to
+        self.container = None
+        self.columns = []
+
+    def start_block(self, block_id):
+        self.db = self.container = self.cif_file.setDataBlock(block_id)
+
+    def start_saveframe(self, frame_id):
+        self.container = self.db.setSaveFrame(frame_id)
+
+    def end_saveframe(self):
+        self.container = self.db
+
+    def start_loop(self, category, items):
+        category = self.container.setCategory(category)
+        self.columns = [category.setItem(item) for item in items]
+
+    def row(self, values):
+        for column, (value, type_string) in zip(self.columns, values):
+            column.setValue(value, type_string)
+
+    def item(self, category, item, value):
+        self.container.setCategory(category).setItem(item).setValue(*value)
+
+
+class CifDictHandler(CifEventHandler):
+
+    """
+    CifEventHandler that builds the same dictionary as MMCIF2Dict.parse():
+    data block ids mapped to category names mapped to item names mapped to
+    values, looped items holding lists. As with MMCIF2Dict, save frames are
+    skipped and white space is stripped from around the values of text
+    fields. The result is in self.data_blocks.
+    """
+
+    # To tell text fields from other values
+    typed_values = True
+
+    def __init__(self, preserve_token_order=False):
+        self.preserve_token_order = preserve_token_order
+        self._dict = OrderedDict if preserve_token_order else dict
+        self.data_blocks = self._dict()
+        self.block_id = None
+        self.block = None
+        self.in_save = False
+        self.columns = None
+
+    def start_block(self, block_id):
+        self.block_id = block_id
+        self.block = self.data_blocks.setdefault(block_id, self._dict())
+
+    def start_saveframe(self, frame_id):
+        self.in_save = True
+
+    def end_saveframe(self):
+        self.in_save = False
+
+    def start_loop(self, category, items):
+        self.columns = None
+        if self.block is None or self.in_save:
+            return
+        category = self.block.setdefault(category, self._dict())
+        self.columns = []
+        for item in items:
+            category[item] = []
+            self.columns.append(category[item])
+
+    def row(self, values):
+        if self.columns is not None:
+            for column, value in zip(self.columns, values):
+                column.append(_dictValue(value))
+
+    def item(self, category, item, value):
+        if self.block is not None and not self.in_save:
+            self.block.setdefault(category, self._dict())[item] = _dictValue(value)
+
+
+def _dictValue(value):
+    """A typed value as MMCIF2Dict reads it"""
+    text, type_string = value
+    if type_string == "MULTILINE":
+        # MMCIF2Dict reads files with universal newlines
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text.strip()
+    return text
+
+
+class CIFWrapperHandler(CifDictHandler):
+
+    """
+    CifDictHandler that turns each data block into a CIFWrapper as soon as it
+    has been read.
+    """
+
+    def end_block(self):
+        if self.block is not None:
+            self.data_blocks[self.block_id] = CIFWrapper(
+                self.block,
+                data_id=self.block_id,
+                preserve_token_order=self.preserve_token_order,
+            )
+        self.block = None
+
+
+class _CifEventReader(object):
+
+    """
+    Turns the (type, value) token tuples of a StarTokeniser into calls on a
+    CifEventHandler.
+
+    Tokens are dispatched on their integer type through self.dispatch; tokens
+    without an entry (comments, global_, stop_, save frame references and
+    square bracket constructs) are ignored.
+    """
+
+    # Keller tokenizer provides the following tokens:
+    # "", "MULTILINE", "COMMENT", "GLOBAL", "SAVE_FRAME", "SAVE_FRAME_REF",
+    # "LOOP_STOP", "DATA_BLOCK", "LOOP", "BAD_CONSTRUCT", "DATA_NAME", "SQUOTE_STRING",
+    # "DQUOTE_STRING", "NULL", "UNKNOWN", "SQUARE_BRACKET", "STRING", "BAD_TOKEN"
+
+    DATA_TOKENS = (
+        TOKEN_MULTILINE,
+        TOKEN_SQUOTE_STRING,
+        TOKEN_DQUOTE_STRING,
+        TOKEN_NULL,
+        TOKEN_UNKNOWN,
+        TOKEN_STRING,
+    )
+    # NB: Square bracket  types are not currently handled
+
+    def __init__(self, handler, locate):
+        self.handler = handler
+        # StarTokeniser.locate() of the tokeniser read, for the offset and
+        # line of errors
+        self.locate = locate
+        self.in_block = False
+        self.in_save = False
+        # (category, item) of the last data name outside a loop
+        self.name = None
+        # Item names of the loop being read, None outside loops
+        self.loop_items = None
+        self.loop_category = None
+        self.loop_started = False
+        self.values = []
+        # (offset, line) of the last loop_
+        self.loop_position = (None, None)
+
+        self.dispatch = {
+            TOKEN_BAD_TOKEN: self.bad_token,
+            TOKEN_DATA_BLOCK: self.data_block,
+            TOKEN_LOOP: self.loop,
+            TOKEN_SAVE_FRAME: self.save_frame,
+            TOKEN_DATA_NAME: self.data_name,
+        }
+        for token_type in self.DATA_TOKENS:
+            if handler.typed_values:
+                value_handler = partial(
+                    self.typed_value, _token_type_as_string(token_type)
+                )
+            else:
+                value_handler = self.data_value
+            self.dispatch[token_type] = value_handler
+
+    def bad_token(self, token_value):
+        offset, line = self.locate(token_value)
+        end = offset + len(token_value) if offset is not None else None
+        raise BadStarTokenError(
+            StarToken(TOKEN_BAD_TOKEN, token_value, offset, end, line)
+        )
+
+    def data_block(self, token_value):
+        # Complete the loop, save frame and block before this one first
+        self._end_block()
+        token_value = _text(token_value)
+        self.in_block = True
+        self.handler.start_block(token_value[token_value.find("_") + 1 :])
+
+    def loop(self, token_value):
+        self._end_loop()
+        self.loop_items = []
+        self.loop_started = False
+        self.loop_position = self.locate(token_value)
+
+    def save_frame(self, token_value):
+        self._end_loop()
+        self.name = None
+        if self.in_save:
+            self.in_save = False
+            self.handler.end_saveframe()
+        else:
+            token_value = _text(token_value)
+            self.in_save = True
+            self.handler.start_saveframe(token_value[token_value.find("_") + 1 :])
+
+    def data_name(self, token_value):
+        category_name, item_name = _text(token_value).split(".")
+        if self.loop_items is not None:
+            if not self.loop_started:
+                self.loop_items.append(item_name)
+                self.loop_category = category_name
+                return
+            self._end_loop()
+        self.name = (category_name, item_name)
+
+    def data_value(self, token_value):
+        self._value(_text(token_value))
+
+    def typed_value(self, type_string, token_value):
+        self._value((_text(token_value), type_string))
+
+    def _value(self, value):
+        if self.loop_items is not None:
+            if not self.loop_started:
+                self._start_loop()
+            values = self.values
+            values.append(value)
+            if len(values) == len(self.loop_items):
+                self.handler.row(values)
+                self.values = []
+        elif self.name is not None:
+            self.handler.item(self.name[0], self.name[1], value)
+
+    def finish(self):
+        self._end_block()
+
+    def _start_loop(self):
+        if not self.loop_items:
+            raise self._loop_error()
+        self.loop_started = True
+        self.handler.start_loop(self.loop_category, self.loop_items)
+
+    def _end_loop(self):
+        if self.loop_items is None:
+            return
+        if not self.loop_started and self.loop_items:
+            self._start_loop()
+        if self.values:
+            raise self._loop_error()
+        if self.loop_started:
+            self.handler.end_loop()
+        self.loop_items = None
+        self.loop_started = False
+
+    def _loop_error(self):
+        offset, line = self.loop_position
+        return LoopValueMultiplesError(line, offset)
+
+    def _end_block(self):
+        self._end_loop()
+        self.name = None
+        if self.in_save:
+            self.in_save = False
+            self.handler.end_saveframe()
+        if self.in_block:
+            self.in_block = False
+            self.handler.end_block()
+
+
+def _text(token_value):
+    """Decode token values matched in bytes mode"""
+    if token_value.__class__ is bytes:
+        return token_value.decode("utf-8")
+    return token_value
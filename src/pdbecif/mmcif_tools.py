@@ -1,6 +1,8 @@
 """
 A very low level access to mmCIF data files. MMCIF2Dict has one method 'parse()'
-that returns (datablock_id, mmCIF_data) tuples as (str, dict)
+that returns (datablock_id, mmCIF_data) tuples as (str, dict), and
+'parse_lazy()' that returns the same structure but only parses a category the
+first time it is looked up.
 
 MMCIF2DICT is very fast at reading mmCIF data.
 """
@@ -8,9 +10,37 @@ __author__ = "Glen van Ginkel (Protein Data Bank in Europe; http://pdbe.org)"
 __date__ = "$30-Jun-2012 18:23:30$"
 
 # imports
+import io
+import mmap
+import numbers
 import os.path
 import re
-from pdbecif.utils import openGzip
+from itertools import compress
+from pdbecif.mmcif_columns import PooledColumn, StringPool
+from pdbecif.utils import (
+    ProcessPoolExecutor,
+    block_ranges,
+    compression,
+    cpu_count,
+    is_cif_path,
+    open_compressed,
+    open_source,
+)
+
+try:
+    from collections import OrderedDict as _ordered_dict
+except ImportError:
+    # fallback: try to use the ordereddict backport when using python 2.6
+    try:
+        from ordereddict import OrderedDict as _ordered_dict
+    except ImportError:
+        # backport not installed: use local OrderedDict
+        from mmCif.ordereddict import OrderedDict as _ordered_dict
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 # constants
 
@@ -21,11 +51,16 @@ class MMCIFWrapperSyntaxError(Exception):
 
     """"""
 
-    def __init__(self, category):
+    def __init__(self, category, lineno=None):
         self.category = category
+        # Line the error was found on, when known
+        self.lineno = lineno
 
     def __str__(self):
-        return "More items than values for category " + repr(self.category) + "!"
+        msg = "More items than values for category " + repr(self.category) + "!"
+        if self.lineno is not None:
+            msg += " (line %i)" % self.lineno
+        return msg
 
 
 class MultipleLoopCategoriesError(Exception):
@@ -41,6 +76,264 @@ class MultipleLoopCategoriesError(Exception):
         return repr(self.msg % str(self.lineno))
 
 
+# First characters of loop rows that must go through the line-by-line path
+_NOT_PLAIN_LOOP_START = frozenset("_;#'\"lLdDsS \t\r\n")
+
+
+class _LoopColumns(object):
+    """
+    Collects the values of a loop straight into one list per item.
+
+    Rows of plain whitespace separated values are buffered as lines and
+    split in bulk, values tokenised one line at a time (quoted strings, text
+    fields) are added with extend(). Both keep the order of the values, and
+    the values of an incomplete row are carried over to the next batch, so
+    the loop is never held as a single flat list.
+
+    When items is given, only the columns of the loop items in it are kept.
+    Rows rejected by row_filter (see MMCIF2Dict.parse) are dropped as the
+    columns are extended, so they are never stored. With a StringPool, the
+    columns are pooled as they are stored.
+
+    With batch_size, every batch_size rows collected are moved out of the
+    columns into self.batches, as dictionaries of item names to lists, to
+    be taken with take_batches(), also after store(), which stores the rows
+    left over.
+    """
+
+    BATCH_LINES = 4096
+
+    def __init__(
+        self, table_names, items=None, row_filter=None, pool=None, batch_size=None
+    ):
+        self.table_names = list(table_names)
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batches = []
+        self.n_items = len(table_names)
+        self.keep = [
+            i
+            for i, name in enumerate(table_names)
+            if items is None or name in items
+        ]
+        self.names = [table_names[i] for i in self.keep]
+        self.columns = [[] for _ in self.keep]
+        self.lines = []
+        self.partial = []
+
+        # (column index, value test) pairs, or a test of whole rows
+        self.tests = None
+        self.row_test = None
+        if callable(row_filter):
+            self.row_test = row_filter
+        elif row_filter:
+            self.tests = [
+                (
+                    table_names.index(item) if item in table_names else None,
+                    _valueTest(condition),
+                )
+                for item, condition in row_filter.items()
+            ]
+
+    def add_line(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.BATCH_LINES:
+            self._flushLines()
+
+    def extend(self, values):
+        if self.lines:
+            self._flushLines()
+        self._distribute(values)
+
+    def store(self, category_dict, category):
+        """Set the columns as the values of the loop items in category_dict"""
+        if self.lines:
+            self._flushLines()
+        if self.partial:
+            raise MMCIFWrapperSyntaxError(category)
+        columns = self.columns
+        self.columns = None
+        for item in self.names:
+            # Popped so that each list is freed as soon as it is pooled
+            column = columns.pop(0)
+            if self.pool is not None:
+                column = self.pool.column(column)
+            category_dict[item] = column
+
+    def _flushLines(self):
+        values = "".join(self.lines).split()
+        self.lines = []
+        self._distribute(values)
+
+    def _distribute(self, values):
+        if self.partial:
+            values = self.partial + values
+        n = self.n_items
+        full = len(values) - len(values) % n
+        mask = self._rowMask(values, full)
+        if mask is None:
+            for i, column in zip(self.keep, self.columns):
+                column.extend(values[i:full:n])
+        else:
+            for i, column in zip(self.keep, self.columns):
+                column.extend(compress(values[i:full:n], mask))
+        self.partial = values[full:]
+        if self.batch_size and self.columns:
+            self._cutBatches()
+
+    def take_batches(self):
+        """The batches cut from the columns since the last call"""
+        batches = self.batches
+        self.batches = []
+        return batches
+
+    def _cutBatches(self):
+        size = self.batch_size
+        columns = self.columns
+        cut = len(columns[0]) - len(columns[0]) % size
+        for start in range(0, cut, size):
+            batch = [column[start : start + size] for column in columns]
+            self.batches.append(dict(zip(self.names, batch)))
+        if cut:
+            # The rows left over are moved to the front once per call
+            for column in columns:
+                del column[:cut]
+
+    def _rowMask(self, values, full):
+        """Whether each complete row in values passes the row filter, or None
+        without a filter"""
+        n = self.n_items
+        if self.row_test is not None:
+            names = self.table_names
+            return [
+                bool(self.row_test(dict(zip(names, values[k : k + n]))))
+                for k in range(0, full, n)
+            ]
+        if not self.tests:
+            return None
+        mask = None
+        for i, test in self.tests:
+            if i is None:
+                # A condition on an item that the loop does not have
+                return [False] * (full // n)
+            column = [bool(test(value)) for value in values[i:full:n]]
+            mask = column if mask is None else [a and b for a, b in zip(mask, column)]
+        return mask
+
+
+def _valueTest(condition):
+    """Function testing a single value against a row_filter condition"""
+    if callable(condition):
+        return condition
+    if isinstance(condition, tuple):
+        if len(condition) != 2 or not all(
+            bound is None or isinstance(bound, numbers.Real) for bound in condition
+        ):
+            raise TypeError(
+                "A row_filter range must be a (low, high) tuple of numbers or "
+                "None, not %r; give a set or list for a choice of values"
+                % (condition,)
+            )
+        low, high = condition
+
+        def in_range(value):
+            try:
+                value = float(value)
+            except ValueError:
+                # Null and unknown values ('.' and '?') are not in any range
+                return False
+            return (low is None or value >= low) and (high is None or value <= high)
+
+        return in_range
+    if isinstance(condition, (set, frozenset, list)):
+        return set(str(allowed) for allowed in condition).__contains__
+    return str(condition).__eq__
+
+
+def _rowMatches(row, row_filter):
+    """Whether the item values of a category outside a loop pass row_filter"""
+    if callable(row_filter):
+        return bool(row_filter(row))
+    return all(
+        item in row and _valueTest(condition)(row[item])
+        for item, condition in row_filter.items()
+    )
+
+
+class _LineReader(object):
+    """
+    Lines of a text file object, read a chunk of whole lines at a time so
+    that skip_to() can search ahead in the buffer instead of handling every
+    skipped line in Python.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, f):
+        self.f = f
+        # The text of the current chunk after the newline that ended the
+        # previous one, so that its first line can be searched for as well
+        self.data = "\n"
+        self.chunk = io.StringIO()
+        # Lines in the chunks before the current one
+        self.lines_before = 0
+
+    def lines(self):
+        """Generator of the lines of the file, as iterating it would give"""
+        while True:
+            chunk = self.chunk
+            for line in chunk:
+                yield line
+            if self.chunk is chunk:
+                # Not moved on by skip_to()
+                if not self._nextChunk():
+                    return
+
+    @property
+    def line_num(self):
+        """Number of lines read, which is the line number of the last one"""
+        # Offsets in data are one more than in the chunk
+        pos = self.chunk.tell()
+        count = self.data.count("\n", 1, pos + 1)
+        if pos and self.data[pos] != "\n":
+            # The last line of the file, without a newline
+            count += 1
+        return self.lines_before + count
+
+    def skip_to(self, pattern):
+        """Discard lines up to the next one matched by pattern, which has to
+        match from the newline before it, and return that line, or an empty
+        line at the end of the file. The generator from lines() carries on
+        after the returned line."""
+        data = self.data
+        # Offsets in data are one more than in the chunk, so this is the
+        # newline that ends the current line
+        pos = self.chunk.tell()
+        while True:
+            m = pattern.search(data, pos)
+            if m is not None:
+                self.chunk.seek(m.start())
+                return self.chunk.readline()
+            # Exhaust the chunk being iterated before replacing it
+            self.chunk.seek(0, 2)
+            if not self._nextChunk():
+                return ""
+            data = self.data
+            pos = 0
+
+    def _nextChunk(self):
+        data = self.f.read(self.CHUNK_SIZE)
+        if not data:
+            return False
+        if not data.endswith("\n"):
+            data += self.f.readline()
+        self.lines_before += self.data.count("\n") - 1
+        self.data = "\n" + data
+        # Files opened in text mode on Python 2 give byte strings
+        self.chunk = (io.BytesIO if isinstance(data, bytes) else io.StringIO)(data)
+        return True
+
+
 class MMCIF2Dict:
     """
     MMCIF2Dict is a purely algorithmic parser that takes as input public
@@ -74,10 +367,18 @@ class MMCIF2Dict:
         r"^\s*(?P<data_category>_[\S]+)(?:\.)(?P<category_item>\S+)"
     )
     dataValueRE = re.compile(r'\s*(\'[\S\s]+?\'(?=\s)|"[\S\s]+?"(?=\s)|[\S]+)', re.M)
+    # Start of a line that ends the values of a skipped category, and the same
+    # after the newline of the previous line to search ahead for one
+    boundaryRE = re.compile(
+        r"[ \t]*(?:_|[Ll][Oo][Oo][Pp]_|[Dd][Aa][Tt][Aa]_|[Ss][Aa][Vv][Ee]_)"
+    )
+    nextBoundaryRE = re.compile(r"\n" + boundaryRE.pattern)
     header = ""
     data_map = None
     file_path = None
     reserve_token_order = False
+    # Line at which the last parse failed
+    line_num = 0
 
     def parse(
         self,
@@ -85,19 +386,277 @@ class MMCIF2Dict:
         ignoreCategories=[],
         preserve_token_order=False,
         onlyCategories=[],
+        processes=1,
+        stop_early=False,
+        only_items=None,
+        row_filter=None,
+        threaded=False,
+        use_index=False,
+        cache=None,
+        string_pool=None,
     ):
         """Public method which only functions to check the existence of
         the mmCIF file in preparation for reading in the private parseFile
         method.
+
+        With stop_early=True and onlyCategories, reading stops (and the file
+        is closed) at the first other category after every one of
+        onlyCategories has been read in the current data block. Any later
+        data blocks are not read, so this is meant for single block files
+        such as PDB entries, where metadata categories come before the
+        coordinates.
+
+        only_items maps category names to the items to read for them, e.g.
+        {"_atom_site": ["Cartn_x", "Cartn_y", "Cartn_z"]}. Values of the
+        other items of those categories are not stored. Categories that are
+        not in only_items are read in full.
+
+        row_filter maps category names to a condition on their rows, which
+        is applied while loops are read so that rejected rows are never
+        stored. A condition is either a function of the row, given as a
+        dictionary of item values, or a dictionary of item names to
+        conditions on their values that must all hold:
+
+            a set or list: the value is one of its members
+            a tuple (low, high) of numbers: the value is a number within
+                the inclusive range; either bound may be None. Other tuples
+                raise TypeError
+            a function: called with the value
+            anything else: the value equals it as a string
+
+        For example {"_atom_site": {"pdbx_PDB_model_num": "1",
+        "type_symbol": lambda v: v != "H"}}. A category written without a
+        loop is left out when its single row is rejected. Functions have to
+        be picklable when processes is not 1.
+
+        Files with many data blocks (e.g. the chemical component dictionary)
+        can be parsed in parallel by passing the number of worker processes
+        as processes (None for one per CPU). The file is split into byte
+        ranges that each start at a data_ block, the ranges are parsed
+        separately and the blocks are merged in their original order.
+        Compressed files (gzip, bz2 or xz, recognised by their leading bytes),
+        and reads that stop early, are always parsed in a single process, as
+        is everything on Python 2 without the futures backport.
+
+        Instead of a path, file_path may be the file itself: CIF text as
+        bytes or as a str that is not the name of a file, or an open
+        file object in text or binary mode, such as the result of
+        gzip.open(). These are always parsed in a single process.
+
+        With threaded=True, compressed input is decompressed and decoded in a
+        background thread while it is parsed, which shortens the read on
+        machines with a core to spare.
+
+        With use_index=True, onlyCategories of a file given by its path are
+        read through its sidecar index (see pdbecif.mmcif_index), which is
+        built on first use. Only the byte ranges of those categories are
+        tokenised, from the memory mapped file; for a gzip compressed file,
+        only the compressed data from the checkpoint nearest each category
+        is inflated. Reads that also give ignoreCategories, only_items or
+        row_filter do not use the index.
+
+        cache is an optional pdbecif.mmcif_cache.ParseCache. A file given by
+        its path is then parsed in full once and stored in the cache, and
+        later parses of the unchanged file (with any onlyCategories or
+        ignoreCategories) are loaded from it without tokenising the file.
+        Reads with stop_early, only_items or row_filter bypass the cache.
+
+        string_pool is an optional pdbecif.mmcif_columns.StringPool, or True
+        for a new one. Loop columns with few distinct values are then stored
+        as PooledColumns of codes into the pool, which take a fraction of
+        the memory of lists of strings and read like them.
         """
-        if os.path.exists(file_path) and os.path.isfile(file_path):
+        if string_pool is True:
+            string_pool = StringPool()
+        if string_pool is not None and (
+            processes != 1 or use_index or cache is not None
+        ):
+            # Parsed without the pool (in worker processes, or from the index
+            # or cache), then pooled
+            mmcif_like_file = self.parse(
+                file_path,
+                ignoreCategories,
+                preserve_token_order,
+                onlyCategories,
+                processes,
+                stop_early,
+                only_items,
+                row_filter,
+                threaded,
+                use_index,
+                cache,
+            )
+            if mmcif_like_file is not None:
+                string_pool.compact(mmcif_like_file)
+            return mmcif_like_file
+        if (
+            cache is not None
+            and not (stop_early or only_items or row_filter)
+            and is_cif_path(file_path)
+            and _isSource(file_path)
+        ):
+            cached = cache.get(
+                file_path, onlyCategories, ignoreCategories, preserve_token_order
+            )
+            if cached is not None:
+                return cached
+            stat = os.stat(file_path)
+            # The cache keeps the order of the file, for reads that preserve
+            # it; the dicts of Python 2 would lose it
+            mmcif_like_file = self.parse(
+                file_path,
+                preserve_token_order=True,
+                processes=processes,
+                threaded=threaded,
+            )
+            if mmcif_like_file is None:
+                return None
+            cache.put(file_path, mmcif_like_file, stat)
+            return _selectCategories(
+                mmcif_like_file,
+                onlyCategories,
+                ignoreCategories,
+                preserve_token_order,
+            )
+        if (
+            use_index
+            and onlyCategories
+            and not (ignoreCategories or only_items or row_filter)
+            and _isSource(file_path)
+        ):
+            lazy = self.parse_lazy(file_path, preserve_token_order, use_index=True)
+            with lazy:
+                return _onlyCategories(lazy, onlyCategories, preserve_token_order)
+        if _isSource(file_path):
+            if (
+                processes != 1
+                and not stop_early
+                and is_cif_path(file_path)
+                and compression(file_path) is None
+            ):
+                return self._parseFileParallel(
+                    file_path,
+                    ignoreCategories,
+                    preserve_token_order,
+                    onlyCategories,
+                    processes,
+                    only_items,
+                    row_filter,
+                )
             return self._parseFile(
-                file_path, ignoreCategories, preserve_token_order, onlyCategories
+                file_path,
+                ignoreCategories,
+                preserve_token_order,
+                onlyCategories,
+                stop_early,
+                only_items,
+                row_filter,
+                threaded,
+                string_pool,
             )
         else:
             print("The file provided does not exist or is not a file.")
             return None
 
+    def _parseFileParallel(
+        self,
+        file_path,
+        ignoreCategories,
+        preserve_token_order,
+        onlyCategories,
+        processes,
+        only_items=None,
+        row_filter=None,
+    ):
+        """Parse the data blocks of an uncompressed file in worker processes"""
+        workers = processes or cpu_count()
+        # Several ranges per worker even out blocks of different sizes
+        ranges = block_ranges(file_path, workers * 4)
+        if len(ranges) < 2 or ProcessPoolExecutor is None:
+            return self._parseFile(
+                file_path,
+                ignoreCategories,
+                preserve_token_order,
+                onlyCategories,
+                only_items=only_items,
+                row_filter=row_filter,
+            )
+
+        tasks = [
+            (
+                file_path,
+                start,
+                end,
+                ignoreCategories,
+                preserve_token_order,
+                onlyCategories,
+                only_items,
+                row_filter,
+            )
+            for start, end in ranges
+        ]
+        mmcif_like_file = _ordered_dict() if preserve_token_order else {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for blocks in executor.map(_parseRange, tasks):
+                if blocks is None:
+                    return None
+                mmcif_like_file.update(blocks)
+        return mmcif_like_file
+
+    def iterparse(
+        self,
+        file_path,
+        ignoreCategories=[],
+        preserve_token_order=False,
+        onlyCategories=[],
+        only_items=None,
+        row_filter=None,
+        threaded=False,
+        string_pool=None,
+    ):
+        """Generator of the (datablock_id, mmCIF_data) pairs of the file, one
+        data block at a time, so that only the block being read is held in
+        memory. The options are those of parse(). Parsing errors are raised
+        rather than printed.
+        """
+        if string_pool is True:
+            string_pool = StringPool()
+        if not _isSource(file_path):
+            print("The file provided does not exist or is not a file.")
+            return
+        with open_source(file_path, "rt", threaded) as f1:
+            for data_heading, data_block in self._iterHandle(
+                f1,
+                ignoreCategories,
+                preserve_token_order,
+                onlyCategories,
+                only_items=only_items,
+                row_filter=row_filter,
+                string_pool=string_pool,
+            ):
+                yield data_heading, data_block
+
+    def parse_lazy(self, file_path, preserve_token_order=False, use_index=False):
+        """Return the data blocks of the file as a LazyMMCIFDict, which reads
+        like the result of parse() but only parses a category when it is
+        first looked up.
+
+        The file is scanned once to record where each category of each data
+        block lies; the categories are then parsed on demand from the memory
+        mapped file (or from the decompressed data of a compressed file, or
+        from the bytes passed as file_path).
+
+        With use_index=True, the spans come from the sidecar index of the
+        file (built on first use) instead of a scan. A gzip compressed file
+        is then not decompressed up front: each category is inflated from
+        the checkpoint nearest to it.
+        """
+        if _isSource(file_path):
+            return LazyMMCIFDict(file_path, preserve_token_order, use_index)
+        else:
+            print("The file provided does not exist or is not a file.")
+            return None
+
     def _tokenizeData(self, line):
         """Private method that will do the work of parsing the mmCIF data file
         return Dictionary"""
@@ -109,264 +668,752 @@ class MMCIF2Dict:
         else:
             return line.strip().split()
 
+    def _filterSingleRows(self, data_block, row_filter, projection):
+        """Remove the categories outside loops whose row row_filter rejects,
+        then the items of the others that projection leaves out, which were
+        kept for the filter; loops are filtered while they are read"""
+        for category, condition in row_filter.items():
+            row = data_block.get(category)
+            if not row or any(
+                isinstance(value, (list, PooledColumn)) for value in row.values()
+            ):
+                continue
+            if not _rowMatches(row, condition):
+                del data_block[category]
+            elif category in projection:
+                for item in list(row):
+                    if item not in projection[category]:
+                        del row[item]
+                if not row:
+                    del data_block[category]
+
     def _parseFile(
-        self, file_path, ignoreCategories, preserve_token_order, onlyCategories
+        self,
+        file_path,
+        ignoreCategories,
+        preserve_token_order,
+        onlyCategories,
+        stop_early=False,
+        only_items=None,
+        row_filter=None,
+        threaded=False,
+        string_pool=None,
     ):
         """Private method that will do the work of parsing the mmCIF data file
         return Dictionary"""
+        try:
+            with open_source(file_path, "rt", threaded) as f1:
+                return self._parseHandle(
+                    f1,
+                    ignoreCategories,
+                    preserve_token_order,
+                    onlyCategories,
+                    stop_early,
+                    only_items,
+                    row_filter,
+                    string_pool,
+                )
+        except IOError as io_err:
+            print("IOException: %s" % str(io_err))
+
+    def _parseHandle(
+        self,
+        f1,
+        ignoreCategories,
+        preserve_token_order,
+        onlyCategories,
+        stop_early=False,
+        only_items=None,
+        row_filter=None,
+        string_pool=None,
+    ):
+        """Private method that will do the work of parsing mmCIF data read
+        from an open text file object
+        return Dictionary"""
+        mmcif_like_file = _ordered_dict() if preserve_token_order else {}
+        try:
+            for data_heading, data_block in self._iterHandle(
+                f1,
+                ignoreCategories,
+                preserve_token_order,
+                onlyCategories,
+                stop_early,
+                only_items,
+                row_filter,
+                string_pool,
+            ):
+                mmcif_like_file[data_heading] = data_block
+            return mmcif_like_file
+        except KeyError as key_err:
+            print("KeyError [line %i]: %s" % (self.line_num, str(key_err)))
+        except IOError as io_err:
+            print("IOException [line %i]: %s" % (self.line_num, str(io_err)))
+
+    def _iterHandle(
+        self,
+        f1,
+        ignoreCategories,
+        preserve_token_order,
+        onlyCategories,
+        stop_early=False,
+        only_items=None,
+        row_filter=None,
+        string_pool=None,
+        batch_size=None,
+    ):
+        """Generator of the (data_heading, data_block) pairs of mmCIF data read
+        from an open text file object, each yielded as soon as the block ends.
+
+        With batch_size, the rows of loops are also yielded as they are read,
+        as (None, batch) pairs where batch maps item names to lists of
+        batch_size values; the data block then holds the rows of each loop
+        after its last whole batch."""
 
         if preserve_token_order:
-            try:
-                from collections import OrderedDict as _dict
-            except ImportError:
-                # fallback: try to use the ordereddict backport when using python 2.6
-                try:
-                    from ordereddict import OrderedDict as _dict
-                except ImportError:
-                    # backport not installed: use local OrderedDict
-                    from mmCif.ordereddict import OrderedDict as _dict
+            _dict = _ordered_dict
         else:
             _dict = dict
 
-        mmcif_like_file = _dict()
         data_block = _dict()
         save_block = _dict()
 
         data_heading = ""
-        line_num = 0
+        reader = _LineReader(f1)
         try:
-            with openGzip(file_path, "rt") as f1:
-                table_names = []
-                table_values = []
-                table_values_array = []
-                isLoop = False
-                multiLineValue = False
-                skipCategory = False
-                for line in f1:
-                    line_num += 1
-                    if skipCategory:
-                        flag = False
-                        while line:
-                            check = (
-                                line.strip().startswith("_")
-                                or self.loopRE.match(line.strip()[:5])
-                                or self.saveRE.match(line.strip()[:5])
-                                or self.dataRE.match(line.strip()[:5])
-                            )
-                            if flag:
-                                if check:
-                                    isLoop = False
-                                    break
-                            else:
-                                if not check:
-                                    flag = True
-                            if not (
-                                self.saveRE.match(line.strip()[:5])
-                                or self.dataRE.match(line.strip()[:5])
-                            ):
-                                try:
-                                    line = next(f1)
-                                    line_num += 1
-                                except StopIteration:
-                                    break
-                            else:
-                                break
-                        skipCategory = False
-
-                    if (
-                        isLoop is True
-                        and table_values_array != []
-                        and (
-                            self.loopRE.match(line) is not None
-                            or (line.strip().startswith("_"))
-                        )
+            table_names = []
+            table_values = []
+            loop_columns = None
+            isLoop = False
+            multiLineValue = False
+            skipCategory = False
+            # Categories of onlyCategories read so far in this data block
+            wanted = set(onlyCategories or []) if stop_early else set()
+            seen = set()
+            # Items to keep for the categories in only_items
+            projection = dict(
+                (category, set(items)) for category, items in (only_items or {}).items()
+            )
+            row_filter = row_filter or {}
+            lines = reader.lines()
+            for line in lines:
+                if skipCategory:
+                    skipCategory = False
+                    # Step over the remaining item names of the ignored loop
+                    while self.boundaryRE.match(line) and not (
+                        self.saveRE.match(line.strip()[:5])
+                        or self.dataRE.match(line.strip()[:5])
                     ):
+                        line = next(lines, "")
+                    if line and not self.boundaryRE.match(line):
+                        # and search ahead for the line that ends its values
+                        line = reader.skip_to(self.nextBoundaryRE)
                         isLoop = False
-                        num_item = len(table_names)
-                        if len(table_values_array) % num_item != 0:
-                            raise MMCIFWrapperSyntaxError(category)
-                        for val_index, item in enumerate(table_names):
-                            data_block[category][item] = table_values_array[
-                                val_index::num_item
-                            ]
-                        table_values_array = []
-
-                    if line.strip() == "":
-                        continue
-                    if line.startswith("#"):
-                        continue
-                    if "\t#" in line or " #" in line and not line.startswith(";"):
-                        new_line = ""
-                        for tok in self.dataValueRE.findall(line):
-                            if not tok.startswith("#"):
-                                new_line += tok + " "
-                            else:
-                                break
-                        # make sure to preserve the fact that ';' was not the first character
-                        line = (
-                            new_line if not new_line.startswith(";") else " " + new_line
+
+                if (
+                    isLoop
+                    and table_names
+                    and line[:1] not in _NOT_PLAIN_LOOP_START
+                    and "'" not in line
+                    and '"' not in line
+                    and "#" not in line
+                ):
+                    # Fast path for a row of plain values: it cannot be a
+                    # keyword, data name, text field or comment line
+                    if loop_columns is None:
+                        loop_columns = _LoopColumns(
+                            table_names,
+                            projection.get(category),
+                            row_filter.get(category),
+                            string_pool,
+                            batch_size,
                         )
-                        # Fails for entries "3snv", "1kmm", "1ser", "2prg", "3oqd"
-                        # line = re.sub(r'\s#.*$', '', line)
-                    if line.startswith(";"):
-                        while "\n;" not in line:
-                            try:
-                                line += next(f1)
-                                line_num += 1
-                            except StopIteration:
-                                break
-                        multiLineValue = True
-                    if self.dataRE.match(line):
-                        if data_block != {}:
-                            if table_values_array != []:
-                                isLoop = False
-                                num_item = len(table_names)
-                                if len(table_values_array) % num_item != 0:
-                                    raise mmCifSyntaxError(category)
-                                for val_index, item in enumerate(table_names):
-                                    data_block[category][item] = table_values_array[
-                                        val_index::num_item
-                                    ]
-                                table_names = []
-                                table_values_array = []
-                            mmcif_like_file[data_heading] = data_block
-                            data_block = _dict()
-                        data_heading = self.dataRE.match(line).group("data_heading")
-                    elif self.saveRE.match(line):
-                        while line.strip() != "save_":
-                            try:
-                                line = next(f1)
-                                line_num += 1
-                            except StopIteration:
-                                break
-                        continue
-                    elif self.loopRE.match(line):
-                        # Save and clear the table_values_array buffer from the
-                        # previous loop that was read
-                        if table_values_array != []:
-                            for itemIndex, name in enumerate(table_names):
-                                data_block[category].update(
-                                    {
-                                        name: [
-                                            row[itemIndex] for row in table_values_array
-                                        ]
-                                    }
-                                )
-                            table_values_array = []
-                        isLoop = True
-                        category, item, value = None, None, None
-                        # Stores items of a category listed in loop blocks
-                        table_names = []
-                        # Stores values of items in a loop as a single row
+                    if table_values:
+                        loop_columns.extend(table_values)
                         table_values = []
-                    elif self.dataNameRE.match(line):
-                        # Two step process STAR does not know contept of categories
-                        m = self.dataNameRE.match(line)
-                        flag = m.group("data_category")
-
-                        tmp_category = self.dataCategoryItem.match(flag)
-                        if tmp_category:
-                            category = tmp_category.group("data_category")
-                            item = tmp_category.group("category_item")
+                    loop_columns.add_line(line)
+                    if loop_columns.batches:
+                        for batch in loop_columns.take_batches():
+                            yield None, batch
+                    continue
+
+                if loop_columns is not None and (
+                    self.loopRE.match(line) is not None
+                    or (line.strip().startswith("_"))
+                ):
+                    isLoop = False
+                    loop_columns.store(data_block[category], category)
+                    for batch in loop_columns.take_batches():
+                        yield None, batch
+                    loop_columns = None
+
+                if line.strip() == "":
+                    continue
+                if line.startswith("#"):
+                    continue
+                if "\t#" in line or " #" in line and not line.startswith(";"):
+                    new_line = ""
+                    for tok in self.dataValueRE.findall(line):
+                        if not tok.startswith("#"):
+                            new_line += tok + " "
                         else:
-                            category = ""
-                            item = flag
-
-                        remainder = m.group("remainder")
-                        value = None
-                        if isLoop and remainder != "":
-                            """Append any data values following the last loop
-                            category.item tag should any exist"""
-                            table_values += self._tokenizeData(remainder)
-                            line = ""
+                            break
+                    # make sure to preserve the fact that ';' was not the first character
+                    line = (
+                        new_line if not new_line.startswith(";") else " " + new_line
+                    )
+                    # Fails for entries "3snv", "1kmm", "1ser", "2prg", "3oqd"
+                    # line = re.sub(r'\s#.*$', '', line)
+                if line.startswith(";"):
+                    while "\n;" not in line:
+                        try:
+                            line += next(lines)
+                        except StopIteration:
+                            break
+                    multiLineValue = True
+                if self.dataRE.match(line):
+                    if data_block != {}:
+                        if loop_columns is not None:
+                            isLoop = False
+                            loop_columns.store(data_block[category], category)
+                            for batch in loop_columns.take_batches():
+                                yield None, batch
+                            table_names = []
+                            loop_columns = None
+                        self._filterSingleRows(data_block, row_filter, projection)
+                        yield data_heading, data_block
+                        data_block = _dict()
+                    data_heading = self.dataRE.match(line).group("data_heading")
+                    seen = set()
+                elif self.saveRE.match(line):
+                    while line.strip() != "save_":
+                        try:
+                            line = next(lines)
+                        except StopIteration:
+                            break
+                    continue
+                elif self.loopRE.match(line):
+                    isLoop = True
+                    category, item, value = None, None, None
+                    # Stores items of a category listed in loop blocks
+                    table_names = []
+                    # Stores values of items in a loop as a single row
+                    table_values = []
+                elif self.dataNameRE.match(line):
+                    # Two step process STAR does not know contept of categories
+                    m = self.dataNameRE.match(line)
+                    flag = m.group("data_category")
+
+                    tmp_category = self.dataCategoryItem.match(flag)
+                    if tmp_category:
+                        category = tmp_category.group("data_category")
+                        item = tmp_category.group("category_item")
+                    else:
+                        category = ""
+                        item = flag
+
+                    if wanted:
+                        if category in wanted:
+                            seen.add(category)
+                        elif len(seen) == len(wanted):
+                            # Everything asked for has been read
+                            break
+
+                    remainder = m.group("remainder")
+                    value = None
+                    if isLoop and remainder != "":
+                        """Append any data values following the last loop
+                        category.item tag should any exist"""
+                        table_values += self._tokenizeData(remainder)
+                        line = ""
+                    else:
+                        line = remainder + "\n"
+                    if not isLoop:
+                        if line.strip() != "":
+                            value = self._tokenizeData(line)
                         else:
-                            line = remainder + "\n"
-                        if not isLoop:
-                            if line.strip() != "":
-                                value = self._tokenizeData(line)
-                            else:
-                                # For cases where values are on the following
-                                # line
+                            # For cases where values are on the following
+                            # line
+                            try:
+                                line = next(lines)
+                            except StopIteration:
+                                break
+                        while value is None:
+                            char_start = 1 if line.startswith(";") else 0
+                            while line.startswith(
+                                ";"
+                            ) and not line.rstrip().endswith("\n;"):
                                 try:
-                                    line = next(f1)
-                                    line_num += 1
+                                    line += next(lines)
                                 except StopIteration:
                                     break
-                            while value is None:
-                                char_start = 1 if line.startswith(";") else 0
-                                while line.startswith(
-                                    ";"
-                                ) and not line.rstrip().endswith("\n;"):
-                                    try:
-                                        line += next(f1)
-                                        line_num += 1
-                                    except StopIteration:
-                                        break
-                                value = (line[char_start : line.rfind("\n;")]).strip()
-                                if char_start > 0:
-                                    value = (
-                                        line[char_start : line.rfind("\n;")]
-                                    ).strip()
-                                else:
-                                    value = self._tokenizeData(" " + line)
-                            if (ignoreCategories and category in ignoreCategories) or (
-                                onlyCategories and category not in onlyCategories
-                            ):
-                                pass
+                            value = (line[char_start : line.rfind("\n;")]).strip()
+                            if char_start > 0:
+                                value = (
+                                    line[char_start : line.rfind("\n;")]
+                                ).strip()
                             else:
-                                if category in data_block:
-                                    data_block[category].update(
-                                        {item: value if len(value) > 1 else value[0]}
-                                    )
-                                else:
-                                    data_block.setdefault(
-                                        category,
-                                        _dict(
-                                            {
-                                                item: value
-                                                if len(value) > 1
-                                                else value[0]
-                                            }
-                                        ),
-                                    )  # OrderedDict here preserves item order
+                                value = self._tokenizeData(" " + line)
+                        if (
+                            (ignoreCategories and category in ignoreCategories)
+                            or (onlyCategories and category not in onlyCategories)
+                            or (
+                                category in projection
+                                and item not in projection[category]
+                                # Kept until the row filter has been applied
+                                and category not in row_filter
+                            )
+                        ):
+                            pass
                         else:
-                            if (ignoreCategories and category in ignoreCategories) or (
-                                onlyCategories and category not in onlyCategories
-                            ):
-                                skipCategory = True
+                            if category in data_block:
+                                data_block[category].update(
+                                    {item: value if len(value) > 1 else value[0]}
+                                )
                             else:
                                 data_block.setdefault(
-                                    category, _dict()
+                                    category,
+                                    _dict(
+                                        {
+                                            item: value
+                                            if len(value) > 1
+                                            else value[0]
+                                        }
+                                    ),
                                 )  # OrderedDict here preserves item order
-                                table_names.append(item)
                     else:
-                        if multiLineValue is True:
-                            table_values.append((line[1 : line.rfind("\n;")]).strip())
-                            multiLineValue = False
-                            line = line[line.rfind("\n;") + 2 :]
-                            if line.strip() != "":
-                                table_values += self._tokenizeData(line)
+                        if (ignoreCategories and category in ignoreCategories) or (
+                            onlyCategories and category not in onlyCategories
+                        ):
+                            skipCategory = True
                         else:
+                            data_block.setdefault(
+                                category, _dict()
+                            )  # OrderedDict here preserves item order
+                            table_names.append(item)
+                else:
+                    if multiLineValue is True:
+                        table_values.append((line[1 : line.rfind("\n;")]).strip())
+                        multiLineValue = False
+                        line = line[line.rfind("\n;") + 2 :]
+                        if line.strip() != "":
                             table_values += self._tokenizeData(line)
+                    else:
+                        table_values += self._tokenizeData(line)
 
-                        if table_values != []:
-                            table_values_array += table_values
-                            table_values = []
-                if isLoop is True and table_values_array != []:
-                    isLoop = False
-                    num_item = len(table_names)
-                    for val_index, item in enumerate(table_names):
-                        data_block[category][item] = table_values_array[
-                            val_index::num_item
-                        ]
-                    table_values_array = []
-                if data_block != {}:
-                    mmcif_like_file[data_heading] = data_block
-            return mmcif_like_file
-        except KeyError as key_err:
-            print("KeyError [line %i]: %s" % (line_num, str(key_err)))
-        except IOError as io_err:
-            print("IOException [line %i]: %s" % (line_num, str(io_err)))
+                    if table_values != [] and isLoop and table_names:
+                        if loop_columns is None:
+                            loop_columns = _LoopColumns(
+                            table_names,
+                            projection.get(category),
+                            row_filter.get(category),
+                            string_pool,
+                            batch_size,
+                        )
+                        loop_columns.extend(table_values)
+                        table_values = []
+                        if loop_columns.batches:
+                            for batch in loop_columns.take_batches():
+                                yield None, batch
+            if loop_columns is not None:
+                isLoop = False
+                loop_columns.store(data_block[category], category)
+                for batch in loop_columns.take_batches():
+                    yield None, batch
+                loop_columns = None
+            self._filterSingleRows(data_block, row_filter, projection)
+            if data_block != {}:
+                yield data_heading, data_block
+        except (KeyError, IOError):
+            # Reported by the caller
+            self.line_num = reader.line_num
+            raise
+        except MMCIFWrapperSyntaxError as err:
+            self.line_num = err.lineno = reader.line_num
+            raise
+
+
+def _isSource(file_path):
+    """True if file_path can be read: an existing file, or CIF data or a file
+    object rather than a path"""
+    if is_cif_path(file_path):
+        return os.path.exists(file_path) and os.path.isfile(file_path)
+    return True
+
+
+def _iterRowBatches(f1, category, batch_size):
+    """Generator of the rows of a category in an open text file object, in
+    batches of at most batch_size rows that never span two loops (see
+    pdbecif.mmcif_io.iter_rows)"""
+    for data_heading, data_block in MMCIF2Dict()._iterHandle(
+        f1, [], False, [category], batch_size=batch_size
+    ):
+        if data_heading is None:
+            yield data_block
+            continue
+        # Single values are strings; the loop columns are left empty when
+        # all of their rows went out in whole batches
+        batch = dict(
+            (item, value if isinstance(value, list) else [value])
+            for item, value in data_block.get(category, {}).items()
+        )
+        if batch and all(batch.values()):
+            yield batch
+
+
+def _onlyCategories(lazy, onlyCategories, preserve_token_order):
+    """The result of MMCIF2Dict.parse() with onlyCategories, read from a
+    LazyMMCIFDict"""
+    _dict = _ordered_dict if preserve_token_order else dict
+    mmcif_like_file = _dict()
+    for data_heading, block in lazy.items():
+        data_block = _dict()
+        for category in block:
+            if category in onlyCategories:
+                data_block[category] = block[category]
+        if data_block:
+            mmcif_like_file[data_heading] = data_block
+    return mmcif_like_file
+
+
+def _selectCategories(mmcif_dict, onlyCategories, ignoreCategories, preserve):
+    """mmcif_dict with only the categories MMCIF2Dict.parse() would keep for
+    onlyCategories and ignoreCategories, dropping blocks left empty"""
+    _dict = _ordered_dict if preserve else dict
+    selected = _dict()
+    for data_heading, block in mmcif_dict.items():
+        data_block = _dict()
+        for category, values in block.items():
+            if onlyCategories and category not in onlyCategories:
+                continue
+            if ignoreCategories and category in ignoreCategories:
+                continue
+            data_block[category] = values if preserve else dict(values)
+        if data_block:
+            selected[data_heading] = data_block
+    return selected
+
+
+def _filterParsed(mmcif_like_file, only_items, row_filter):
+    """Apply only_items and row_filter (see MMCIF2Dict.parse) to data that
+    has already been read in full, such as BinaryCIF, in place"""
+    for data_block in mmcif_like_file.values():
+        for category, condition in (row_filter or {}).items():
+            values = data_block.get(category)
+            if not values:
+                continue
+            if not any(isinstance(value, list) for value in values.values()):
+                if not _rowMatches(values, condition):
+                    del data_block[category]
+                continue
+            names = list(values)
+            columns = [values[name] for name in names]
+            keep = [
+                _rowMatches(dict(zip(names, row)), condition) for row in zip(*columns)
+            ]
+            for name, column in zip(names, columns):
+                values[name] = list(compress(column, keep))
+        for category, items in (only_items or {}).items():
+            values = data_block.get(category)
+            for item in list(values or ()):
+                if item not in items:
+                    del values[item]
+    return mmcif_like_file
+
+
+# Start of a line that can begin or end a category span: a data block, save
+# frame, loop or data name, or a semi-colon that opens or closes a text field.
+# The second form matches from the newline that ends the previous line, which
+# makes searching ahead much faster than a multi-line ^ anchor.
+_SPAN_BOUNDARY = (
+    br"(?:[ \t]*(?:(?P<data>[Dd][Aa][Tt][Aa]_)|(?P<save>[Ss][Aa][Vv][Ee]_)"
+    br"|(?P<loop>[Ll][Oo][Oo][Pp]_)|(?P<name>_\S+))|(?P<text>;))"
+)
+_spanLineRE = re.compile(_SPAN_BOUNDARY)
+_spanNextRE = re.compile(br"\n" + _SPAN_BOUNDARY)
+
+
+def _categorySpans(data):
+    """
+    Scan the bytes of an mmCIF file for the (start, end) byte spans of the
+    categories in each data block, following the same rules as
+    MMCIF2Dict.parse(): save frames are skipped, and data before the first
+    data_ heading belongs to a block named "".
+
+    Returns a list of (data_heading, spans) pairs, where spans is an ordered
+    dictionary of category names to lists of spans.
+    """
+    scanner = _CategorySpanScanner()
+    scanner.feed(data)
+    return scanner.finish()
+
+
+class _CategorySpanScanner(object):
+
+    """
+    _categorySpans() for data given in pieces, such as the output of a
+    decompressor, so that the whole of it is never held at once. Complete
+    lines are scanned as they are fed; only the last, incomplete line of a
+    piece is kept until the next one.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.spans = None
+        self.current = None
+        self.loop_start = None
+        self.in_text = self.in_save = False
+        # Offset of self.tail in the whole data
+        self.offset = 0
+        self.tail = b""
+
+    def feed(self, data):
+        if self.tail:
+            data = self.tail + data
+        end = data.rfind(b"\n") + 1
+        if end:
+            self._scan(data, end)
+        self.offset += end
+        self.tail = data[end:]
+
+    def finish(self):
+        """The (data_heading, spans) pairs of the data fed"""
+        if self.tail:
+            self._scan(self.tail, len(self.tail))
+        self._close(self.offset + len(self.tail))
+        return self.blocks
+
+    def _close(self, end):
+        if self.current is not None:
+            self.spans.setdefault(self.current[0], []).append(
+                (self.current[1], end)
+            )
+
+    def _matches(self, data, end):
+        m = _spanLineRE.match(data, 0, end)
+        if m is not None:
+            yield 0, m
+        pos = 0
+        while True:
+            m = _spanNextRE.search(data, pos, end)
+            if m is None:
+                return
+            yield m.start() + 1, m
+            pos = m.end()
+
+    def _scan(self, data, end):
+        """Scan the lines in data[:end], which ends at the end of a line"""
+        offset = self.offset
+        for start, m in self._matches(data, end):
+            if self.in_text:
+                if m.group("text") and data[m.end() : m.end() + 1] in (
+                    b"",
+                    b" ",
+                    b"\t",
+                    b"\r",
+                    b"\n",
+                ):
+                    self.in_text = False
+                continue
+            eol = data.find(b"\n", start, end)
+            line = data[start : eol if eol >= 0 else end]
+            if self.in_save:
+                # MMCIF2Dict skips everything up to a bare save_ line
+                if m.group("save") and line.strip() == b"save_":
+                    self.in_save = False
+                continue
+            start += offset
+            if m.group("text"):
+                self.in_text = True
+            elif m.group("data"):
+                self._close(start)
+                self.current = self.loop_start = None
+                heading = MMCIF2Dict.dataRE.match(line.decode("utf-8").rstrip("\r"))
+                self.spans = _ordered_dict()
+                self.blocks.append((heading.group("data_heading"), self.spans))
+            elif m.group("save"):
+                if line.strip() != b"save_":
+                    self._close(start)
+                    self.current = self.loop_start = None
+                    self.in_save = True
+            elif m.group("loop"):
+                self._close(start)
+                self.current = None
+                self.loop_start = start
+            else:
+                name = m.group("name").decode("utf-8")
+                category_item = MMCIF2Dict.dataCategoryItem.match(name)
+                if category_item:
+                    category = category_item.group("data_category")
+                else:
+                    category = ""
+                if self.spans is None:
+                    self.spans = _ordered_dict()
+                    self.blocks.append(("", self.spans))
+                current = self.current
+                if self.loop_start is not None:
+                    # The first item name of a loop
+                    self.current = (category, self.loop_start)
+                    self.loop_start = None
+                elif current is None or current[0] != category:
+                    self._close(start)
+                    self.current = (category, start)
+
+
+class LazyMMCIFDict(Mapping):
+    """
+    The data blocks of an mmCIF file as returned by MMCIF2Dict.parse_lazy().
+
+    It maps data block headings to LazyMMCIFBlock objects, which map the
+    category names of the block to the same dictionaries as parse() would
+    return for them. A category is parsed the first time it is looked up and
+    kept from then on.
+
+    The file stays mapped until close() is called (or the with statement
+    the object is used in ends).
+
+    With use_index, index is the sidecar index the category spans were read
+    from (see pdbecif.mmcif_index), which for an uncompressed file also
+    gives the items and row count of each category without parsing it.
+    """
+
+    def __init__(self, file_path, preserve_token_order=False, use_index=False):
+        self.file_path = file_path if is_cif_path(file_path) else None
+        self.preserve_token_order = preserve_token_order
+        self._blocks = _ordered_dict() if preserve_token_order else {}
+        # The sidecar index the spans were read from, if any
+        self.index = None
+        blocks = None
+        use_index = use_index and is_cif_path(file_path)
+        if use_index and compression(file_path) == "gzip":
+            from pdbecif.mmcif_index import IndexedGzipReader, gzip_index
+
+            self.index = gzip_index(file_path)
+        if self.index is not None:
+            self._data = IndexedGzipReader(file_path, self.index)
+            blocks = self.index.blocks
+        elif not is_cif_path(file_path):
+            # BytesIO reads back the bytes it wraps without copying them
+            with open_source(file_path, "rb") as f:
+                self._data = f.read()
+        elif compression(file_path) is not None:
+            with open_compressed(file_path, "rb") as f:
+                self._data = f.read()
+        else:
+            if use_index:
+                from pdbecif.mmcif_index import category_index
+
+                self.index = category_index(file_path)
+                blocks = self.index.spans()
+            with open(file_path, "rb") as f:
+                try:
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty files cannot be mapped
+                    self._data = b""
+        if blocks is None:
+            blocks = _categorySpans(self._data)
+        for heading, spans in blocks:
+            if spans:
+                self._blocks[heading] = LazyMMCIFBlock(self, spans)
+
+    def __getitem__(self, block_id):
+        return self._blocks[block_id]
+
+    def __iter__(self):
+        return iter(self._blocks)
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __contains__(self, block_id):
+        return block_id in self._blocks
+
+    def close(self):
+        if hasattr(self._data, "close"):
+            self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LazyMMCIFBlock(Mapping):
+    """
+    The categories of one data block of a LazyMMCIFDict, parsed on demand.
+    """
+
+    def __init__(self, source, spans):
+        self._source = source
+        self._spans = spans
+        self._categories = {}
+
+    def __getitem__(self, category):
+        try:
+            return self._categories[category]
+        except KeyError:
+            pass
+        values = _parseSpans(
+            self._source._data,
+            self._spans[category],
+            category,
+            self._source.preserve_token_order,
+        )
+        self._categories[category] = values
+        return values
+
+    def __iter__(self):
+        return iter(self._spans)
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, category):
+        return category in self._spans
+
+
+def _parseSpans(data, spans, category, preserve_token_order):
+    """Parse the values of a category from its (start, end) spans in data,
+    as found by _categorySpans()"""
+    values = _ordered_dict() if preserve_token_order else {}
+    for start, end in spans:
+        text = data[start:end].decode("utf-8")
+        parsed = MMCIF2Dict()._parseHandle(
+            io.StringIO(text, newline=None),
+            [],
+            preserve_token_order,
+            [category],
+        )
+        if parsed:
+            values.update(parsed.get("", {}).get(category, {}))
+    return values
+
+
+def _parseRange(task):
+    """Worker for MMCIF2Dict._parseFileParallel: parse the data blocks in a
+    byte range of a file"""
+    (
+        file_path,
+        start,
+        end,
+        ignoreCategories,
+        preserve_token_order,
+        onlyCategories,
+        only_items,
+        row_filter,
+    ) = task
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return MMCIF2Dict()._parseHandle(
+        io.StringIO(data.decode("utf-8"), newline=None),
+        ignoreCategories,
+        preserve_token_order,
+        onlyCategories,
+        only_items=only_items,
+        row_filter=row_filter,
+    )
 
 
 #        except StopIteration as gen_err:
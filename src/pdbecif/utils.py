@@ -1,7 +1,50 @@
 __author__ = "Glen van Ginkel (Protein Data Bank in Europe; http://pdbe.org)"
 
 import gzip
+import io
 import mimetypes
+import codecs
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # Python 2 without the futures backport: no worker processes
+    ProcessPoolExecutor = None
+
+DEFAULT_BUFFER_SIZE = 1 << 16
+
+# Type of text strings: str, or unicode on Python 2 where str is bytes
+_text = type(u"")
+
+# White space or a data block heading, only ever found in CIF text if a string
+# that is not the name of an existing file holds either
+_cif_text = re.compile(r"\s|^(?:[Dd][Aa][Tt][Aa]|[Gg][Ll][Oo][Bb][Aa][Ll])_")
+
+# Start of a line that opens a data block or opens or closes a text field
+_block_scan = re.compile(br"^(?:([Dd][Aa][Tt][Aa]_)|;)", re.M)
 
 
 def get_column(mat, i):
@@ -28,13 +71,511 @@ def pretty_print(mat, transpose=False):
     return "\n".join(out)
 
 
+def is_gzip(file_path):
+    return mimetypes.guess_type(file_path)[1] == "gzip"
+
+
 def openGzip(file_path, mode="rt"):
     try:
+        if "r" in mode:
+            return open_compressed(file_path, mode)
         return (
-            gzip.open(file_path, mode)
-            if mimetypes.guess_type(file_path)[1] == "gzip"
-            else open(file_path, mode)
+            gzip.open(file_path, mode) if is_gzip(file_path) else open(file_path, mode)
         )
     except Exception as gzip_io_error:
         print("[Error opening mmCIF file]: %s" % gzip_io_error.message)
         return None
+
+
+# Leading bytes of the compressed formats that can be read
+_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"))
+
+
+def sniff_compression(head):
+    """Compression format of data starting with the bytes head: "gzip", "bz2",
+    "xz" or None. Formats whose module is missing from this Python are not
+    recognised."""
+    for magic, fmt in _MAGIC:
+        if head[: len(magic)] == magic:
+            if fmt == "bz2" and bz2 is None or fmt == "xz" and lzma is None:
+                return None
+            return fmt
+    return None
+
+
+def compression(file_path):
+    """Compression format of a file from its leading bytes rather than its
+    name, as for sniff_compression()"""
+    with open(file_path, "rb") as f:
+        return sniff_compression(f.read(6))
+
+
+def _decompressor(fmt):
+    if fmt == "gzip":
+        # The gzip header and trailer are checked by zlib itself
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if fmt == "bz2":
+        return bz2.BZ2Decompressor()
+    return lzma.LZMADecompressor()
+
+
+class DecompressedReader(io.RawIOBase):
+
+    """
+    Raw stream of the decompressed data of a compressed binary file object.
+
+    The compressed data is read in blocks of BLOCK_SIZE bytes and inflated
+    with a single decompressor object per stream, which avoids the per-read
+    overhead of gzip.open() (and its separate CRC pass). Concatenated
+    streams, as written by bgzip or `cat a.gz b.gz`, are read one after the
+    other. The file object is closed with the reader only if close_file.
+    """
+
+    BLOCK_SIZE = 1 << 18
+
+    def __init__(self, fileobj, fmt, close_file=False):
+        io.RawIOBase.__init__(self)
+        self._fileobj = fileobj
+        self._fmt = fmt
+        self._close_file = close_file
+        self._decompressor = _decompressor(fmt)
+        self._data = b""
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos == len(self._data):
+            if not self._fill():
+                return 0
+        n = min(len(b), len(self._data) - self._pos)
+        b[:n] = self._data[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def readall(self):
+        chunks = [self._data[self._pos :]]
+        while self._fill():
+            chunks.append(self._data)
+        self._pos = len(self._data)
+        return b"".join(chunks)
+
+    def _fill(self):
+        """Decompress the next block into self._data; False at the end"""
+        data = b""
+        while not data:
+            compressed = self._fileobj.read(self.BLOCK_SIZE)
+            if not compressed:
+                if self._ended() is False:
+                    raise EOFError(
+                        "Compressed file ended before the end-of-stream marker "
+                        "was reached"
+                    )
+                return False
+            if self._ended() and not self._decompressor.unused_data:
+                # The last stream ended exactly at the end of the last block
+                self._decompressor = _decompressor(self._fmt)
+            try:
+                data = self._decompressor.decompress(compressed)
+            except EOFError:
+                # Python 2 bz2 only shows that the stream had ended so
+                self._decompressor = _decompressor(self._fmt)
+                data = self._decompressor.decompress(compressed)
+            while self._ended():
+                unused = self._decompressor.unused_data
+                if not unused.strip(b"\x00"):
+                    # gzip allows zero padding after the last member
+                    break
+                self._decompressor = _decompressor(self._fmt)
+                data += self._decompressor.decompress(unused)
+        self._data = data
+        self._pos = 0
+        return True
+
+    def _ended(self):
+        """Whether the current stream has ended, or None if that cannot be
+        told"""
+        try:
+            return self._decompressor.eof
+        except AttributeError:
+            # Python 2 decompressors only show it by the data after the end
+            return True if self._decompressor.unused_data else None
+
+    def close(self):
+        if not self.closed and self._close_file:
+            self._fileobj.close()
+        io.RawIOBase.close(self)
+
+
+class _Prefetcher(object):
+
+    """
+    Background thread that reads blocks from a binary file object into a
+    bounded queue, decoding them as UTF-8 text (with universal newlines)
+    unless binary. zlib, bz2 and lzma release the GIL while they work, so
+    decompression in the thread overlaps with parsing in the caller's.
+    """
+
+    def __init__(self, fileobj, binary, block_size, queue_size):
+        self._queue = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(fileobj, binary, block_size)
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, fileobj, binary, block_size):
+        try:
+            decoder = None
+            if not binary:
+                decoder = io.IncrementalNewlineDecoder(
+                    codecs.getincrementaldecoder("utf-8")(), True
+                )
+            while True:
+                raw = fileobj.read(block_size)
+                block = raw if binary else decoder.decode(raw, final=not raw)
+                if block and not self._put(block):
+                    return
+                if not raw:
+                    break
+            self._put(None)
+        except Exception as error:
+            self._put(error)
+
+    def _put(self, item):
+        """Queue item, waiting for room unless the reader is closed"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self):
+        """The next block, or None at the end of the data. Errors of the
+        thread are raised here."""
+        item = self._queue.get()
+        if isinstance(item, Exception):
+            self._queue.put(None)
+            raise item
+        if item is None:
+            # Later calls see the end again
+            self._queue.put(None)
+        return item
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class BackgroundReader(io.TextIOBase):
+
+    """
+    Text stream whose data is read, decompressed and decoded from a binary
+    file object by a background thread, BLOCK_SIZE bytes at a time, with at
+    most QUEUE_SIZE blocks waiting. Supports read() and readline(). The file
+    object is closed with the reader only if close_file.
+    """
+
+    BLOCK_SIZE = 1 << 20
+    QUEUE_SIZE = 4
+
+    def __init__(self, fileobj, close_file=False):
+        io.TextIOBase.__init__(self)
+        self._fileobj = fileobj
+        self._close_file = close_file
+        self._prefetcher = _Prefetcher(
+            fileobj, False, self.BLOCK_SIZE, self.QUEUE_SIZE
+        )
+        self._buffer = ""
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        """Append the next block to the buffer; False at the end"""
+        block = self._prefetcher.get()
+        if block is None:
+            return False
+        self._buffer = self._buffer[self._pos :] + block
+        self._pos = 0
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            end = len(self._buffer)
+        else:
+            while len(self._buffer) - self._pos < size and self._fill():
+                pass
+            end = min(self._pos + size, len(self._buffer))
+        data = self._buffer[self._pos : end]
+        self._pos = end
+        return data
+
+    def readline(self, size=-1):
+        searched = self._pos
+        while True:
+            end = self._buffer.find("\n", searched) + 1
+            if end:
+                break
+            # The buffer is rebased on the current position when filled
+            searched = len(self._buffer) - self._pos
+            if not self._fill():
+                end = len(self._buffer)
+                break
+        if size is not None and 0 <= size < end - self._pos:
+            end = self._pos + size
+        data = self._buffer[self._pos : end]
+        self._pos = end
+        return data
+
+    def close(self):
+        if not self.closed:
+            self._prefetcher.close()
+            if self._close_file:
+                self._fileobj.close()
+        io.TextIOBase.close(self)
+
+
+class BackgroundRawReader(io.RawIOBase):
+
+    """
+    Binary counterpart of BackgroundReader: raw stream of the blocks read,
+    and decompressed, from a binary file object by a background thread.
+    """
+
+    BLOCK_SIZE = BackgroundReader.BLOCK_SIZE
+    QUEUE_SIZE = BackgroundReader.QUEUE_SIZE
+
+    def __init__(self, fileobj, close_file=False):
+        io.RawIOBase.__init__(self)
+        self._fileobj = fileobj
+        self._close_file = close_file
+        self._prefetcher = _Prefetcher(
+            fileobj, True, self.BLOCK_SIZE, self.QUEUE_SIZE
+        )
+        self._data = b""
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos == len(self._data):
+            block = self._prefetcher.get()
+            if block is None:
+                return 0
+            self._data = block
+            self._pos = 0
+        n = min(len(b), len(self._data) - self._pos)
+        b[:n] = self._data[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._prefetcher.close()
+            if self._close_file:
+                self._fileobj.close()
+        io.RawIOBase.close(self)
+
+
+def decompressed(fileobj, fmt, mode="rb", close_file=False, threaded=False):
+    """Buffered binary ("rb") or UTF-8 text ("rt") stream of the decompressed
+    data of a binary file object compressed with fmt. Closing it closes
+    fileobj only if close_file. With threaded, decompression and decoding
+    happen in a background thread (see BackgroundReader)."""
+    raw = DecompressedReader(fileobj, fmt, close_file)
+    if threaded:
+        if "b" in mode:
+            return io.BufferedReader(
+                BackgroundRawReader(raw, close_file=True), DEFAULT_BUFFER_SIZE
+            )
+        return BackgroundReader(raw, close_file=True)
+    f = io.BufferedReader(raw, DEFAULT_BUFFER_SIZE)
+    if "b" in mode:
+        return f
+    return io.TextIOWrapper(f, encoding="utf-8")
+
+
+def open_compressed(file_path, mode="rb", threaded=False):
+    """Open a file for reading in binary ("rb") or text ("rt") mode,
+    decompressing it if its leading bytes show it to be gzip, bz2 or xz
+    compressed, whatever its name. With threaded, a compressed file is
+    decompressed in a background thread."""
+    fmt = compression(file_path)
+    if fmt is None:
+        return open(file_path, mode)
+    return decompressed(
+        open(file_path, "rb"), fmt, mode, close_file=True, threaded=threaded
+    )
+
+
+def is_cif_path(source):
+    """True if a CIF source names a file rather than holding CIF text or being
+    a file object. A string is taken as a file name when it names an existing
+    file, or when it could not be CIF text, having no white space and not
+    starting a data block, so that a missing file is reported as such."""
+    if not isinstance(source, (str, _text)):
+        return hasattr(source, "__fspath__")
+    if "\n" in source:
+        return False
+    if isinstance(source, bytes) and sniff_compression(source[:6]) is not None:
+        # Compressed data in a Python 2 str need not hold a line break
+        return False
+    try:
+        if os.path.isfile(source):
+            return True
+    except (TypeError, ValueError):
+        # Null characters, which no file name holds
+        return False
+    return not _cif_text.search(source)
+
+
+@contextmanager
+def open_source(source, mode="rt", threaded=False):
+    """Open a CIF source for reading in text ("rt") or binary ("rb") mode.
+
+    source may be the path of a file, CIF text as str or bytes, or a file
+    object open in either mode, such as the result of gzip.open(). Files,
+    bytes and binary file objects that hold gzip, bz2 or xz compressed data
+    are decompressed, whatever their name, in a background
+    thread if threaded. Bytes are read in place rather than copied. Only
+    files that are opened here are closed on exit.
+    """
+    binary = "b" in mode
+    if is_cif_path(source):
+        with open_compressed(source, mode, threaded) as f:
+            yield f
+        return
+
+    # Wrappers of the caller's file object, detached on exit to leave it open
+    wrappers = []
+    # Decompressed stream over the caller's data, to be closed on exit
+    stream = None
+    if isinstance(source, _text):
+        f = (
+            io.BytesIO(source.encode("utf-8"))
+            if binary
+            else io.StringIO(source, newline=None)
+        )
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        f = io.BytesIO(source)
+        fmt = sniff_compression(bytes(source[:6]))
+        if fmt is not None:
+            f = stream = decompressed(f, fmt, mode, threaded=threaded)
+        elif not binary:
+            f = io.TextIOWrapper(f, encoding="utf-8")
+    elif isinstance(source, io.TextIOBase) and binary:
+        f = getattr(source, "buffer", None)
+        if f is None:
+            f = io.BytesIO(source.read().encode("utf-8"))
+    elif not isinstance(source, io.TextIOBase):
+        fmt, f = _sniffStream(source)
+        if f is not source:
+            wrappers.append(f)
+        if fmt is not None:
+            f = stream = decompressed(f, fmt, mode, threaded=threaded)
+        elif not binary and isinstance(f, io.IOBase):
+            # Python 2 file objects are read as they are, as byte strings
+            f = io.TextIOWrapper(f, encoding="utf-8")
+            wrappers.append(f)
+    elif isinstance(source, io.StringIO):
+        # Line endings are translated as they are in files opened in text
+        # mode, which a StringIO only does if made with newline=None
+        f = io.StringIO(source.read(), newline=None)
+    else:
+        f = source
+    try:
+        yield f
+    finally:
+        if stream is not None:
+            stream.close()
+        for wrapper in reversed(wrappers):
+            wrapper.detach()
+
+
+def _sniffStream(source):
+    """(compression format or None, binary stream to read from) for a binary
+    file object, whose leading bytes are looked at without consuming them"""
+    if hasattr(source, "peek"):
+        return sniff_compression(source.peek(6)[:6]), source
+    if isinstance(source, io.IOBase):
+        # The buffer also gives the read1() TextIOWrapper needs on Python 2
+        source = io.BufferedReader(source)
+        return sniff_compression(source.peek(6)[:6]), source
+    # Python 2 file objects
+    try:
+        start = source.tell()
+    except (AttributeError, IOError):
+        return None, source
+    head = source.read(6)
+    source.seek(start)
+    return sniff_compression(head), source
+
+
+def block_offsets(data):
+    """Byte offsets of the data_ headings that start a line in data, skipping
+    any inside semi-colon delimited text fields"""
+    offsets = []
+    in_text = False
+    for m in _block_scan.finditer(data):
+        if m.group(1):
+            if not in_text:
+                offsets.append(m.start())
+        elif not in_text:
+            in_text = True
+        elif data[m.end() : m.end() + 1] in (b"", b" ", b"\t", b"\r", b"\n"):
+            in_text = False
+    return offsets
+
+
+def cpu_count():
+    """Number of CPUs, the default number of worker processes"""
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def mtime_ns(stat):
+    """Modification time of an os.stat() result in integer nanoseconds.
+    Python 2 gives only a float of seconds, which is rounded to the whole
+    microseconds that os.utime() sets there."""
+    try:
+        return stat.st_mtime_ns
+    except AttributeError:
+        return int(round(stat.st_mtime * 1e6)) * 1000
+
+
+def block_ranges(file_path, parts):
+    """Split an uncompressed file into at most parts (start, end) byte ranges
+    of similar size, each of which begins with a data block. The first range
+    always starts at 0 so that any leading comments are kept."""
+    with open(file_path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return []
+        try:
+            offsets = block_offsets(data)
+            size = len(data)
+        finally:
+            data.close()
+
+    target = float(size) / max(parts, 1)
+    ranges = []
+    start = 0
+    for offset in offsets[1:]:
+        if offset - start >= target:
+            ranges.append((start, offset))
+            start = offset
+    ranges.append((start, size))
+    return ranges
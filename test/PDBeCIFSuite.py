@@ -13,6 +13,14 @@ from test import (
     test_CifFile,
     test_CifFileReader,
     test_CifFileIO,
+    test_MMCIF2Dict,
+    test_StarTokeniser,
+    test_utils,
+    test_mmcif_index,
+    test_mmcif_cache,
+    test_bcif,
+    test_mmcif_columns,
+    test_mmcif_arrays,
 )
 
 
@@ -35,6 +43,14 @@ class PDBeCIFSuite(unittest.TestCase):
         PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_CIFWrapperTable))
         PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_CifFileIO))
         PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_CifFileReader))
+        PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_MMCIF2Dict))
+        PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_StarTokeniser))
+        PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_utils))
+        PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_mmcif_index))
+        PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_mmcif_cache))
+        PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_bcif))
+        PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_mmcif_columns))
+        PDBeCIF_Suite.addTests(loader.loadTestsFromModule(test_mmcif_arrays))
         return PDBeCIF_Suite
 
     def _run(self):
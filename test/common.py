@@ -1,9 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import bz2
+import gzip
+import io
+import os
 import unittest
 from operator import attrgetter
 from pdbecif.mmcif import Category, Item, SaveFrame
+from pdbecif.utils import mtime_ns
+
+try:
+    import lzma
+except ImportError:
+    # Python 2
+    lzma = None
 
 
 # Sorts in place
@@ -21,3 +32,45 @@ def assert_equal(l1, l2, msg):
 
     t = unittest.TestCase("__str__")
     return t.assertEqual(l1, l2, msg)
+
+
+def set_mtime(path, stat, seconds=0):
+    """Give path the times of an os.stat() result, with the modification time
+    moved on by seconds"""
+    if hasattr(stat, "st_mtime_ns"):
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+    else:
+        # Python 2 sets whole microseconds; aim for the middle of the one
+        # mtime_ns() gives so that float rounding cannot miss it
+        mtime = (mtime_ns(stat) // 1000 + 0.5) / 1e6 + seconds
+        os.utime(path, (stat.st_atime, mtime))
+
+
+def gzip_compress(data):
+    """gzip.compress(), which Python 2 lacks"""
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+# Functions compressing bytes into each format this Python can read
+COMPRESSORS = {"gzip": gzip_compress, "bz2": bz2.compress}
+if lzma is not None:
+    COMPRESSORS["xz"] = lzma.compress
+
+
+class Unseekable(io.RawIOBase):
+
+    """A stream of bytes that cannot seek or peek, like a pipe"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._data.read(len(b))
+        b[: len(data)] = data
+        return len(data)
@@ -1,8 +1,14 @@
+import io
 import os
+import sys
 import unittest
 
 import pdbecif.mmcif_io as mmcif_IO
 from pdbecif.mmcif import CifFile, CIFWrapper
+from pdbecif.mmcif_columns import StringPool
+from pdbecif.mmcif_tools import MMCIF2Dict
+
+from .common import gzip_compress, set_mtime
 
 
 class CifFileReaderTestCase(unittest.TestCase):
@@ -97,6 +103,544 @@ class CifFileReaderTestCase(unittest.TestCase):
             "All levels of CIF file not translated to dictionary correctly",
         )
 
+    def test_inDict_scanner_engine(self):
+        for path in (self.TEST_CIF_FILE, self.TEST_DIC_FILE):
+            regex = mmcif_IO.CifFileReader(input="dictionary").read(path)
+            scanner = mmcif_IO.CifFileReader(input="dictionary", engine="scanner").read(
+                path
+            )
+            self.assertEqual(regex.getDataBlockIds(), scanner.getDataBlockIds())
+            for block in regex.getDataBlocks():
+                other = scanner.getDataBlock(block.getId())
+                for category in block.getCategories():
+                    for item in category.getItems():
+                        self.assertEqual(
+                            item.value,
+                            other.getCategory(category.getId())
+                            .getItem(item.name)
+                            .value,
+                        )
+
+    def test_inDict_error_lines(self):
+        cfr = mmcif_IO.CifFileReader(input="dictionary")
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        try:
+            with open(path, "w") as f:
+                f.write("data_TEST\n#\n_a.b 1\n_a.c $\n")
+            with self.assertRaises(mmcif_IO.BadStarTokenError) as err:
+                cfr.read(path, output="cif_file")
+            self.assertEqual(err.exception.token.line, 4)
+            self.assertEqual(err.exception.token.start, 24)
+            self.assertIn("line 4", str(err.exception))
+            # Found where the error is raised, also in file objects
+            with open(path, "rb") as f:
+                with self.assertRaises(mmcif_IO.BadStarTokenError) as err:
+                    cfr.read(io.BytesIO(f.read()))
+            self.assertEqual(err.exception.token.line, 4)
+
+            with open(path, "w") as f:
+                f.write("data_TEST\n#\nloop_\n_a.b\n_a.c\n1 2\n3\n#\n")
+            for engine in ("regex", "scanner"):
+                reader = mmcif_IO.CifFileReader(input="dictionary", engine=engine)
+                with self.assertRaises(mmcif_IO.LoopValueMultiplesError) as err:
+                    reader.read(path, output="cif_file")
+                self.assertEqual(err.exception.lineno, 3)
+                self.assertEqual(err.exception.offset, 12)
+        finally:
+            os.unlink(path)
+
+    def test_inData_loop_columns(self):
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        rows = 5000
+        try:
+            with open(path, "w") as f:
+                # Rows split over lines and mixed with quoted and text values
+                f.write("data_TEST\nloop_\n_a.x\n_a.y\n_a.z\n1 2\n'3 4' 5\n")
+                f.write(";\ntext\n;\n\"6\" 7 11 12\n")
+                f.write("8 9 10\n" * rows)
+                f.write("#\n_b.id 1\n")
+            data = mmcif_IO.CifFileReader().read(path)["TEST"]
+            self.assertEqual(data["_a"]["x"], ["1", "5", "7"] + ["8"] * rows)
+            self.assertEqual(data["_a"]["y"], ["2", "text", "11"] + ["9"] * rows)
+            self.assertEqual(data["_a"]["z"], ["3 4", "6", "12"] + ["10"] * rows)
+            self.assertEqual(data["_b"]["id"], "1")
+
+            with open(path, "w") as f:
+                f.write("data_TEST\nloop_\n_a.x\n_a.y\n1 2\n3\n")
+            from pdbecif.mmcif_tools import MMCIFWrapperSyntaxError
+
+            with self.assertRaises(MMCIFWrapperSyntaxError) as err:
+                mmcif_IO.CifFileReader().read(path)
+            self.assertEqual(err.exception.lineno, 6)
+            self.assertIn("line 6", str(err.exception))
+
+            # Lines are counted across chunks and skipped values; the loop
+            # ends with the data name on line 210
+            with open(path, "w") as f:
+                f.write("data_TEST\n_a.id 1\nloop_\n_b.x\n" + "1\n" * 200)
+                f.write("loop_\n_c.x\n_c.y\n1 2\n3\n_d.id 1\n")
+            from pdbecif.mmcif_tools import _LineReader
+
+            chunk_size = _LineReader.CHUNK_SIZE
+            for size in (chunk_size, 16):
+                _LineReader.CHUNK_SIZE = size
+                for ignore in ([], ["_b"]):
+                    with self.assertRaises(MMCIFWrapperSyntaxError) as err:
+                        mmcif_IO.CifFileReader().read(path, ignore=ignore)
+                    self.assertEqual(err.exception.lineno, 210)
+        finally:
+            _LineReader.CHUNK_SIZE = chunk_size
+            os.unlink(path)
+
+    def test_inData_skip_categories(self):
+        from pdbecif.mmcif_tools import _LineReader
+
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        chunk_size = _LineReader.CHUNK_SIZE
+        try:
+            with open(path, "w") as f:
+                f.write("data_TEST\n_a.id 1\n#\nloop_\n_b.x\n_b.y\n")
+                f.write("1 2\n" * 200)
+                f.write("#\n  loop_\n_c.x\n1\n2\ndata_NEXT\n_a.id 2\nloop_\n_b.x\n1\n")
+                f.write("DATA_LAST\n_a.id 3\n")
+            cfr = mmcif_IO.CifFileReader()
+            full = cfr.read(path)
+            # Small chunks make the skipped values span several of them
+            for size in (chunk_size, 16):
+                _LineReader.CHUNK_SIZE = size
+                data = cfr.read(path, ignore=["_b"])
+                self.assertEqual(sorted(data), ["LAST", "NEXT", "TEST"])
+                self.assertEqual(data["TEST"]["_a"], full["TEST"]["_a"])
+                self.assertEqual(data["TEST"]["_c"], full["TEST"]["_c"])
+                self.assertNotIn("_b", data["TEST"])
+                self.assertEqual(data["LAST"], full["LAST"])
+
+                data = cfr.read(path, only=["_c"])
+                self.assertEqual(data["TEST"], {"_c": {"x": ["1", "2"]}})
+        finally:
+            _LineReader.CHUNK_SIZE = chunk_size
+            os.unlink(path)
+
+    def test_inData_stop_early(self):
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        try:
+            with open(path, "w") as f:
+                f.write("data_TEST\n_a.id 1\n#\nloop_\n_b.x\n_b.y\n1 2\n3 4\n")
+                f.write("#\n_c.id 2\n#\n_d.id 4\n")
+                # Never reached when stopping early
+                f.write("_a.id 3\n")
+            cfr = mmcif_IO.CifFileReader()
+            data = cfr.read(path, only=["_b", "_a"], stop_early=True)
+            self.assertEqual(
+                data,
+                {"TEST": {"_a": {"id": "1"}, "_b": {"x": ["1", "3"], "y": ["2", "4"]}}},
+            )
+            data = cfr.read(path, only=["_b", "_a"])
+            self.assertEqual(data["TEST"]["_a"], {"id": "3"})
+            data = cfr.read(path, only=["_a", "_c"], stop_early=True)
+            self.assertEqual(data["TEST"], {"_a": {"id": "1"}, "_c": {"id": "2"}})
+        finally:
+            os.unlink(path)
+
+    def test_inData_only_items(self):
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        try:
+            with open(path, "w") as f:
+                f.write("data_TEST\n_a.id 1\n_a.name x\n#\n")
+                f.write("loop_\n_b.x\n_b.y\n_b.z\n1 2 3\n'4 5' 6\n;\n7\n;\n")
+                f.write("8 9 10\n" * 10)
+                f.write("#\n_c.id 2\n")
+            cfr = mmcif_IO.CifFileReader()
+            for processes in (1, 2):
+                data = cfr.read(
+                    path,
+                    only_items={"_a": ["name"], "_b": ["z", "x"]},
+                    processes=processes,
+                )["TEST"]
+                self.assertEqual(data["_a"], {"name": "x"})
+                self.assertEqual(data["_b"]["x"], ["1", "4 5"] + ["8"] * 10)
+                self.assertEqual(data["_b"]["z"], ["3", "7"] + ["10"] * 10)
+                self.assertEqual(sorted(data["_b"].keys()), ["x", "z"])
+                self.assertEqual(data["_c"], {"id": "2"})
+        finally:
+            os.unlink(path)
+
+    def test_inData_row_filter(self):
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        try:
+            with open(path, "w") as f:
+                f.write("data_TEST\n_a.id 1\n_a.kind x\n#\n")
+                f.write("loop_\n_b.id\n_b.type\n_b.model\n_b.b\n")
+                for model in (1, 2):
+                    f.write("%i C %i 10.5\n%i H %i ?\n" % (model, model, model, model))
+                    f.write("%i 'N 1' %i 30\n" % (model, model))
+                f.write("#\n")
+            cfr = mmcif_IO.CifFileReader()
+
+            def read(row_filter, **kwargs):
+                return cfr.read(path, row_filter=row_filter, **kwargs)["TEST"]
+
+            data = read({"_b": {"model": "1"}})
+            self.assertEqual(data["_b"]["type"], ["C", "H", "N 1"])
+            self.assertEqual(data["_b"]["model"], ["1", "1", "1"])
+            self.assertEqual(data["_a"], {"id": "1", "kind": "x"})
+
+            data = read({"_b": {"model": 2, "type": lambda v: v != "H"}})
+            self.assertEqual(data["_b"]["type"], ["C", "N 1"])
+            data = read({"_b": {"type": set(["C", "N 1"]), "b": (20, None)}})
+            self.assertEqual(data["_b"]["id"], ["1", "2"])
+            data = read({"_b": lambda row: row["b"] == "10.5"})
+            self.assertEqual(data["_b"]["model"], ["1", "2"])
+            data = read({"_b": {"missing": "1"}})
+            self.assertEqual(data["_b"]["id"], [])
+
+            # The filter item does not have to be kept
+            data = read({"_b": {"model": "2"}}, only_items={"_b": ["type"]})
+            self.assertEqual(data["_b"], {"type": ["C", "H", "N 1"]})
+
+            # A category without a loop is one row
+            self.assertNotIn("_a", read({"_a": {"kind": "y"}}))
+            self.assertIn("_a", read({"_a": {"kind": ["x", "y"]}}))
+            # whose filter items do not have to be kept either
+            data = read({"_a": {"kind": "x"}}, only_items={"_a": ["id"]})
+            self.assertEqual(data["_a"], {"id": "1"})
+            data = read(
+                {"_a": lambda row: row["kind"] == "x"}, only_items={"_a": ["id"]}
+            )
+            self.assertEqual(data["_a"], {"id": "1"})
+            self.assertNotIn(
+                "_a", read({"_a": {"kind": "y"}}, only_items={"_a": ["id"]})
+            )
+
+            # Only pairs of numbers or None are ranges
+            for condition in (("C", "H"), (1, 2, 3), (1,), ("1", None)):
+                self.assertRaises(TypeError, read, {"_b": {"type": condition}})
+            self.assertEqual(read({"_b": {"b": (None, 20.0)}})["_b"]["id"], ["1", "2"])
+        finally:
+            os.unlink(path)
+
+    def test_iterparse(self):
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        try:
+            self._write_blocks(path, 5)
+            for test_file in (self.TEST_CIF_FILE, self.TEST_DIC_FILE, path):
+                cfr = mmcif_IO.CifFileReader(input="data", preserve_order=True)
+                expected = cfr.read(test_file)
+                blocks = list(cfr.iterparse(test_file))
+                self.assertEqual(blocks, list(expected.items()))
+
+                for block_id, wrapper in cfr.iterparse(test_file, output="cif_wrapper"):
+                    self.assertIsInstance(wrapper, CIFWrapper)
+                    self.assertEqual(wrapper.data_id, block_id)
+
+                for block_id, block in cfr.iterparse(test_file, output="cif_file"):
+                    self.assertEqual(block.getId(), block_id)
+                    self.assertEqual(
+                        sorted("_" + category for category in block.getCategoryIds()),
+                        sorted(expected[block_id]),
+                    )
+
+                cfr = mmcif_IO.CifFileReader(input="dictionary", preserve_order=True)
+                expected = cfr.read(test_file)
+                ids = []
+                for block_id, block in cfr.iterparse(test_file):
+                    ids.append(block_id)
+                    # Blocks that have been read are not kept
+                    self.assertNotIn(block_id, block.parent.getDataBlockIds())
+                    self.assertLessEqual(len(block.parent.getDataBlockIds()), 1)
+                    other = expected.getDataBlock(block_id)
+                    self.assertEqual(block.getCategoryIds(), other.getCategoryIds())
+                    for category in other.getCategories():
+                        for item in category.getItems():
+                            self.assertEqual(
+                                block.getCategory(category.getId())
+                                .getItem(item.name)
+                                .value,
+                                item.value,
+                            )
+                self.assertEqual(ids, expected.getDataBlockIds())
+        finally:
+            os.unlink(path)
+
+    def test_parse_events(self):
+        cfr = mmcif_IO.CifFileReader(input="dictionary")
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        try:
+            self._write_blocks(path, 3)
+            # The test files hold text fields
+            test_files = [self.TEST_CIF_FILE, self.TEST_DIC_FILE, path]
+            if sys.version_info[0] > 2:
+                # MMCIF2Dict only reads its CRLF line ends as newlines on Python 3
+                test_files.append(
+                    os.path.join(self.FILE_ROOT, "test_data/usage-example_KILLER.cif")
+                )
+            for test_file in test_files:
+                handler = cfr.parse_events(test_file, mmcif_IO.CifDictHandler())
+                self.assertEqual(handler.data_blocks, MMCIF2Dict().parse(test_file))
+                handler = cfr.parse_events(
+                    test_file, mmcif_IO.CifDictHandler(preserve_token_order=True)
+                )
+                expected = MMCIF2Dict().parse(test_file, preserve_token_order=True)
+                self.assertEqual(
+                    [list(block) for block in handler.data_blocks.values()],
+                    [list(block) for block in expected.values()],
+                )
+
+                handler = cfr.parse_events(test_file, mmcif_IO.CIFWrapperHandler())
+                for block_id, wrapper in handler.data_blocks.items():
+                    self.assertIsInstance(wrapper, CIFWrapper)
+                    self.assertEqual(wrapper.data_id, block_id)
+
+            class Recorder(mmcif_IO.CifEventHandler):
+                def __init__(self):
+                    self.events = []
+
+                def __getattribute__(self, name):
+                    if name in ("events", "typed_values"):
+                        return object.__getattribute__(self, name)
+                    return lambda *args: self.events.append((name,) + args)
+
+            with open(path, "w") as f:
+                f.write("data_A\n_a.b 1\nloop_\n_c.x\n_c.y\n1 'p q'\n2 .\n")
+                f.write("save_f\n_s.t ;\nsave_\ndata_B\nloop_\n_d.e\n")
+            self.assertEqual(
+                cfr.parse_events(path, Recorder()).events,
+                [
+                    ("start_block", "A"),
+                    ("item", "_a", "b", "1"),
+                    ("start_loop", "_c", ["x", "y"]),
+                    ("row", ["1", "p q"]),
+                    ("row", ["2", "."]),
+                    ("end_loop",),
+                    ("start_saveframe", "f"),
+                    ("item", "_s", "t", ";"),
+                    ("end_saveframe",),
+                    ("end_block",),
+                    ("start_block", "B"),
+                    ("start_loop", "_d", ["e"]),
+                    ("end_loop",),
+                    ("end_block",),
+                ],
+            )
+
+            with open(path, "w") as f:
+                f.write("data_TEST\n#\nloop_\n_a.b\n_a.c\n1 2\n3\n#\n")
+            handler = Recorder()
+            with self.assertRaises(mmcif_IO.LoopValueMultiplesError) as err:
+                cfr.parse_events(path, handler)
+            self.assertEqual(err.exception.lineno, 3)
+            self.assertEqual(handler.events[-1], ("row", ["1", "2"]))
+        finally:
+            os.unlink(path)
+
+    def test_iter_rows(self):
+        cfr = mmcif_IO.CifFileReader(input="dictionary")
+        iter_rows = mmcif_IO.iter_rows
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        try:
+            with open(path, "w") as f:
+                f.write("data_A\n_a.id 1\n_a.name x\nloop_\n_b.x\n_b.y\n")
+                f.write("".join("%i %i\n" % (i, -i) for i in range(7)))
+                f.write("data_B\n_a.id 2\nloop_\n_b.x\n_b.y\n7 -7\n")
+            batches = list(iter_rows(path, "b", batch_size=3))
+            self.assertEqual([len(batch["x"]) for batch in batches], [3, 3, 1, 1])
+            self.assertEqual(
+                sum((batch["x"] for batch in batches), []),
+                [str(i) for i in range(8)],
+            )
+            self.assertEqual(
+                batches[1], {"x": ["3", "4", "5"], "y": ["-3", "-4", "-5"]}
+            )
+            self.assertEqual(
+                list(iter_rows(path, "_a")),
+                [{"id": ["1"], "name": ["x"]}, {"id": ["2"]}],
+            )
+            self.assertEqual(list(iter_rows(path, "c")), [])
+
+            expected = cfr.read(self.TEST_CIF_FILE).getDataBlock("TEST_CIF")
+            expected = expected.getCategory("test_keyword").getItem("field_1").value
+            batches = iter_rows(self.TEST_CIF_FILE, "test_keyword", batch_size=1)
+            self.assertEqual([batch["field_1"][0] for batch in batches], expected)
+
+            # Batches are cut as the rows of a long loop are read
+            with open(path, "w") as f:
+                f.write("data_A\nloop_\n_b.x\n")
+                f.write("".join("%i\n" % i for i in range(10000)))
+            batches = iter_rows(path, "b", batch_size=3000)
+            batches = [batch["x"] for batch in batches]
+            self.assertEqual([len(x) for x in batches], [3000, 3000, 3000, 1000])
+            self.assertEqual(sum(batches, []), [str(i) for i in range(10000)])
+        finally:
+            os.unlink(path)
+
+    def test_in_memory_sources(self):
+        with open(self.TEST_DIC_FILE, "rb") as f:
+            data = f.read()
+        compressed = gzip_compress(data)
+        for input in ("data", "dictionary"):
+            cfr = mmcif_IO.CifFileReader(input=input)
+            expected = cfr.read(self.TEST_DIC_FILE, output="cif_file")
+            for source in (
+                data,
+                data.decode("utf-8"),
+                io.BytesIO(data),
+                compressed,
+                io.BytesIO(compressed),
+            ):
+                cf = cfr.read(source, output="cif_file")
+                self.assertIsNone(cf.file_path)
+                self.assertEqual(cf.getDataBlockIds(), expected.getDataBlockIds())
+                for block in expected.getDataBlocks():
+                    other = cf.getDataBlock(block.getId())
+                    self.assertEqual(
+                        other.getCategoryIds(), block.getCategoryIds(), input
+                    )
+                if isinstance(source, io.BytesIO):
+                    source.seek(0)
+                ids = [block_id for block_id, _ in cfr.iterparse(source)]
+                self.assertEqual(ids, expected.getDataBlockIds())
+
+        cfr = mmcif_IO.CifFileReader(input="dictionary")
+        source = "data_TEST\n#\n_a.b 1\n_a.c $\n"
+        with self.assertRaises(mmcif_IO.BadStarTokenError) as err:
+            cfr.read(source)
+        self.assertEqual(err.exception.token.line, 4)
+        rows = mmcif_IO.iter_rows(b"data_x\nloop_\n_a.b\n1\n2\n", "a")
+        self.assertEqual(list(rows), [{"b": ["1", "2"]}])
+        cfr = mmcif_IO.CifFileReader(input="dictionary")
+        cf = cfr.read(u"data_x _a.b 1")
+        self.assertEqual(cf.getDataBlock("x").getCategoryIds(), ["a"])
+
+    def test_threaded(self):
+        import gzip
+
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif.gz")
+        with open(self.TEST_DIC_FILE, "rb") as f_in:
+            with gzip.open(path, "wb") as f_out:
+                f_out.write(f_in.read())
+        try:
+            for input in ("data", "dictionary"):
+                expected = mmcif_IO.CifFileReader(input=input).read(
+                    self.TEST_DIC_FILE, output="cif_file"
+                )
+                cfr = mmcif_IO.CifFileReader(input=input, threaded=True)
+                cf = cfr.read(path, output="cif_file")
+                self.assertEqual(cf.getDataBlockIds(), expected.getDataBlockIds())
+                for block in expected.getDataBlocks():
+                    self.assertEqual(
+                        cf.getDataBlock(block.getId()).getCategoryIds(),
+                        block.getCategoryIds(),
+                    )
+        finally:
+            os.unlink(path)
+
+    def _write_blocks(self, path, n_blocks):
+        # Text fields that start lines with data_ must not split the file
+        with open(path, "w") as f:
+            f.write("# leading comment\n")
+            for i in range(n_blocks):
+                f.write(
+                    "data_B%i\n_a.id %i\n_a.text\n;\ndata_not_a_block\n;x\n;\n"
+                    "loop_\n_b.x\n_b.y\n%i 'p q'\n2 .\n#\n" % (i, i, i)
+                )
+
+    def test_parallel_blocks(self):
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        try:
+            self._write_blocks(path, 12)
+            for input in ("data", "dictionary"):
+                cfr = mmcif_IO.CifFileReader(input=input, preserve_order=True)
+                serial = cfr.read(path, output="cif_file")
+                parallel = cfr.read(path, output="cif_file", processes=2)
+                self.assertEqual(
+                    parallel.getDataBlockIds(), ["B%i" % i for i in range(12)]
+                )
+                for block in serial.getDataBlocks():
+                    other = parallel.getDataBlock(block.getId())
+                    self.assertIs(other.parent, parallel)
+                    for category in block.getCategories():
+                        for item in category.getItems():
+                            self.assertEqual(
+                                item.value,
+                                other.getCategory(category.getId())
+                                .getItem(item.name)
+                                .value,
+                            )
+
+            cfr = mmcif_IO.CifFileReader(input="data")
+            self.assertEqual(
+                cfr.read(path, processes=3), cfr.read(path, processes=1)
+            )
+        finally:
+            os.unlink(path)
+
+    def test_entry_cache(self):
+        import shutil
+        import threading
+
+        path = os.path.join(self.FILE_ROOT, "reader_testcase.cif")
+        paths = []
+        shutil.copyfile(self.TEST_CIF_FILE, path)
+        try:
+            cache = mmcif_IO.EntryCache()
+            cfr = mmcif_IO.CifFileReader(entry_cache=cache)
+            wrapper = cfr.read(path, output="cif_wrapper")
+            self.assertIs(cfr.read(path, output="cif_wrapper"), wrapper)
+            only = cfr.read(path, output="cif_wrapper", only=["_entity"])
+            self.assertIsNot(only, wrapper)
+            # Not cached
+            cfr.read(path, only_items={"_entity": ["id"]})
+            pools = (StringPool(), StringPool())
+            pooled = [cfr.read(path, string_pool=pool) for pool in pools]
+            self.assertIsNot(pooled[0], pooled[1])
+            stats = cache.stats()
+            self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+            self.assertEqual(stats["entries"], 2)
+            self.assertGreater(stats["bytes"], 0)
+
+            # A changed file is read again
+            st = os.stat(path)
+            set_mtime(path, st, 1)
+            self.assertIsNot(cfr.read(path, output="cif_wrapper"), wrapper)
+            self.assertEqual(cache.stats()["misses"], 3)
+
+            # Least recently used results are evicted past max_bytes
+            paths = [path + str(i) for i in range(3)]
+            for other in paths:
+                shutil.copyfile(path, other)
+            size = mmcif_IO._estimateSize(mmcif_IO.CifFileReader().read(path))
+            cache.clear()
+            cache.max_bytes = size * 5 // 2
+            for other in (paths[0], paths[1], paths[0], paths[2]):
+                cfr.read(other)
+            self.assertEqual(cache.evictions, 1)
+            self.assertEqual(
+                sorted(key[0] for key in cache._entries),
+                [os.path.abspath(paths[0]), os.path.abspath(paths[2])],
+            )
+            self.assertLessEqual(cache.current_bytes, cache.max_bytes)
+
+            cache.clear()
+            cache.reset_stats()
+            cache.max_bytes = 1 << 30
+            results = []
+
+            def read():
+                results.append(cfr.read(path, output="cif_file"))
+
+            threads = [threading.Thread(target=read) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(results), 4)
+            self.assertEqual(cache.hits + cache.misses, 4)
+            self.assertEqual(len(cache), 1)
+        finally:
+            for other in [path] + paths:
+                if os.path.exists(other):
+                    os.unlink(other)
+
     def test_cif_noCategory(self):
         cfr = mmcif_IO.CifFileReader()
         cif_dictionary = cfr.read(self.TEST_CSD_CIF_FILE, output="cif_dictionary")
@@ -0,0 +1,159 @@
+import gzip
+import io
+import os
+import sys
+import unittest
+
+from pdbecif.mmcif_tools import MMCIF2Dict
+
+from .common import COMPRESSORS
+
+
+class MMCIF2DictLazyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_DATA = os.path.join(self.FILE_ROOT, "test_data")
+        self.TEST_FILES = [
+            os.path.join(self.TEST_DATA, name)
+            for name in sorted(os.listdir(self.TEST_DATA))
+        ]
+        self.TEST_CIF = os.path.join(self.FILE_ROOT, "mmcif2dict_testcase.cif")
+
+    def tearDown(self):
+        for path in (self.TEST_CIF, self.TEST_CIF + ".gz"):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def test_lazy_matches_parse(self):
+        for path in self.TEST_FILES:
+            if sys.version_info[0] == 2 and path.endswith("_KILLER.cif"):
+                # parse() keeps the carriage returns of its CRLF line endings
+                # on Python 2
+                continue
+            for preserve_token_order in (False, True):
+                parsed = MMCIF2Dict().parse(
+                    path, preserve_token_order=preserve_token_order
+                )
+                with MMCIF2Dict().parse_lazy(
+                    path, preserve_token_order=preserve_token_order
+                ) as lazy:
+                    # Without preserve_token_order, dict order is arbitrary
+                    # on Python 2
+                    order = list if preserve_token_order else sorted
+                    self.assertEqual(order(lazy.keys()), order(parsed.keys()), path)
+                    for block_id, block in parsed.items():
+                        self.assertEqual(
+                            order(lazy[block_id].keys()), order(block.keys()), path
+                        )
+                        for category, items in block.items():
+                            self.assertEqual(lazy[block_id][category], items, path)
+
+    def test_categories_parsed_on_demand(self):
+        with open(self.TEST_CIF, "w") as f:
+            f.write("_pre.id 0\ndata_A\n_a.id 1\n_a.text\n;\ndata_B\n_b.x 1\n;\n")
+            f.write("loop_\n_b.x\n_b.y\n1 2\n3 4\n#\nsave_frame\n_s.id 1\nsave_\n")
+            f.write("_c.id 3\n_a.name x\ndata_C\nloop_\n_d.x\n1\n")
+        lazy = MMCIF2Dict().parse_lazy(self.TEST_CIF)
+        try:
+            self.assertEqual(list(lazy.keys()), ["", "A", "C"])
+            block = lazy["A"]
+            self.assertEqual(list(block.keys()), ["_a", "_b", "_c"])
+            self.assertIn("_b", block)
+            self.assertNotIn("_s", block)
+            self.assertEqual(block._categories, {})
+
+            self.assertEqual(block["_b"], {"x": ["1", "3"], "y": ["2", "4"]})
+            self.assertEqual(list(block._categories.keys()), ["_b"])
+            self.assertIs(block["_b"], block["_b"])
+            # Items of a category found in two places are merged
+            self.assertEqual(
+                block["_a"], {"id": "1", "text": "data_B\n_b.x 1", "name": "x"}
+            )
+            self.assertRaises(KeyError, block.__getitem__, "_s")
+            self.assertEqual(lazy, MMCIF2Dict().parse(self.TEST_CIF))
+        finally:
+            lazy.close()
+
+    def test_lazy_gzip(self):
+        path = os.path.join(self.TEST_DATA, "usage-example.cif")
+        with open(path, "rb") as f_in:
+            with gzip.open(self.TEST_CIF + ".gz", "wb") as f_out:
+                f_out.write(f_in.read())
+        lazy = MMCIF2Dict().parse_lazy(self.TEST_CIF + ".gz")
+        self.assertEqual(lazy, MMCIF2Dict().parse(path))
+
+    def test_lazy_missing_file(self):
+        self.assertIsNone(MMCIF2Dict().parse_lazy(self.TEST_CIF))
+
+
+class MMCIF2DictSourceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_CIF = os.path.join(self.FILE_ROOT, "test_data", "usage-example.cif")
+        self.TEST_GZ = os.path.join(self.FILE_ROOT, "mmcif2dict_testcase.cif.gz")
+        with open(self.TEST_CIF, "rb") as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        if os.path.exists(self.TEST_GZ):
+            os.unlink(self.TEST_GZ)
+
+    def _sources(self):
+        with gzip.open(self.TEST_GZ, "wb") as f:
+            f.write(self.data)
+        return [
+            self.data,
+            self.data.decode("utf-8"),
+            io.BytesIO(self.data),
+            io.StringIO(self.data.decode("utf-8")),
+            gzip.open(self.TEST_GZ, "rb"),
+            gzip.open(self.TEST_GZ, "rt"),
+        ]
+
+    def test_parse_sources(self):
+        expected = MMCIF2Dict().parse(self.TEST_CIF)
+        for source in self._sources():
+            self.assertEqual(MMCIF2Dict().parse(source), expected, type(source))
+            if hasattr(source, "close"):
+                # File objects passed in are left open
+                self.assertFalse(source.closed)
+                source.close()
+
+    def test_iterparse_sources(self):
+        expected = list(MMCIF2Dict().parse(self.TEST_CIF).items())
+        for source in self._sources():
+            self.assertEqual(list(MMCIF2Dict().iterparse(source)), expected)
+
+    def test_lazy_sources(self):
+        expected = MMCIF2Dict().parse(self.TEST_CIF)
+        for source in self._sources():
+            with MMCIF2Dict().parse_lazy(source) as lazy:
+                self.assertEqual(lazy, expected, type(source))
+                self.assertIsNone(lazy.file_path)
+
+    def test_misnamed_compressed_files(self):
+        expected = MMCIF2Dict().parse(self.TEST_CIF)
+        for compress in COMPRESSORS.values():
+            with open(self.TEST_GZ, "wb") as f:
+                f.write(compress(self.data))
+            self.assertEqual(MMCIF2Dict().parse(self.TEST_GZ), expected)
+            self.assertEqual(MMCIF2Dict().parse(self.TEST_GZ, processes=2), expected)
+            with MMCIF2Dict().parse_lazy(self.TEST_GZ) as lazy:
+                self.assertEqual(lazy, expected)
+
+    def test_threaded(self):
+        expected = MMCIF2Dict().parse(self.TEST_CIF)
+        with gzip.open(self.TEST_GZ, "wb") as f:
+            f.write(self.data)
+        self.assertEqual(MMCIF2Dict().parse(self.TEST_GZ, threaded=True), expected)
+        self.assertEqual(
+            dict(MMCIF2Dict().iterparse(self.TEST_GZ, threaded=True)), expected
+        )
+        self.assertEqual(MMCIF2Dict().parse(self.TEST_CIF, threaded=True), expected)
+
+    def test_missing_path(self):
+        self.assertIsNone(MMCIF2Dict().parse("no_such_file.cif"))
+
+
+if __name__ == "__main__":
+    unittest.main()
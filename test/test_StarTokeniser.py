@@ -0,0 +1,222 @@
+import gzip
+import io
+import os
+import random
+import unittest
+
+from pdbecif.globalphasing.startools import StarTokeniser
+
+from .common import COMPRESSORS
+
+
+class StarTokeniserTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_DATA = os.path.join(self.FILE_ROOT, "test_data")
+        self.TEST_FILES = [
+            os.path.join(self.TEST_DATA, name)
+            for name in sorted(os.listdir(self.TEST_DATA))
+        ]
+
+    def tearDown(self):
+        from glob import glob
+
+        for path in glob(os.path.join(self.FILE_ROOT, "tokeniser_testcase*")):
+            os.unlink(path)
+
+    def _tokens(self, cif, **kwargs):
+        tokeniser = StarTokeniser(**kwargs)
+        tokeniser.start_matching(cif)
+        return [(tok.type, tok.value) for tok in tokeniser]
+
+    def test_bytes_mode_matches_text_mode(self):
+        for path in self.TEST_FILES:
+            self.assertEqual(
+                self._tokens(path, bytes_mode=True),
+                self._tokens(path),
+                "Bytes mode token stream differs for %s" % path,
+            )
+
+    def test_bytes_mode_values_are_text(self):
+        tokeniser = StarTokeniser(bytes_mode=True)
+        tokeniser.start_matching(os.path.join(self.TEST_DATA, "usage-example.cif"))
+        tok = next(tokeniser)
+        self.assertEqual(tok.type_string, "DATA_BLOCK")
+        self.assertEqual(tok.value, "dAtA_TEST_CIF")
+
+    def test_tuple_tokens(self):
+        for path in self.TEST_FILES:
+            tokeniser = StarTokeniser()
+            tokeniser.start_matching(path)
+            self.assertEqual(list(tokeniser.tokens()), self._tokens(path))
+
+    def test_positions(self):
+        for path in self.TEST_FILES:
+            with open(path, "rb") as f:
+                data = f.read()
+            tokeniser = StarTokeniser(bytes_mode=True, positions=True)
+            tokeniser.start_matching(path)
+            tokens = list(tokeniser.tokens())
+            self.assertEqual(
+                [t[:2] for t in tokens],
+                [(t, v.encode("utf-8")) for t, v in self._tokens(path)],
+            )
+            for token_type, value, start, end, line in tokens:
+                self.assertIn(value, data[start:end])
+                self.assertEqual(line, data[:start].count(b"\n") + 1)
+
+            for chunk_size in (5, 64):
+                tokeniser = StarTokeniser(positions=True, chunk_size=chunk_size)
+                tokeniser.start_matching(io.BytesIO(data))
+                self.assertEqual(list(tokeniser.tokens()), tokens)
+
+    def test_locate(self):
+        for path in self.TEST_FILES:
+            with open(path, "rb") as f:
+                data = f.read()
+            tokeniser = StarTokeniser(bytes_mode=True, positions=True)
+            tokeniser.start_matching(path)
+            expected = [(t[2], t[4]) for t in tokeniser.tokens()]
+            for engine in StarTokeniser.ENGINES:
+                for cif, chunk_size in ((path, 64), (io.BytesIO(data), 5)):
+                    tokeniser = StarTokeniser(
+                        bytes_mode=True, engine=engine, chunk_size=chunk_size
+                    )
+                    tokeniser.start_matching(cif)
+                    self.assertEqual(tokeniser.locate(), (None, None))
+                    located = [
+                        tokeniser.locate(value) for _, value in tokeniser.tokens()
+                    ]
+                    self.assertEqual([t[1] for t in located], [t[1] for t in expected])
+                    if engine == "regex":
+                        self.assertEqual(located, expected, path)
+                    # The scanner finds the value from the start of its line,
+                    # past the quote of a quoted value
+                    for (offset, _), (start, _) in zip(located, expected):
+                        self.assertLessEqual(offset, start + 1, path)
+
+    def test_token_positions(self):
+        tokeniser = StarTokeniser(positions=True)
+        tokeniser.start_matching(io.StringIO(u"data_x\n\n_a.b  'c d'\n"))
+        tokens = [(tok.value, tok.start, tok.end, tok.line) for tok in tokeniser]
+        self.assertEqual(
+            tokens, [("data_x", 0, 6, 1), ("_a.b", 8, 12, 3), ("c d", 14, 19, 3)]
+        )
+
+    def test_scanner_matches_regex(self):
+        for path in self.TEST_FILES:
+            with open(path, "rb") as f:
+                data = f.read()
+            for bytes_mode in (False, True):
+                for positions in (False, True):
+                    kwargs = dict(bytes_mode=bytes_mode, positions=positions)
+                    tokeniser = StarTokeniser(**kwargs)
+                    tokeniser.start_matching(path)
+                    expected = list(tokeniser.tokens())
+
+                    tokeniser = StarTokeniser(engine="scanner", **kwargs)
+                    tokeniser.start_matching(path)
+                    self.assertEqual(list(tokeniser.tokens()), expected, path)
+
+                    tokeniser = StarTokeniser(engine="scanner", chunk_size=7, **kwargs)
+                    tokeniser.start_matching(
+                        io.BytesIO(data)
+                        if bytes_mode
+                        else io.StringIO(data.decode("utf-8"))
+                    )
+                    self.assertEqual(list(tokeniser.tokens()), expected, path)
+
+    def test_scanner_matches_regex_random(self):
+        fragments = [
+            "a", "bc", "'", '"', "'x y'", '"p q"', "#", "# c", ";", "\n;", "\n",
+            "\r\n", " ", "\t", "data_", "data_x", "DATA_Y", "loop_", "LOOP_z",
+            "save_", "save_f", "stop_", "stop_x", "global_", "global_1", "_",
+            "_a.b", "$", "$ref", ".", "..", "?", "?x", "[", "]x", "x'y", "'a'b'",
+            ";t", "\r", u"\u00e9", u"\u00a0", u"\u2028",
+        ]
+        rng = random.Random(1)
+        for _ in range(300):
+            text = u"".join(rng.choice(fragments) for _ in range(rng.randint(1, 40)))
+            for data in (io.StringIO(text), io.BytesIO(text.encode("utf-8"))):
+                expected = None
+                for engine in StarTokeniser.ENGINES:
+                    data.seek(0)
+                    tokeniser = StarTokeniser(engine=engine, positions=True)
+                    tokeniser.start_matching(data)
+                    tokens = list(tokeniser.tokens())
+                    if expected is None:
+                        expected = tokens
+                    self.assertEqual(tokens, expected, repr(text))
+
+    def test_in_memory(self):
+        for path in self.TEST_FILES:
+            with open(path, "rb") as f:
+                data = f.read()
+            for bytes_mode in (False, True):
+                for positions in (False, True):
+                    kwargs = dict(bytes_mode=bytes_mode, positions=positions)
+                    tokeniser = StarTokeniser(**kwargs)
+                    tokeniser.start_matching(path)
+                    expected = list(tokeniser.tokens())
+                    for cif in (data, bytearray(data), data.decode("utf-8")):
+                        tokeniser = StarTokeniser(**kwargs)
+                        tokeniser.start_matching(cif)
+                        self.assertEqual(list(tokeniser.tokens()), expected, path)
+
+    def test_compressed_inputs(self):
+        path = os.path.join(self.TEST_DATA, "usage-example.cif")
+        with open(path, "rb") as f:
+            data = f.read()
+        expected = self._tokens(path)
+        # Misnamed on purpose: the format is found from the leading bytes
+        misnamed = os.path.join(self.FILE_ROOT, "tokeniser_testcase.cif")
+        for compress in COMPRESSORS.values():
+            with open(misnamed, "wb") as f:
+                f.write(compress(data))
+            self.assertEqual(self._tokens(misnamed), expected)
+            self.assertEqual(self._tokens(misnamed, bytes_mode=True), expected)
+            self.assertEqual(self._tokens(compress(data)), expected)
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, StarTokeniser, engine="yacc")
+
+    def test_stream_matches_mmap(self):
+        for path in self.TEST_FILES:
+            expected = self._tokens(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            for chunk_size in (1, 7, 64, 4096):
+                self.assertEqual(
+                    self._tokens(io.BytesIO(data), chunk_size=chunk_size),
+                    expected,
+                    "Streamed bytes differ for %s (chunk %i)" % (path, chunk_size),
+                )
+                self.assertEqual(
+                    self._tokens(
+                        io.StringIO(data.decode("utf-8")), chunk_size=chunk_size
+                    ),
+                    expected,
+                    "Streamed text differs for %s (chunk %i)" % (path, chunk_size),
+                )
+
+    def test_gzip_stream(self):
+        path = os.path.join(self.TEST_DATA, "usage-example.cif")
+        gz_path = os.path.join(self.FILE_ROOT, "tokeniser_testcase.cif.gz")
+        with open(path, "rb") as f_in:
+            with gzip.open(gz_path, "wb") as f_out:
+                f_out.write(f_in.read())
+        with gzip.open(gz_path, "rb") as f:
+            self.assertEqual(
+                self._tokens(f, bytes_mode=True, chunk_size=100), self._tokens(path)
+            )
+
+    def test_long_text_field_across_chunks(self):
+        text = "line of text\n" * 500
+        cif = u"data_x\n_a.b\n;%s;\n_a.c 1\n" % text
+        tokens = self._tokens(io.StringIO(cif), chunk_size=16)
+        self.assertEqual(tokens[2], (1, text[:-1]))
+        self.assertEqual(tokens[-1], (16, "1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import gzip
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pdbecif import bcif
+from pdbecif.mmcif import CifFile, CIFWrapper
+from pdbecif.mmcif_io import CifFileReader, CifFileWriter
+from pdbecif.mmcif_tools import MMCIF2Dict
+
+from .common import Unseekable, gzip_compress
+
+
+class BinaryCIFTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_DATA = os.path.join(self.FILE_ROOT, "test_data")
+        self.TEST_CIF = os.path.join(self.TEST_DATA, "usage-example.cif")
+        self.OUT_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.OUT_DIR)
+
+    def test_round_trip(self):
+        for name in ("usage-example.cif", "usage-example_KILLER.cif"):
+            parsed = MMCIF2Dict().parse(os.path.join(self.TEST_DATA, name))
+            self.assertEqual(bcif.loads(bcif.dumps(parsed)), parsed)
+
+    def test_columns(self):
+        mmcif_dict = {
+            "TEST": {
+                "_atom": {
+                    "id": ["1", "2", "3", "4", "5", "6"],
+                    "x": ["1.500", "-2.250", "10.000", "0.125", "?", "3.000"],
+                    "b": ["1.5", "20.25", "3", "1e5", ".", "-0.0"],
+                    "big": ["1", "-1", "99999999999", "0", "2", "3"],
+                    "padded": ["01", "2", "3", "4", "5", "6"],
+                    "name": ["CA", "CB", "CA", "?", ".", "N"],
+                    "all_unknown": ["?"] * 6,
+                    "empty": ["", "1", "", "?", ".", "2"],
+                },
+                "_single": {"value": "only", "number": "12", "empty": ""},
+            }
+        }
+        self.assertEqual(bcif.loads(bcif.dumps(mmcif_dict)), mmcif_dict)
+
+    def test_messagepack(self):
+        self.assertEqual(bcif.packb({"a": [1, -1]}), b"\x81\xa1a\x92\x01\xff")
+        self.assertEqual(bcif.packb(2 ** 32), b"\xcf" + struct.pack(">Q", 2 ** 32))
+        self.assertEqual(bcif.packb(-(2 ** 15)), b"\xd1\x80\x00")
+        for value in (
+            None,
+            True,
+            1.5,
+            "x" * 40,
+            # Binary data on Python 2 as well, where bytes is str
+            bytearray(300),
+            list(range(20)),
+            {"k%d" % i: i for i in range(20)},
+            -(2 ** 63),
+        ):
+            self.assertEqual(bcif.unpackb(bcif.packb(value)), value)
+
+    def test_reader_writer(self):
+        parsed = CifFileReader().read(self.TEST_CIF)
+        for name in ("test.bcif", "test.bcif.gz"):
+            path = os.path.join(self.OUT_DIR, name)
+            CifFileWriter(path).write(parsed)
+            self.assertTrue(bcif.is_binary_cif(path))
+            self.assertEqual(CifFileReader().read(path), parsed)
+        with gzip.open(path, "rb") as f:
+            data = f.read()
+        self.assertTrue(bcif.is_binary_cif(data))
+        self.assertEqual(bcif.load(data), parsed)
+        self.assertFalse(bcif.is_binary_cif(self.TEST_CIF))
+
+        cif_file = CifFileReader().read(path, output="cif_file")
+        self.assertIsInstance(cif_file, CifFile)
+        cif_wrapper = CifFileReader().read(path, output="cif_wrapper")
+        self.assertIsInstance(cif_wrapper["TEST_CIF"], CIFWrapper)
+
+        # CifFile input, written as binary by request and read as such only
+        # by request, as the name is not looked into
+        path = os.path.join(self.OUT_DIR, "written.cif")
+        writer = CifFileWriter(path, binary=True)
+        writer.write(cif_file)
+        del writer
+        self.assertEqual(CifFileReader(input="bcif").read(path), parsed)
+        blocks = CifFileReader(input="bcif").iterparse(path, only=["_test_loop_1"])
+        self.assertEqual(
+            dict(blocks), CifFileReader().read(self.TEST_CIF, only=["_test_loop_1"])
+        )
+
+    def test_streams(self):
+        parsed = CifFileReader().read(self.TEST_CIF)
+        data = bcif.dumps(parsed)
+        for source in (data, gzip_compress(data)):
+            for stream in (
+                io.BytesIO(source),
+                io.BufferedReader(io.BytesIO(source)),
+                Unseekable(source),
+            ):
+                self.assertEqual(CifFileReader().read(stream), parsed)
+            stream = io.BytesIO(source)
+            self.assertTrue(bcif.is_binary_cif(stream))
+            self.assertEqual(stream.tell(), 0)
+        with open(self.TEST_CIF, "rb") as f:
+            self.assertFalse(bcif.is_binary_cif(f))
+            self.assertEqual(CifFileReader().read(f), parsed)
+
+    def test_read_options(self):
+        path = os.path.join(self.OUT_DIR, "test.bcif")
+        CifFileWriter(path).write(CifFileReader().read(self.TEST_CIF))
+        for kwargs in (
+            dict(only=["_test_loop_1"]),
+            dict(ignore=["_test_loop_1"]),
+            dict(only=["_test_keyword"], only_items={"_test_keyword": ["field_3"]}),
+            dict(row_filter={"_test_keyword": {"field_2": "BIT"}}),
+        ):
+            expected = CifFileReader().read(self.TEST_CIF, **kwargs)
+            self.assertTrue(expected["TEST_CIF"])
+            self.assertEqual(CifFileReader().read(path, **kwargs), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
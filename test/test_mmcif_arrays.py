@@ -0,0 +1,114 @@
+import os
+import unittest
+
+from pdbecif.mmcif import CIFWrapper
+from pdbecif.mmcif_arrays import available, column_array
+from pdbecif.mmcif_columns import StringPool
+from pdbecif.mmcif_io import CifFileReader
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ColumnArrayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_CIF = os.path.join(self.FILE_ROOT, "arrays_testcase.cif")
+        with open(self.TEST_CIF, "w") as f:
+            f.write(
+                "data_TEST\n#\n_cell.length_a 10.5\n#\nloop_\n"
+                "_atom.id\n_atom.x\n_atom.seq\n_atom.name\n"
+                "1 1.500 10 CA\n2 -2.25 . CB\n3 ? 11 CA\n4 4.0 12 CA\n#\n"
+            )
+
+    def tearDown(self):
+        if os.path.exists(self.TEST_CIF):
+            os.unlink(self.TEST_CIF)
+
+    @unittest.skipIf(numpy is not None, "numpy is installed")
+    def test_no_numpy(self):
+        self.assertFalse(available())
+        self.assertRaises(ImportError, column_array, ["1.0"])
+
+    @unittest.skipUnless(available(), "numpy is not installed")
+    def test_column_array(self):
+        array = column_array(["1.5", "?", ".", "-2", "1e3"])
+        self.assertEqual(array.dtype, numpy.float64)
+        self.assertTrue(numpy.isnan(array[1]) and numpy.isnan(array[2]))
+        self.assertEqual(list(array[[0, 3, 4]]), [1.5, -2.0, 1000.0])
+
+        # Nulls of other types are masked
+        array = column_array(["1", "?", "3"], dtype=int)
+        self.assertIsInstance(array, numpy.ma.MaskedArray)
+        self.assertEqual(list(array.mask), [False, True, False])
+        array = column_array(["1", "3"], dtype=int)
+        self.assertNotIsInstance(array, numpy.ma.MaskedArray)
+        array = column_array(["1.5", "."], masked=True)
+        self.assertEqual(list(array.mask), [False, True])
+        self.assertRaises(ValueError, column_array, ["1", "?"], int, False)
+        self.assertRaises(ValueError, column_array, ["1", "x"])
+
+        self.assertEqual(list(column_array("2.5")), [2.5])
+        self.assertEqual(len(column_array([])), 0)
+
+        pool = StringPool()
+        pool.column(["A", "A", "B", "B"])
+        column = pool.column(["10", "11", "10", "10", "?", "10"])
+        array = column_array(column, dtype=int)
+        self.assertEqual(list(array.data[~array.mask]), [10, 11, 10, 10, 10])
+        self.assertEqual(list(array.mask), [False] * 4 + [True, False])
+
+    @unittest.skipUnless(available(), "numpy is not installed")
+    def test_as_array(self):
+        wrapper = CifFileReader().read(self.TEST_CIF, output="cif_wrapper")["TEST"]
+        x = wrapper._atom.as_array("x")
+        self.assertEqual(list(x[[0, 1, 3]]), [1.5, -2.25, 4.0])
+        self.assertTrue(numpy.isnan(x[2]))
+        self.assertIs(wrapper._atom.as_array("x"), x)
+        self.assertIsNone(wrapper._atom.as_array("y"))
+        self.assertEqual(list(wrapper._cell.as_array("length_a")), [10.5])
+
+        # Arrays are made again once the item is set
+        wrapper._atom["x"] = ["1", "2", "3", "4"]
+        self.assertEqual(list(wrapper._atom.as_array("x")), [1, 2, 3, 4])
+        self.assertEqual(wrapper._atom.x, ["1", "2", "3", "4"])
+        wrapper._atom._DATA = {"x": ["5", "6"]}
+        self.assertEqual(list(wrapper._atom.as_array("x")), [5, 6])
+
+    @unittest.skipUnless(available(), "numpy is not installed")
+    def test_typed_items(self):
+        typed_items = {"_atom": {"x": float, "seq": int}, "_missing": {"a": int}}
+        mmcif_dict = CifFileReader().read(self.TEST_CIF, typed_items=typed_items)
+        atom = mmcif_dict["TEST"]["_atom"]
+        self.assertIsInstance(atom["x"], numpy.ndarray)
+        self.assertEqual(list(atom["seq"].mask), [False, True, False, False])
+        self.assertEqual(atom["name"], ["CA", "CB", "CA", "CA"])
+
+        wrappers = CifFileReader().read(
+            self.TEST_CIF,
+            output="cif_wrapper",
+            typed_items=typed_items,
+            string_pool=True,
+        )
+        table = wrappers["TEST"]._atom
+        self.assertEqual(table.x, ["1.500", "-2.25", "?", "4.0"])
+        self.assertIn(("x", float, None), table._arrays)
+        self.assertEqual(table.as_array("seq", int)[0], 10)
+
+        wrapper = CIFWrapper(CifFileReader().read(self.TEST_CIF))
+        self.assertEqual(list(wrapper._atom.as_array("id")), [1.0, 2.0, 3.0, 4.0])
+
+        # Typed items read as a dictionary are columns of the wrapper
+        wrapper = CIFWrapper(mmcif_dict)
+        self.assertIsInstance(wrapper._atom.x, numpy.ndarray)
+        self.assertEqual(list(wrapper._atom)[1]["x"], -2.25)
+        self.assertIs(wrapper._atom.as_array("x"), wrapper._atom.x)
+        self.assertEqual(list(wrapper._atom.as_array("seq", float)[[0, 3]]), [10, 12])
+        table["x"] = numpy.zeros(4)
+        self.assertEqual(list(table.as_array("x")), [0.0] * 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from pdbecif.mmcif_cache import ParseCache
+from pdbecif.mmcif_io import CifFileReader
+from pdbecif.mmcif_tools import MMCIF2Dict
+
+from .common import set_mtime
+
+
+class ParseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_DATA = os.path.join(self.FILE_ROOT, "test_data")
+        self.CACHE_DIR = tempfile.mkdtemp()
+        self.TEST_CIF = os.path.join(self.FILE_ROOT, "cache_testcase.cif")
+        shutil.copyfile(
+            os.path.join(self.TEST_DATA, "usage-example.cif"), self.TEST_CIF
+        )
+        self.cache = ParseCache(self.CACHE_DIR)
+
+    def tearDown(self):
+        shutil.rmtree(self.CACHE_DIR)
+        if os.path.exists(self.TEST_CIF):
+            os.unlink(self.TEST_CIF)
+
+    def test_hit(self):
+        parsed = MMCIF2Dict().parse(self.TEST_CIF)
+        self.assertIsNone(self.cache.get(self.TEST_CIF))
+        result = MMCIF2Dict().parse(self.TEST_CIF, cache=self.cache)
+        self.assertEqual(result, parsed)
+        self.assertTrue(os.path.exists(self.cache.path(self.TEST_CIF)))
+        self.assertEqual(self.cache.get(self.TEST_CIF), parsed)
+
+        # Reads from the cache do not tokenise the file
+        with open(self.TEST_CIF, "rb") as f:
+            data = f.read()
+        st = os.stat(self.TEST_CIF)
+        with open(self.TEST_CIF, "wb") as f:
+            f.write(b"x" * len(data))
+        set_mtime(self.TEST_CIF, st)
+        result = MMCIF2Dict().parse(self.TEST_CIF, cache=self.cache)
+        self.assertEqual(result, parsed)
+
+        # Until the file changes
+        set_mtime(self.TEST_CIF, st, 1)
+        self.assertIsNone(self.cache.get(self.TEST_CIF))
+
+    def test_categories(self):
+        parsed = MMCIF2Dict().parse(self.TEST_CIF)
+        categories = set()
+        for block in parsed.values():
+            categories.update(block)
+        only = sorted(categories)[:2]
+        ignore = sorted(categories)[-2:]
+        for _ in range(2):
+            for preserve_token_order in (False, True):
+                kwargs = dict(
+                    onlyCategories=only, preserve_token_order=preserve_token_order
+                )
+                expected = MMCIF2Dict().parse(self.TEST_CIF, **kwargs)
+                result = MMCIF2Dict().parse(
+                    self.TEST_CIF, cache=self.cache, **kwargs
+                )
+                self.assertEqual(result, expected)
+                self.assertEqual(type(result), type(expected))
+                block = next(iter(result.values()))
+                self.assertEqual(list(block), list(next(iter(expected.values()))))
+            expected = MMCIF2Dict().parse(self.TEST_CIF, ignoreCategories=ignore)
+            result = MMCIF2Dict().parse(
+                self.TEST_CIF, ignoreCategories=ignore, cache=self.cache
+            )
+            self.assertEqual(result, expected)
+
+    def test_reader(self):
+        reader = CifFileReader(cache=self.cache)
+        expected = CifFileReader().read(self.TEST_CIF, output="cif_wrapper")
+        for _ in range(2):
+            result = reader.read(self.TEST_CIF, output="cif_wrapper")
+            self.assertEqual(list(result), list(expected))
+        self.assertTrue(os.path.exists(self.cache.path(self.TEST_CIF)))
+
+    def test_eviction(self):
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.CACHE_DIR, "entry%i.cif" % i)
+            shutil.copyfile(self.TEST_CIF, path)
+            paths.append(path)
+        MMCIF2Dict().parse(paths[0], cache=self.cache)
+        size = os.path.getsize(self.cache.path(paths[0]))
+        self.cache.max_bytes = 2 * size
+        MMCIF2Dict().parse(paths[1], cache=self.cache)
+        # Age the second cache file for file systems with coarse timestamps;
+        # using the first file then makes the second the least recently used
+        cache_path = self.cache.path(paths[1])
+        st = os.stat(cache_path)
+        set_mtime(cache_path, st, -1)
+        self.assertIsNotNone(MMCIF2Dict().parse(paths[0], cache=self.cache))
+        MMCIF2Dict().parse(paths[2], cache=self.cache)
+        self.assertIsNotNone(self.cache.get(paths[0]))
+        self.assertIsNone(self.cache.get(paths[1]))
+        self.assertIsNotNone(self.cache.get(paths[2]))
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(paths[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
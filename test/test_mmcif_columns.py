@@ -0,0 +1,117 @@
+import copy
+import os
+import pickle
+import unittest
+
+from pdbecif.mmcif import CifFile, CIFWrapper
+from pdbecif.mmcif_columns import PooledColumn, StringPool
+from pdbecif.mmcif_io import CifFileReader
+from pdbecif.mmcif_tools import MMCIF2Dict
+
+ROWS = 40
+
+
+class StringPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_CIF = os.path.join(self.FILE_ROOT, "columns_testcase.cif")
+        lines = ["data_TEST", "#", "_entry.id TEST", "#", "loop_"]
+        lines += ["_atom.%s" % item for item in ("id", "type", "comp", "x")]
+        for i in range(ROWS):
+            lines.append(
+                "%i %s %s %.3f"
+                % (i + 1, "CNO"[i % 3], ["ALA", "'GLY A'"][i % 2], i * 1.5)
+            )
+        lines += ["#", ""]
+        text = "\n".join(lines)
+        with open(self.TEST_CIF, "w") as f:
+            f.write(text + text.replace("data_TEST", "data_TWO"))
+
+    def tearDown(self):
+        if os.path.exists(self.TEST_CIF):
+            os.unlink(self.TEST_CIF)
+
+    def test_column(self):
+        pool = StringPool()
+        values = ["A", "B", "A", "A", "C", "A"]
+        column = pool.column(list(values))
+        self.assertIsInstance(column, PooledColumn)
+        self.assertEqual(column, values)
+        self.assertEqual(values, column)
+        self.assertEqual(len(column), 6)
+        self.assertEqual(column[1], "B")
+        self.assertEqual(column[-1], "A")
+        self.assertEqual(column[1:3], ["B", "A"])
+        self.assertEqual(list(column), values)
+        self.assertIn("C", column)
+        self.assertNotIn("D", column)
+        self.assertEqual(column.count("A"), 4)
+        self.assertEqual(column.index("C"), 4)
+        self.assertRaises(ValueError, column.index, "D")
+
+        # Changes go through the pool
+        column.append("D")
+        column[0] = "B"
+        del column[1]
+        values = ["B", "A", "A", "C", "A", "D"]
+        self.assertEqual(column, values)
+        self.assertEqual(len(pool), 4)
+
+        # Copies share the pool but not the codes
+        for copied in (copy.copy(column), copy.deepcopy(column)):
+            self.assertIs(copied.pool, pool)
+            copied.append("A")
+            self.assertEqual(column, values)
+        copied = pickle.loads(pickle.dumps(column))
+        self.assertEqual(copied, values)
+
+        # Columns of mostly distinct values are left as they are
+        values = ["1", "2", "3", "3"]
+        self.assertIs(pool.column(values), values)
+
+    def test_parse(self):
+        parsed = MMCIF2Dict().parse(self.TEST_CIF)
+        pool = StringPool()
+        for kwargs in (dict(), dict(processes=2)):
+            pooled = MMCIF2Dict().parse(self.TEST_CIF, string_pool=pool, **kwargs)
+            self.assertEqual(pooled, parsed)
+            atom = pooled["TEST"]["_atom"]
+            self.assertIsInstance(atom["type"], PooledColumn)
+            self.assertIsInstance(atom["comp"], PooledColumn)
+            self.assertIsInstance(atom["id"], list)
+            self.assertIsInstance(atom["x"], list)
+            self.assertEqual(atom["comp"][1], "GLY A")
+        # Both data blocks and both reads share the pool
+        self.assertEqual(len(pool), 5)
+
+        blocks = dict(MMCIF2Dict().iterparse(self.TEST_CIF, string_pool=True))
+        self.assertEqual(blocks, parsed)
+        self.assertIsInstance(blocks["TWO"]["_atom"]["type"], PooledColumn)
+
+    def test_read(self):
+        reader = CifFileReader()
+        expected = reader.read(self.TEST_CIF, output="cif_wrapper")
+        wrapper = reader.read(self.TEST_CIF, output="cif_wrapper", string_pool=True)
+        self.assertEqual(list(wrapper["TEST"]._atom), list(expected["TEST"]._atom))
+        self.assertEqual(len(wrapper["TEST"]._atom.search("type", "N")), ROWS // 3)
+
+        cif_file = reader.read(self.TEST_CIF, output="cif_file", string_pool=True)
+        self.assertIsInstance(cif_file, CifFile)
+        item = cif_file.getDataBlock("TEST").getCategory("atom").getItem("type")
+        self.assertIsInstance(item.value, list)
+        self.assertEqual(item.value[:3], ["C", "N", "O"])
+
+        wrapped = CIFWrapper(reader.read(self.TEST_CIF, string_pool=True))
+        self.assertEqual(wrapped._atom.comp[:2], ["ALA", "GLY A"])
+
+        # Pooled columns are set as they are, not as single values
+        table = wrapper["TEST"]._atom
+        table["type"] = table["type"][::-1]
+        self.assertIsInstance(table.type, PooledColumn)
+        self.assertEqual(table.type[:3], ["C", "O", "N"])
+        table.comp = StringPool().column(["X"] * ROWS)
+        self.assertEqual(list(table)[0]["comp"], "X")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import gzip
+import os
+import random
+import shutil
+import unittest
+
+from pdbecif import mmcif_index
+from pdbecif.mmcif_index import (
+    CategoryIndex,
+    GzipIndex,
+    IndexedGzipReader,
+    category_index,
+    gzip_index,
+    index_path,
+)
+from pdbecif.mmcif_io import CifFileReader
+from pdbecif.mmcif_tools import MMCIF2Dict, _CategorySpanScanner, _categorySpans
+
+from .common import gzip_compress, set_mtime
+
+
+@unittest.skipUnless(mmcif_index.available(), "zlib cannot be loaded with ctypes")
+class GzipIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_GZ = os.path.join(self.FILE_ROOT, "index_testcase.cif.gz")
+        rng = random.Random(0)
+        lines = []
+        for i in range(300):
+            lines.append("data_B%i\n_a.id %i\n" % (i, i))
+            lines.append("_a.text\n;\nfree text %i\n;\n" % i)
+            lines.append("loop_\n_b.x\n_b.y\n")
+            for j in range(rng.randint(1, 60)):
+                words = (rng.getrandbits(32), rng.getrandbits(32))
+                lines.append("%i '%x %x'\n" % ((j,) + words))
+            lines.append("#\n_c.name %s\n" % rng.choice(["x", "y", "z"]))
+        self.data = "".join(lines).encode("utf-8")
+        with gzip.open(self.TEST_GZ, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        for path in (self.TEST_GZ, index_path(self.TEST_GZ)):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def test_slices(self):
+        index = GzipIndex.build(self.TEST_GZ, span=4096)
+        self.assertGreater(len(index.points), 3)
+        self.assertEqual(index.length, len(self.data))
+        reader = IndexedGzipReader(self.TEST_GZ, index)
+        try:
+            rng = random.Random(1)
+            for _ in range(100):
+                start = rng.randrange(len(self.data))
+                end = start + rng.randrange(20000)
+                self.assertEqual(reader[start:end], self.data[start:end])
+            self.assertEqual(reader[len(self.data) - 5 :], self.data[-5:])
+        finally:
+            reader.close()
+
+        # The spans are found piece by piece as the file is inflated
+        self.assertEqual(index.blocks, _categorySpans(self.data))
+        rng = random.Random(2)
+        for size in (20, 500, 40000):
+            scanner = _CategorySpanScanner()
+            pos = 0
+            while pos < len(self.data):
+                step = rng.randint(1, size)
+                scanner.feed(self.data[pos : pos + step])
+                pos += step
+            self.assertEqual(scanner.finish(), index.blocks)
+
+    def test_sidecar(self):
+        index = gzip_index(self.TEST_GZ, span=4096)
+        sidecar = index_path(self.TEST_GZ)
+        self.assertTrue(os.path.exists(sidecar))
+        loaded = GzipIndex.load(sidecar)
+        self.assertEqual(loaded.points, index.points)
+        self.assertEqual(loaded.blocks, index.blocks)
+        self.assertTrue(gzip_index(self.TEST_GZ).is_current(self.TEST_GZ))
+
+        # A changed file invalidates the sidecar
+        with gzip.open(self.TEST_GZ, "wb") as f:
+            f.write(self.data[: len(self.data) // 2])
+        st = os.stat(sidecar)
+        set_mtime(self.TEST_GZ, st, 1)
+        index = gzip_index(self.TEST_GZ)
+        self.assertEqual(index.length, len(self.data) // 2)
+
+    def test_multiple_members(self):
+        half = len(self.data) // 2
+        with open(self.TEST_GZ, "wb") as f:
+            f.write(gzip_compress(self.data[:half]) + gzip_compress(self.data[half:]))
+        self.assertIsNone(GzipIndex.build(self.TEST_GZ))
+        expected = MMCIF2Dict().parse(self.TEST_GZ, onlyCategories=["_c"])
+        parsed = MMCIF2Dict().parse(self.TEST_GZ, onlyCategories=["_c"], use_index=True)
+        self.assertEqual(parsed, expected)
+
+    def test_parse_with_index(self):
+        for only in (["_b"], ["_a", "_c"], ["_none"]):
+            expected = MMCIF2Dict().parse(self.TEST_GZ, onlyCategories=only)
+            parsed = MMCIF2Dict().parse(
+                self.TEST_GZ, onlyCategories=only, use_index=True
+            )
+            self.assertEqual(parsed, expected)
+        self.assertTrue(os.path.exists(index_path(self.TEST_GZ)))
+
+        reader = CifFileReader()
+        cif_dictionary = reader.read(self.TEST_GZ, only=["_c"], use_index=True)
+        expected = MMCIF2Dict().parse(self.TEST_GZ, onlyCategories=["_c"])
+        self.assertEqual(cif_dictionary, expected)
+
+        with MMCIF2Dict().parse_lazy(self.TEST_GZ, use_index=True) as lazy:
+            self.assertIsInstance(lazy._data, IndexedGzipReader)
+            self.assertEqual(lazy, MMCIF2Dict().parse(self.TEST_GZ))
+
+
+class CategoryIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_DATA = os.path.join(self.FILE_ROOT, "test_data")
+        self.TEST_CIF = os.path.join(self.FILE_ROOT, "index_testcase.cif")
+        with open(self.TEST_CIF, "w") as f:
+            f.write("_pre.id 0\ndata_A\n_a.id 1\n_a.text\n;\ndata_B\n_b.x 1\n;\n")
+            f.write("loop_\n_b.x\n_b.y\n1 2\n3 4\n#\nsave_frame\n_s.id 1\nsave_\n")
+            f.write("_c.id 3\n_a.name x\ndata_C\nloop_\n_d.x\n1\n")
+
+    def tearDown(self):
+        for path in (self.TEST_CIF, index_path(self.TEST_CIF)):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def test_entries(self):
+        index = CategoryIndex.build(self.TEST_CIF)
+        self.assertEqual([heading for heading, _ in index.blocks], ["", "A", "C"])
+        entry = index.category("A", "_b")
+        self.assertTrue(entry.loop)
+        self.assertEqual(entry.items, ["x", "y"])
+        self.assertEqual(entry.rows, 2)
+        with open(self.TEST_CIF, "rb") as f:
+            data = f.read()
+        self.assertTrue(
+            data[entry.offset : entry.offset + entry.length].startswith(b"loop_")
+        )
+        # Items of a category found in two places
+        entry = index.category("A", "_a")
+        self.assertFalse(entry.loop)
+        self.assertEqual(entry.items, ["id", "text", "name"])
+        self.assertEqual(entry.rows, 1)
+        self.assertEqual(len(entry.spans), 2)
+        self.assertIsNone(index.category("A", "_s"))
+        self.assertIsNone(index.category("B", "_b"))
+
+        self.assertEqual(
+            index.read(data, "A", "_b"), {"x": ["1", "3"], "y": ["2", "4"]}
+        )
+        self.assertEqual(
+            index.read(data, "A", "_a"),
+            {"id": "1", "text": "data_B\n_b.x 1", "name": "x"},
+        )
+        self.assertRaises(KeyError, index.read, data, "A", "_s")
+
+    def test_sidecar(self):
+        index = category_index(self.TEST_CIF)
+        sidecar = index_path(self.TEST_CIF)
+        loaded = CategoryIndex.load(sidecar)
+        self.assertEqual(loaded.spans(), index.spans())
+        self.assertEqual(loaded.category("C", "_d").rows, 1)
+        # A sidecar of the other kind is not used
+        self.assertIsNone(GzipIndex.load(sidecar))
+
+        with open(self.TEST_CIF, "a") as f:
+            f.write("2\n")
+        st = os.stat(sidecar)
+        set_mtime(self.TEST_CIF, st, 1)
+        self.assertEqual(category_index(self.TEST_CIF).category("C", "_d").rows, 2)
+
+    def test_parse_with_index(self):
+        for name in ("usage-example.cif", "test_csd.cif"):
+            shutil.copyfile(os.path.join(self.TEST_DATA, name), self.TEST_CIF)
+            parsed = MMCIF2Dict().parse(self.TEST_CIF)
+            categories = set()
+            for block in parsed.values():
+                categories.update(block)
+            for only in [[category] for category in sorted(categories)]:
+                expected = MMCIF2Dict().parse(self.TEST_CIF, onlyCategories=only)
+                result = MMCIF2Dict().parse(
+                    self.TEST_CIF, onlyCategories=only, use_index=True
+                )
+                self.assertEqual(result, expected)
+            with MMCIF2Dict().parse_lazy(self.TEST_CIF, use_index=True) as lazy:
+                self.assertIsInstance(lazy.index, CategoryIndex)
+                self.assertEqual(lazy, parsed)
+
+
+if __name__ == "__main__":
+    unittest.main()
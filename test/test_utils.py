@@ -0,0 +1,187 @@
+import io
+import os
+import sys
+import unittest
+
+from pdbecif.utils import (
+    BackgroundReader,
+    DecompressedReader,
+    compression,
+    is_cif_path,
+    open_compressed,
+    open_source,
+    sniff_compression,
+)
+
+from .common import COMPRESSORS, Unseekable, gzip_compress
+
+PY2 = sys.version_info[0] == 2
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_FILE = os.path.join(self.FILE_ROOT, "utils_testcase.cif")
+        path = os.path.join(self.FILE_ROOT, "test_data", "usage-example.cif")
+        with open(path, "rb") as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        if os.path.exists(self.TEST_FILE):
+            os.unlink(self.TEST_FILE)
+
+    def _write(self, data):
+        with open(self.TEST_FILE, "wb") as f:
+            f.write(data)
+
+    def test_sniff_compression(self):
+        self.assertIsNone(sniff_compression(self.data[:6]))
+        self.assertIsNone(sniff_compression(b""))
+        for fmt, compress in COMPRESSORS.items():
+            self.assertEqual(sniff_compression(compress(self.data)[:6]), fmt)
+
+    def test_misnamed_files(self):
+        self._write(self.data)
+        self.assertIsNone(compression(self.TEST_FILE))
+        for fmt, compress in COMPRESSORS.items():
+            self._write(compress(self.data))
+            self.assertEqual(compression(self.TEST_FILE), fmt)
+            with open_compressed(self.TEST_FILE, "rb") as f:
+                self.assertEqual(f.read(), self.data, fmt)
+            with open_compressed(self.TEST_FILE, "rt") as f:
+                self.assertEqual(f.read(), self.data.decode("utf-8"), fmt)
+
+    def test_small_reads(self):
+        for fmt, compress in COMPRESSORS.items():
+            self._write(compress(self.data))
+            with open_compressed(self.TEST_FILE, "rb") as f:
+                chunks = iter(lambda: f.read(7), b"")
+                self.assertEqual(b"".join(chunks), self.data, fmt)
+
+    def test_concatenated_streams(self):
+        for fmt, compress in COMPRESSORS.items():
+            half = len(self.data) // 2
+            self._write(compress(self.data[:half]) + compress(self.data[half:]))
+            with open_compressed(self.TEST_FILE, "rb") as f:
+                self.assertEqual(f.read(), self.data, fmt)
+
+    def test_streams_ending_with_a_block(self):
+        block_size = DecompressedReader.BLOCK_SIZE
+        half = len(self.data) // 2
+        try:
+            for fmt, compress in COMPRESSORS.items():
+                first = compress(self.data[:half])
+                self._write(first + compress(self.data[half:]) + first)
+                DecompressedReader.BLOCK_SIZE = len(first)
+                with open_compressed(self.TEST_FILE, "rb") as f:
+                    self.assertEqual(f.read(), self.data + self.data[:half], fmt)
+        finally:
+            DecompressedReader.BLOCK_SIZE = block_size
+
+    @unittest.skipIf(PY2, "Python 2 decompressors do not tell where streams end")
+    def test_truncated_stream(self):
+        for fmt, compress in COMPRESSORS.items():
+            self._write(compress(self.data)[:-20])
+            with open_compressed(self.TEST_FILE, "rb") as f:
+                self.assertRaises(EOFError, f.read)
+
+    def test_compressed_sources(self):
+        for fmt, compress in COMPRESSORS.items():
+            compressed = compress(self.data)
+            for source in (
+                compressed,
+                io.BytesIO(compressed),
+                io.BufferedReader(io.BytesIO(compressed)),
+                Unseekable(compressed),
+            ):
+                with open_source(source, "rt") as f:
+                    self.assertEqual(f.read(), self.data.decode("utf-8"), fmt)
+                if not isinstance(source, bytes):
+                    self.assertFalse(source.closed, fmt)
+
+    def test_plain_streams(self):
+        for source in (io.BytesIO(self.data), Unseekable(self.data)):
+            with open_source(source, "rb") as f:
+                self.assertEqual(f.read(), self.data)
+            self.assertFalse(source.closed)
+        source = io.BytesIO(self.data)
+        with open_source(source, "rt") as f:
+            self.assertEqual(f.read(), self.data.decode("utf-8"))
+
+    def test_is_cif_path(self):
+        self._write(self.data)
+        self.assertTrue(is_cif_path(self.TEST_FILE))
+        self.assertTrue(is_cif_path(u"missing.cif"))
+        self.assertFalse(is_cif_path(u"data_x _a.b 1"))
+        self.assertFalse(is_cif_path(u"data_x"))
+        self.assertFalse(is_cif_path(u"_a.b 1"))
+        self.assertFalse(is_cif_path(self.data.decode("utf-8")))
+
+    def test_text_line_endings(self):
+        text = self.data.decode("utf-8")
+        if not PY2:
+            # Python 2 reads files as they are, as byte strings
+            self._write(self.data.replace(b"\n", b"\r\n"))
+            with open_source(self.TEST_FILE, "rt") as f:
+                self.assertEqual(f.read(), text)
+        crlf = text.replace(u"\n", u"\r\n")
+        cr = text.replace(u"\n", u"\r")
+        for source in (crlf, io.StringIO(crlf), io.StringIO(cr)):
+            with open_source(source, "rt") as f:
+                self.assertEqual(f.read(), text)
+
+
+class BackgroundReaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.FILE_ROOT = os.path.dirname(os.path.abspath(__file__))
+        self.TEST_FILE = os.path.join(self.FILE_ROOT, "utils_testcase.cif.gz")
+        path = os.path.join(self.FILE_ROOT, "test_data", "usage-example.dic")
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.text = self.data.decode("utf-8")
+        with open(self.TEST_FILE, "wb") as f:
+            f.write(gzip_compress(self.data))
+        # Small blocks put lines and reads across block boundaries
+        self.block_size = BackgroundReader.BLOCK_SIZE
+        BackgroundReader.BLOCK_SIZE = 37
+
+    def tearDown(self):
+        BackgroundReader.BLOCK_SIZE = self.block_size
+        os.unlink(self.TEST_FILE)
+
+    def test_readline(self):
+        with open_compressed(self.TEST_FILE, "rt", threaded=True) as f:
+            self.assertIsInstance(f, BackgroundReader)
+            self.assertEqual(list(iter(f.readline, "")), self.text.splitlines(True))
+
+    def test_mixed_reads(self):
+        parts = []
+        with open_compressed(self.TEST_FILE, "rt", threaded=True) as f:
+            while True:
+                part = f.read(100) + f.readline()
+                if not part:
+                    break
+                parts.append(part)
+            self.assertEqual(f.read(), "")
+        self.assertEqual("".join(parts), self.text)
+
+    def test_binary(self):
+        with open_compressed(self.TEST_FILE, "rb", threaded=True) as f:
+            self.assertEqual(f.read(), self.data)
+
+    @unittest.skipIf(PY2, "Python 2 decompressors do not tell where streams end")
+    def test_errors_reach_the_reader(self):
+        with open(self.TEST_FILE, "wb") as f:
+            f.write(gzip_compress(self.data)[:-20])
+        with open_compressed(self.TEST_FILE, "rt", threaded=True) as f:
+            self.assertRaises(EOFError, f.read)
+
+    def test_close_early(self):
+        f = open_compressed(self.TEST_FILE, "rt", threaded=True)
+        f.readline()
+        f.close()
+        self.assertFalse(f._prefetcher._thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()